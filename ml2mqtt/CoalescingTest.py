@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from ModelService import ModelService
+from ModelStore import ModelStore
+
+
+class FakeMqttClient:
+    def subscribe(self, topic, callback):
+        pass
+
+    def unsubscribe(self, topic, callback):
+        pass
+
+    def publish(self, topic, payload):
+        pass
+
+    def getQueueStats(self, topic):
+        return {}
+
+
+def message(rssi, label=None):
+    entities = [{"entity_id": "rssi", "state": str(rssi)}, {"entity_id": "media", "state": "tv"}]
+    if label is not None:
+        entities.append({"label": label})
+    return entities
+
+
+class TestModelServiceCoalescing(unittest.TestCase):
+    def setUp(self):
+        self.store = ModelStore(os.path.join(tempfile.mkdtemp(), "test.db"))
+        self.service = ModelService(FakeMqttClient(), self.store)
+        self.handled = []
+        self.service._handleEntities = self.handled.append
+        self.disposed = False
+
+    def tearDown(self):
+        if not self.disposed:
+            self.service.dispose()
+
+    def setWindow(self, milliseconds):
+        settings = self.service.getModelSettings()
+        settings["coalesce_window_ms"] = milliseconds
+        self.service.setModelSettings(settings)
+
+    def send(self, entities):
+        self.service.predictLabel(json.dumps(entities))
+
+    def waitForWindow(self):
+        deadline = time.monotonic() + 5
+        while self.service._coalesceTimer is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_burst_is_handled_once_with_the_newest_message(self):
+        self.setWindow(100)
+        for i in range(10):
+            self.send(message(-60 - i))
+        self.assertEqual(self.handled, [])
+        self.waitForWindow()
+        self.assertEqual(self.handled, [message(-69)])
+        self.assertEqual(self.service.getQueueStats()["coalesced"], 9)
+
+    def test_training_messages_are_never_coalesced(self):
+        self.setWindow(100)
+        self.send(message(-60))
+        self.send(message(-61, "lounge"))
+        self.send(message(-62, "lounge"))
+        # Both labelled messages are handled at once; the waiting prediction is superseded.
+        self.assertEqual(self.handled, [message(-61, "lounge"), message(-62, "lounge")])
+        self.waitForWindow()
+        self.assertEqual(len(self.handled), 2)
+        self.assertEqual(self.service.getQueueStats()["coalesced"], 1)
+
+    def test_no_window_handles_every_message(self):
+        self.setWindow(0)
+        for i in range(5):
+            self.send(message(-60 - i))
+        self.assertEqual(self.handled, [message(-60 - i) for i in range(5)])
+        self.assertIsNone(self.service._coalesceTimer)
+
+    def test_dispose_drops_the_waiting_message(self):
+        self.setWindow(50)
+        self.send(message(-60))
+        self.service.dispose()
+        self.disposed = True
+        time.sleep(0.15)
+        self.assertEqual(self.handled, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,7 +17,22 @@ class Config:
                         "server": options.get("mqtt-server", "core-mosquitto"),
                         "port": options.get("mqtt-port", 1883),
                         "username": options.get("mqtt-username", "mqtt"),
-                        "password": options.get("mqtt-password", "mqtt")
+                        "password": options.get("mqtt-password", "mqtt"),
+                        "dispatch_workers": options.get("mqtt-dispatch-workers", 4),
+                        "queue_size": options.get("mqtt-queue-size", 100),
+                        "overflow_policy": options.get("mqtt-overflow-policy", "drop_oldest")
+                    },
+                    "autotune": {
+                        "cores": options.get("autotune-cores", 0),
+                        "niceness": options.get("autotune-niceness", 10)
+                    },
+                    "inference": {
+                        "batch_latency_ms": options.get("inference-batch-latency-ms", 0)
+                    },
+                    "storage": {
+                        "group_commit_ms": options.get("group-commit-ms", 0),
+                        "string_table_limit": options.get("string-table-limit", 0),
+                        "raw_sample_limit": options.get("raw-sample-limit", 50000)
                     }
                 }
         elif settings_path.exists():
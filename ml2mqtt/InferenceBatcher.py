@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_MAX_BATCH = 256
+
+ResultCallback = Callable[[Optional[str], float], None]
+
+
+@dataclass
+class PendingPrediction:
+    classifier: Any
+    sensorValues: Dict[str, Any]
+    onResult: ResultCallback
+    submitted: float
+
+
+class InferenceBatcher:
+    """
+    Gathers single-row predictions from every model and runs them in batches.
+
+    The first row to arrive starts a window of at most `maxLatency` seconds. When the
+    window closes, or `maxBatch` rows are waiting, the rows are grouped by classifier and
+    each group is predicted with one predictLabels call. Results are handed back in
+    submission order, so each model still sees its own predictions in sequence.
+    """
+
+    def __init__(self, maxLatency: float, maxBatch: int = DEFAULT_MAX_BATCH):
+        self._maxLatency = max(0.0, float(maxLatency))
+        self._maxBatch = max(1, int(maxBatch))
+        self._logger = logging.getLogger(__name__)
+        self._condition = threading.Condition()
+        self._pending: List[PendingPrediction] = []
+        self._closed = False
+        self._batches = 0
+        self._rows = 0
+        self._worker = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, classifier: Any, sensorValues: Dict[str, Any], onResult: ResultCallback) -> None:
+        with self._condition:
+            if not self._closed:
+                self._pending.append(PendingPrediction(classifier, sensorValues, onResult, time.monotonic()))
+                if len(self._pending) == 1 or len(self._pending) >= self._maxBatch:
+                    self._condition.notify()
+                return
+
+        # Shutting down: nobody will drain the queue any more.
+        self._deliver([PendingPrediction(classifier, sensorValues, onResult, time.monotonic())])
+
+    def getStats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "max_latency_ms": self._maxLatency * 1000,
+                "batches": self._batches,
+                "rows": self._rows,
+                "mean_batch_size": self._rows / self._batches if self._batches else 0.0,
+                "pending": len(self._pending),
+            }
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stop batching; rows already waiting are still predicted."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._worker.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+
+                deadline = self._pending[0].submitted + self._maxLatency
+                while not self._closed and len(self._pending) < self._maxBatch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._pending[:self._maxBatch]
+                del self._pending[:self._maxBatch]
+                self._batches += 1
+                self._rows += len(batch)
+
+            self._deliver(batch)
+
+    def _deliver(self, batch: List[PendingPrediction]) -> None:
+        groups: Dict[int, List[int]] = {}
+        for i, pending in enumerate(batch):
+            groups.setdefault(id(pending.classifier), []).append(i)
+
+        results: List[Any] = [(None, 0)] * len(batch)
+        for indices in groups.values():
+            classifier = batch[indices[0]].classifier
+            try:
+                predictions = classifier.predictLabels([batch[i].sensorValues for i in indices])
+            except Exception:
+                self._logger.exception("Batch prediction failed")
+                continue
+            for i, prediction in zip(indices, predictions):
+                results[i] = prediction
+
+        for pending, (prediction, confidence) in zip(batch, results):
+            try:
+                pending.onResult(prediction, confidence)
+            except Exception:
+                self._logger.exception("Handling a batched prediction failed")
@@ -0,0 +1,84 @@
+import threading
+import unittest
+from InferenceBatcher import InferenceBatcher
+
+
+class EchoClassifier:
+    """Predicts each row's own "value", remembering the batches it was asked for."""
+
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.batches = []
+
+    def predictLabels(self, rows):
+        self.batches.append([row["value"] for row in rows])
+        if self.fail:
+            raise RuntimeError("broken model")
+        return [(f"{self.name}:{row['value']}", 0.5) for row in rows]
+
+
+class TestInferenceBatcher(unittest.TestCase):
+    def setUp(self):
+        self.results = []
+        self.done = threading.Event()
+        self.expected = 0
+
+    def collect(self, tag):
+        def onResult(prediction, confidence):
+            self.results.append((tag, prediction, confidence))
+            if len(self.results) == self.expected:
+                self.done.set()
+        return onResult
+
+    def test_results_keep_submission_order_across_models(self):
+        first, second = EchoClassifier("first"), EchoClassifier("second")
+        batcher = InferenceBatcher(maxLatency=0.2)
+        order = [(first if i % 3 else second, i) for i in range(12)]
+        self.expected = len(order)
+        for classifier, i in order:
+            batcher.submit(classifier, {"value": i}, self.collect(i))
+        self.assertTrue(self.done.wait(5))
+        batcher.close(5)
+
+        self.assertEqual([tag for tag, _, _ in self.results], list(range(12)))
+        self.assertEqual([prediction for _, prediction, _ in self.results],
+                         [f"{classifier.name}:{i}" for classifier, i in order])
+        # One predictLabels call per model, each with that model's rows in order.
+        self.assertEqual(first.batches, [[i for i in range(12) if i % 3]])
+        self.assertEqual(second.batches, [[0, 3, 6, 9]])
+        self.assertEqual(batcher.getStats()["batches"], 1)
+
+    def test_full_batches_are_sent_in_order(self):
+        classifier = EchoClassifier("model")
+        batcher = InferenceBatcher(maxLatency=60, maxBatch=4)
+        self.expected = 10
+        for i in range(10):
+            batcher.submit(classifier, {"value": i}, self.collect(i))
+        # Two full batches go straight away; close flushes the remainder without waiting the minute.
+        batcher.close(5)
+        self.assertTrue(self.done.is_set())
+        self.assertEqual([tag for tag, _, _ in self.results], list(range(10)))
+        self.assertEqual(classifier.batches, [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+
+    def test_failing_model_does_not_hold_up_others(self):
+        broken, working = EchoClassifier("broken", fail=True), EchoClassifier("working")
+        batcher = InferenceBatcher(maxLatency=0.1)
+        self.expected = 4
+        for i, classifier in enumerate([broken, working, broken, working]):
+            batcher.submit(classifier, {"value": i}, self.collect(i))
+        self.assertTrue(self.done.wait(5))
+        batcher.close(5)
+        self.assertEqual(self.results, [(0, None, 0), (1, "working:1", 0.5), (2, None, 0), (3, "working:3", 0.5)])
+
+    def test_submit_after_close_predicts_inline(self):
+        classifier = EchoClassifier("model")
+        batcher = InferenceBatcher(maxLatency=60)
+        batcher.close(5)
+        self.expected = 1
+        batcher.submit(classifier, {"value": 7}, self.collect(7))
+        self.assertEqual(self.results, [(7, "model:7", 0.5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
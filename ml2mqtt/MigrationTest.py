@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+import struct
+import tempfile
+import types
+import unittest
+import numpy as np
+from ModelStore import ModelStore
+
+# The migrations in the order ModelStore._createTables() runs them.
+MIGRATIONS = ["_migrateBaseSchema", "_migrateObservationKeys", "_migrateLabelCounts", "_migrateStringKeys",
+              "_migrateFittedModel", "_migrateSampleKeys", "_migrateRawSamples", "_migrateFittedModelSignature"]
+
+
+def makeBaselineDatabase(path):
+    """A model file as written before schema versions existed: user_version 0, no keys or indexes."""
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE SensorKeys (name TEXT PRIMARY KEY, type INTEGER)")
+    db.execute("CREATE TABLE Observations (time INTEGER, label TEXT, data BLOB)")
+    db.execute("CREATE TABLE StringTable (name TEXT)")
+    db.execute("CREATE TABLE Settings (name TEXT PRIMARY KEY, value)")
+    for table in ["Preprocessors", "Postprocessors"]:
+        db.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT, params TEXT, order_num INTEGER)")
+
+    db.executemany("INSERT INTO SensorKeys (name, type) VALUES (?, ?)",
+                   [("rssi", ModelStore.TYPE_FLOAT), ("media", ModelStore.TYPE_STRING)])
+    db.executemany("INSERT INTO StringTable (name) VALUES (?)", [("tv",), ("radio",)])
+    rows = []
+    for i in range(30):
+        label = ["kitchen", "lounge", "bedroom"][i % 3]
+        # The first rows were written before the media sensor existed, so they are shorter.
+        data = struct.pack("f", -50.0 - i) if i < 5 else struct.pack("ff", -50.0 - i, float(1 + i % 2))
+        rows.append((1000 + i, label, data))
+    db.executemany("INSERT INTO Observations (time, label, data) VALUES (?, ?, ?)", rows)
+    db.execute("INSERT INTO Settings (name, value) VALUES (?, ?)", ("name", "baseline"))
+    db.execute("INSERT INTO Settings (name, value) VALUES (?, ?)", ("model_settings", json.dumps({"model_type": "KNN"})))
+    db.execute("INSERT INTO Preprocessors (type, params, order_num) VALUES (?, ?, ?)",
+               ("type_caster", json.dumps({"sensor": "SELECT_ALL"}), 0))
+    db.commit()
+    db.close()
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "baseline.db")
+        makeBaselineDatabase(self.path)
+
+    def schema(self, store, kind):
+        return {row[0] for row in store._db.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+    def test_baseline_is_upgraded_in_place(self):
+        self.assertEqual(len(MIGRATIONS), ModelStore.SCHEMA_VERSION)
+        store = ModelStore(self.path)
+        self.assertEqual(store._db.execute("PRAGMA user_version").fetchone()[0], ModelStore.SCHEMA_VERSION)
+        self.assertLessEqual({"LabelCounts", "DataRevision", "FittedModel", "RawSamples"}, self.schema(store, "table"))
+        self.assertLessEqual({"ObservationsByTime", "ObservationsByLabel", "RawSamplesByTime"}, self.schema(store, "index"))
+        columns = {row[1] for row in store._db.execute("PRAGMA table_info(Observations)")}
+        self.assertEqual(columns, {"id", "time", "label", "data", "sample_key"})
+        self.assertIn("signature", {row[1] for row in store._db.execute("PRAGMA table_info(FittedModel)")})
+
+        # The data and settings come through unchanged.
+        self.assertEqual(store.getName(), "baseline")
+        self.assertEqual(store.getDict("model_settings"), {"model_type": "KNN"})
+        self.assertEqual([entry.type for entry in store.getPreprocessors()], ["type_caster"])
+        self.assertEqual(store.getLabelCounts(), {"kitchen": 10, "lounge": 10, "bedroom": 10})
+        matrix = store.getObservationMatrix()
+        np.testing.assert_array_equal(matrix.times, np.arange(1000, 1030))
+        frame = matrix.toDataFrame()
+        self.assertEqual(frame["rssi"].tolist(), [-50.0 - i for i in range(30)])
+        self.assertTrue(frame["media"].iloc[:5].isna().all())
+        self.assertEqual(frame["media"].tolist()[5:8], ["radio", "tv", "radio"])
+        self.assertEqual(store._db.execute("SELECT COUNT(*) FROM Observations WHERE sample_key IS NULL").fetchone()[0], 0)
+        store.close()
+
+    def test_upgraded_file_keeps_working(self):
+        store = ModelStore(self.path)
+        revision = store.getDataRevision()
+        store.addObservation("garage", store.sortEntityValues({"rssi": -30.0, "media": "vinyl"}, True), 2000)
+        self.assertGreater(store.getDataRevision(), revision)
+        # Existing string ids are kept and new ones follow them.
+        self.assertEqual(store._stringTable, {"tv": 1, "radio": 2, "vinyl": 3})
+        store.deleteObservationsByLabel("kitchen")
+        self.assertEqual(store.getLabelCounts(), {"lounge": 10, "bedroom": 10, "garage": 1})
+        store.close()
+
+        reopened = ModelStore(self.path)
+        self.assertEqual(reopened.getObservationCount(), 21)
+        self.assertEqual(reopened._db.execute("PRAGMA user_version").fetchone()[0], ModelStore.SCHEMA_VERSION)
+        reopened.close()
+
+    def test_each_version_upgrades_to_the_latest(self):
+        # A file an older release left at any version picks up the remaining migrations.
+        for version in range(1, ModelStore.SCHEMA_VERSION):
+            path = os.path.join(tempfile.mkdtemp(), "partial.db")
+            makeBaselineDatabase(path)
+            db = sqlite3.connect(path, isolation_level=None)
+            older = types.SimpleNamespace(_db=db)
+            for number, name in enumerate(MIGRATIONS[:version], start=1):
+                getattr(ModelStore, name)(older)
+                db.execute(f"PRAGMA user_version = {number}")
+            db.close()
+
+            store = ModelStore(path)
+            self.assertEqual(store._db.execute("PRAGMA user_version").fetchone()[0], ModelStore.SCHEMA_VERSION)
+            self.assertEqual(store.getLabelCounts(), {"kitchen": 10, "lounge": 10, "bedroom": 10}, version)
+            self.assertEqual(store.getObservationMatrix().toDataFrame()["media"].tolist()[5:7], ["radio", "tv"])
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
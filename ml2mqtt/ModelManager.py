@@ -1,35 +1,123 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, BinaryIO, Dict, List, Optional
 from MqttClient import MqttClient
 from ModelService import ModelService
 from ModelStore import ModelStore
+from TuningJobs import TuningJobManager
+from InferenceBatcher import InferenceBatcher
+from ModelTransfer import receiveModel
 
 
 class ModelManager:
-    def __init__(self, mqttClient: MqttClient, modelsDir: str):
+    def __init__(self, mqttClient: MqttClient, modelsDir: str, tuningJobs: Optional[TuningJobManager] = None,
+                 storeOptions: Optional[Dict[str, Any]] = None, loadWorkers: Optional[int] = None,
+                 inferenceBatcher: Optional[InferenceBatcher] = None):
         self._mqttClient = mqttClient
+        self._inferenceBatcher = inferenceBatcher
+        self._tuningJobs = tuningJobs or TuningJobManager()
+        # Extra ModelStore keyword arguments, e.g. groupCommitWindow and maxStrings.
+        self._storeOptions = storeOptions or {}
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
         self._models: Dict[str, ModelService] = {}
+        self._loading: Dict[str, Future] = {}
+        self._loadTimes: Dict[str, float] = {}
         self._modelsDir: Path = Path(modelsDir)
         self._modelsDir.mkdir(exist_ok=True)
 
-        for modelFile in self._modelsDir.glob("*.db"):
-            modelName = self.getModelName(modelFile)
-            service = ModelService(self._mqttClient, ModelStore(str(modelFile)))
+        # Models load concurrently in the background. Each one subscribes to MQTT as soon as
+        # it is ready; getModel() waits for a model that is still loading.
+        self._loadStarted = time.perf_counter()
+        self._loader = ThreadPoolExecutor(max_workers=loadWorkers or min(4, os.cpu_count() or 1),
+                                          thread_name_prefix="model-loader")
+        with self._lock:
+            for modelFile in self._modelsDir.glob("*.db"):
+                modelName = self.getModelName(modelFile)
+                self._loading[modelName] = self._loader.submit(self._loadModel, modelName, modelFile)
+
+    def _loadModel(self, modelName: str, modelFile: Path) -> None:
+        started = time.perf_counter()
+        try:
+            service = ModelService(self._mqttClient, ModelStore(str(modelFile), **self._storeOptions), self._tuningJobs,
+                                   self._inferenceBatcher)
             service.subscribeToMqttTopics()
+        except Exception:
+            self._logger.exception("Failed to load model %s", modelName)
+            with self._lock:
+                self._loading.pop(modelName, None)
+            raise
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
             self._models[modelName] = service
+            self._loading.pop(modelName, None)
+            self._loadTimes[modelName] = elapsed
+            remaining = len(self._loading)
+        self._logger.info("Loaded model %s in %.2fs", modelName, elapsed)
+        if remaining == 0:
+            self._logger.info("Loaded %d models in %.2fs", len(self._loadTimes), time.perf_counter() - self._loadStarted)
+
+    def getLoadTimes(self) -> Dict[str, float]:
+        """Seconds each model took to load at startup."""
+        with self._lock:
+            return dict(self._loadTimes)
 
     def addModel(self, model: str) -> ModelService:
         key = model.lower()
-        if key in self._models:
-            raise ValueError(f"Model '{model}' already exists.")
-
         dbPath = self._modelsDir / f"{key}.db"
-        service = ModelService(self._mqttClient, ModelStore(str(dbPath)))
-        self._models[key] = service
+        # Claim the name first, so a concurrent create or import of the same name fails
+        # instead of opening the same file.
+        with self._lock:
+            if self._exists(key):
+                raise ValueError(f"Model '{model}' already exists.")
+            future: Future = Future()
+            self._loading[key] = future
+
+        try:
+            service = ModelService(self._mqttClient, ModelStore(str(dbPath), **self._storeOptions), self._tuningJobs,
+                                   self._inferenceBatcher)
+        except Exception as e:
+            with self._lock:
+                self._loading.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._models[key] = service
+            self._loading.pop(key, None)
+        future.set_result(None)
         return service
 
+    def importModel(self, modelName: str, stream: BinaryIO) -> None:
+        """
+        Add a model from an uploaded database. The upload is written and validated beside the
+        other models, then the model loads in the background like it would at startup.
+        """
+        key = modelName.lower()
+        if self.modelExists(key):
+            raise ValueError(f"Model '{modelName}' already exists.")
+
+        path = receiveModel(stream, self._modelsDir, modelName)
+        dbPath = self._modelsDir / f"{key}.db"
+        with self._lock:
+            if self._exists(key):
+                os.unlink(path)
+                raise ValueError(f"Model '{modelName}' already exists.")
+            os.replace(path, dbPath)
+            self._loading[key] = self._loader.submit(self._loadModel, key, dbPath)
+
     def modelExists(self, modelName: str) -> bool:
-        return modelName.lower() in self._models
+        with self._lock:
+            return self._exists(modelName.lower())
+
+    def _exists(self, key: str) -> bool:
+        # A model that failed to load still has its file, and a new model must not reopen it.
+        return key in self._models or key in self._loading or (self._modelsDir / f"{key}.db").exists()
 
     def getModelName(self, modelPath: Path) -> str:
         return modelPath.stem.lower()
@@ -39,20 +127,60 @@ class ModelManager:
 
     def removeModel(self, modelName: str) -> None:
         key = modelName.lower()
-        if key in self._models:
-            self._models[key].dispose()
-            del self._models[key]
+        self._waitForModel(key)
+        with self._lock:
+            service = self._models.pop(key, None)
+        if service is not None:
+            service.dispose()
 
         dbPath = self._modelsDir / f"{key}.db"
         if dbPath.exists():
             dbPath.unlink()
 
+    def shutdown(self) -> None:
+        """Dispose every loaded model so cached state is flushed before exit."""
+        self._loader.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            services = list(self._models.values())
+            self._models.clear()
+        for service in services:
+            service.dispose()
+
     def getModel(self, modelName: str) -> ModelService:
         key = modelName.lower()
-        return self._models[key]
+        self._waitForModel(key)
+        with self._lock:
+            return self._models[key]
+
+    def findModel(self, modelName: str) -> Optional[ModelService]:
+        """The loaded model, or None if it does not exist or failed to load."""
+        key = modelName.lower()
+        self._waitForModel(key)
+        with self._lock:
+            return self._models.get(key)
+
+    def _waitForModel(self, key: str) -> None:
+        with self._lock:
+            future = self._loading.get(key)
+        if future is not None:
+            try:
+                future.result()
+            except CancelledError:
+                # Cancelled by shutdown() before it started; the model is not available.
+                with self._lock:
+                    if self._loading.get(key) is future:
+                        del self._loading[key]
+            except Exception:
+                pass  # Logged by _loadModel; the model is simply not available.
 
     def getModels(self) -> Dict[str, ModelService]:
-        return self._models
+        """A snapshot of every model, once those still loading have finished."""
+        with self._lock:
+            loading = list(self._loading)
+        for key in loading:
+            self._waitForModel(key)
+        with self._lock:
+            return dict(self._models)
 
     def __contains__(self, modelName: str) -> bool:
         return self.modelExists(modelName)
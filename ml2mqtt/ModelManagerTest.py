@@ -0,0 +1,98 @@
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future
+from pathlib import Path
+from ModelManager import ModelManager
+from ModelServiceTest import FakeMqttClient
+from ModelStore import ModelStore
+
+
+class TestModelManager(unittest.TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+
+    def makeModels(self, count):
+        for i in range(count):
+            store = ModelStore(str(self.directory / f"model{i}.db"))
+            store.setName(f"model{i}")
+            store.setMqttTopic(f"topic{i}")
+            store.close()
+
+    def test_models_load_concurrently_and_listing_waits_for_them(self):
+        self.makeModels(6)
+        errors = []
+        stop = threading.Event()
+
+        def browse():
+            # The home page iterating while loader threads insert must never fail.
+            try:
+                while not stop.is_set():
+                    for key, service in manager.getModels().items():
+                        service.getMqttTopic()
+            except Exception as e:
+                errors.append(e)
+
+        manager = ModelManager(FakeMqttClient(), str(self.directory), loadWorkers=3)
+        browser = threading.Thread(target=browse)
+        browser.start()
+        models = manager.getModels()
+        stop.set()
+        browser.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(models), [f"model{i}" for i in range(6)])
+        self.assertEqual(set(manager.getLoadTimes()), set(models))
+        self.assertIs(manager.findModel("Model0"), models["model0"])
+        manager.shutdown()
+        self.assertEqual(manager.getModels(), {})
+
+    def test_a_model_that_failed_to_load_keeps_its_name(self):
+        (self.directory / "broken.db").write_bytes(b"not a database" * 100)
+        manager = ModelManager(FakeMqttClient(), str(self.directory))
+        self.assertEqual(manager.getModels(), {})
+        self.assertTrue(manager.modelExists("broken"))
+        self.assertIsNone(manager.findModel("broken"))
+        with self.assertRaises(ValueError):
+            manager.addModel("broken")
+        self.assertEqual((self.directory / "broken.db").read_bytes(), b"not a database" * 100)
+        manager.shutdown()
+
+    def test_concurrent_adds_of_one_name(self):
+        manager = ModelManager(FakeMqttClient(), str(self.directory))
+        results = []
+        barrier = threading.Barrier(4)
+
+        def add():
+            barrier.wait()
+            try:
+                results.append(manager.addModel("Lounge"))
+            except ValueError as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=add) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sum(not isinstance(result, ValueError) for result in results), 1)
+        self.assertEqual(list(manager.getModels()), ["lounge"])
+        manager.removeModel("lounge")
+        self.assertFalse(manager.modelExists("lounge"))
+        manager.shutdown()
+
+
+    def test_load_cancelled_by_shutdown_is_unavailable(self):
+        manager = ModelManager(FakeMqttClient(), str(self.directory))
+        cancelled = Future()
+        cancelled.cancel()
+        with manager._lock:
+            manager._loading["lounge"] = cancelled
+        with self.assertRaises(KeyError):
+            manager.getModel("lounge")
+        self.assertEqual(manager.getModels(), {})
+        manager.removeModel("lounge")
+        self.assertFalse(manager.modelExists("lounge"))
+        manager.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,23 +1,54 @@
+import contextlib
+import copy
+import hashlib
 import logging
 import json
-from typing import Any, Dict, List, Optional, Union
+import threading
+import time
+from collections import deque
+import numpy
+import sklearn
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
 
 from ModelStore import ModelStore, ModelObservation, EntityKey
-from classifiers.RandomForest import RandomForest, RandomForestParams
-from classifiers.KNNClassifier import KNNClassifier, KNNParams
+from ObservationRetention import CompactionResult, RetentionPolicy
+from ObservationDeduplicator import ObservationDeduplicator
+from classifiers.RandomForest import RandomForest
+from classifiers.KNNClassifier import KNNClassifier
+from classifiers.OnlineNaiveBayes import OnlineNaiveBayes, DEFAULT_ONLINE_NAIVE_BAYES_PARAMS
+from classifiers.ParameterSearch import SEARCH_TWO_STAGE
+from classifiers.EvaluationReport import EVALUATION_HOLDOUT, DEFAULT_CV_FOLDS
 from MqttClient import MqttClient
 from postprocessors.PostprocessorFactory import PostprocessorFactory
 from postprocessors.base import BasePostprocessor
-from preprocessors.base import BasePreprocessor
+from preprocessors.base import BasePreprocessor, ObservationFrame
 from preprocessors.PreprocessorFactory import PreprocessorFactory
 from nodered.nodered_generator import NodeRedGenerator
-DISABLED_LABEL = "Disabled"
+from StateCache import StateCache
+from TrainingScheduler import TrainingScheduler, DEFAULT_RETRAIN_DEBOUNCE, DEFAULT_RETRAIN_MIN_INTERVAL
+from TuningJobs import TuningJob, TuningJobManager
+from InferenceBatcher import InferenceBatcher
+from ModelTransfer import exportModel
+from utils.helpers import DISABLED_LABEL, isTrainingMessage
+# Compaction waits for a quiet moment after new observations and runs at most this often.
+COMPACTION_DEBOUNCE = 5.0
+COMPACTION_MIN_INTERVAL = 60.0
+# Unlabelled messages stored as context ahead of each training observation, so windowed
+# preprocessors start a replayed observation with some history.
+RAW_CONTEXT_MESSAGES = 20
+# Tries at replaying while messages keep flowing; the last one holds them off throughout.
+REPLAY_ATTEMPTS = 3
 
 
 class ModelService:
-    def __init__(self, mqttClient: MqttClient, modelstore: ModelStore):
+    def __init__(self, mqttClient: MqttClient, modelstore: ModelStore, tuningJobs: Optional[TuningJobManager] = None,
+                 inferenceBatcher: Optional[InferenceBatcher] = None):
         self._mqttClient = mqttClient
+        self._inferenceBatcher = inferenceBatcher
+        self._tuningJobs = tuningJobs or TuningJobManager()
         self._modelstore: ModelStore = modelstore
+        self._state = StateCache(modelstore)
+        self._mqttTopic: str = modelstore.getMqttTopic() or ""
         self._model = None
         self._logger = logging.getLogger(__name__)
         self._postProcessorFactory = PostprocessorFactory()
@@ -29,6 +60,26 @@ class ModelService:
         self._modelType: str
         self._allParams: Dict[str, Dict[str, Any]] = {}
         self._recentMqtt = []
+        self._trainLock = threading.Lock()
+        # True from the moment a fit reads its observations until it replaces the served model.
+        self._fitInFlight = False
+        self._messageLock = threading.Lock()
+        self._coalesceLock = threading.Lock()
+        self._coalesceWindow = 0.0
+        self._coalesceTimer: Optional[threading.Timer] = None
+        self._pendingEntities: Optional[List[Dict[str, Any]]] = None
+        self._coalescedCount = 0
+        # Messages since the last stored training observation, written with the next one.
+        self._rawContext: Deque[Tuple[float, Dict[str, Any]]] = deque(maxlen=RAW_CONTEXT_MESSAGES)
+        self._trainingScheduler = TrainingScheduler(modelstore.modelPath, self._populateModel)
+        self._compactionScheduler = TrainingScheduler(modelstore.modelPath, self._compactObservations,
+                                                      COMPACTION_DEBOUNCE, COMPACTION_MIN_INTERVAL, activity="compaction")
+        self._lastCompaction: Optional[CompactionResult] = None
+        self._deduplicator: Optional[ObservationDeduplicator] = None
+        self._configureTrainingScheduler()
+        self._configureCoalescing()
+        self._configureRetention()
+        self._configureDeduplication()
         self._populateModel()
         self._loadPostprocessors()
         self._loadPreprocessors()
@@ -36,6 +87,14 @@ class ModelService:
     def dispose(self) -> None:
         topic = self.getMqttTopic()
         self._mqttClient.unsubscribe(f"{topic}/set", self.predictLabel)
+        with self._coalesceLock:
+            if self._coalesceTimer is not None:
+                self._coalesceTimer.cancel()
+            self._pendingEntities = None
+        self._tuningJobs.cancelAll(self.getName())
+        self._compactionScheduler.close()
+        self._trainingScheduler.close()
+        self._state.close()
         self._modelstore.close()
 
     def subscribeToMqttTopics(self) -> None:
@@ -44,21 +103,112 @@ class ModelService:
         self._mqttClient.subscribe(f"{topic}/set", self.predictLabel)
 
     def _populateModel(self) -> None:
-        settings = self._modelstore.getDict('model_settings') or {}
-        self._modelType = settings.get("model_type", "RandomForest")
-        self._allParams = settings.get("model_parameters", {})
-
-        paramsForThisModel = self._allParams.get(self._modelType, {})
+        # Fits are serialised so a retrain that started later, and therefore saw newer
+        # observations and settings, always replaces the served model last.
+        with self._trainLock:
+            settings = copy.deepcopy(self._state.getDict('model_settings'))
+            self._modelType = settings.get("model_type", "RandomForest")
+            self._allParams = settings.get("model_parameters", {})
+
+            paramsForThisModel = self._allParams.get(self._modelType, {})
+            compactForest = bool(settings.get("compact_forest", False))
+            evaluation = {
+                "mode": settings.get("evaluation_mode", EVALUATION_HOLDOUT),
+                "cv_folds": int(settings.get("cv_folds", DEFAULT_CV_FOLDS)),
+            }
 
-        self._logger.info(f"Loading with settings {settings}")
+            self._logger.info(f"Loading with settings {settings}")
+
+            if self._modelType == "KNN":
+                model = KNNClassifier(params=paramsForThisModel, evaluationMode=evaluation["mode"],
+                                      cvFolds=evaluation["cv_folds"])
+            elif self._modelType == "OnlineNaiveBayes":
+                model = OnlineNaiveBayes(params=paramsForThisModel)
+            else:
+                model = RandomForest(params=paramsForThisModel, compact=compactForest,
+                                     evaluationMode=evaluation["mode"], cvFolds=evaluation["cv_folds"])
+
+            # Read the revision and the data together so the hash describes exactly this fit.
+            with self._modelstore.lock:
+                fitHash = self._fitHash(self._modelType, paramsForThisModel, compactForest, evaluation,
+                                        self._modelstore.getDataRevision())
+                artifact = self._modelstore.loadFittedModel(fitHash)
+                observations = None if artifact is not None else self._modelstore.getObservationMatrix()
+                self._fitInFlight = True
 
-        if self._modelType == "KNN":
-            self._model = KNNClassifier(params=paramsForThisModel)
-        else:
-            self._model = RandomForest(params=paramsForThisModel)
+            try:
+                if artifact is not None:
+                    model.loadArtifact(artifact)
+                    self._logger.info(f"Reusing the stored fit for model {self._modelstore.modelPath}")
+                else:
+                    model.populateDataframe(observations)
+                    artifact = model.getArtifact()
+                    if artifact is not None:
+                        try:
+                            self._modelstore.saveFittedModel(fitHash, artifact)
+                        except Exception:
+                            self._logger.exception("Failed to store the fitted model")
+                # Predictions keep using the previous classifier until this point.
+                self._model = model
+            finally:
+                self._fitInFlight = False
+
+    @staticmethod
+    def _fitHash(modelType: str, params: Dict[str, Any], compactForest: bool, evaluation: Dict[str, Any],
+                 dataRevision: int) -> str:
+        key = {
+            "model_type": modelType,
+            "params": params,
+            "compact_forest": compactForest,
+            "evaluation": evaluation,
+            "data_revision": dataRevision,
+            # Pickled estimators are only safe to load into the library versions that wrote them.
+            "sklearn": sklearn.__version__,
+            "numpy": numpy.__version__,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _configureTrainingScheduler(self) -> None:
+        settings = self._state.getDict('model_settings')
+        self._trainingScheduler.configure(
+            settings.get("retrain_debounce", DEFAULT_RETRAIN_DEBOUNCE),
+            settings.get("retrain_min_interval", DEFAULT_RETRAIN_MIN_INTERVAL),
+        )
+
+    def _configureCoalescing(self) -> None:
+        settings = self._state.getDict('model_settings')
+        self._coalesceWindow = max(0.0, float(settings.get("coalesce_window_ms", 0) or 0) / 1000)
+
+    def _configureRetention(self) -> None:
+        self._retentionPolicy = RetentionPolicy.fromSettings(self._state.getDict('model_settings'))
+        if self._retentionPolicy.isEnabled():
+            # Apply a new or tightened policy to the rows already stored.
+            self._compactionScheduler.requestRetrain()
+
+    def _configureDeduplication(self) -> None:
+        deduplicator = ObservationDeduplicator.fromSettings(self._state.getDict('model_settings'))
+        if deduplicator is not None and self._deduplicator is not None:
+            # Keep the counters across settings changes.
+            deduplicator.checked = self._deduplicator.checked
+            deduplicator.suppressed = self._deduplicator.suppressed
+        self._deduplicator = deduplicator
+
+    def getDedupeStats(self) -> Optional[Dict[str, int]]:
+        deduplicator = self._deduplicator
+        return deduplicator.getStats() if deduplicator is not None else None
+
+    def _compactObservations(self) -> None:
+        result = self._modelstore.compact(self._retentionPolicy)
+        self._lastCompaction = result
+        if not result.removed:
+            return
+        self._clearDeduplicator()
+        removedTimes = result.removedTimes
+        if not self._forgetObservations(lambda times, labels: numpy.isin(times, removedTimes)):
+            self._trainingScheduler.requestRetrain()
 
-        observations = self._modelstore.getObservations()
-        self._model.populateDataframe(observations)
+    def getLastCompaction(self) -> Optional[Dict[str, int]]:
+        return self._lastCompaction.to_dict() if self._lastCompaction is not None else None
 
     def _loadPostprocessors(self) -> None:
         """Load postprocessors from model settings."""
@@ -96,6 +246,11 @@ class ModelService:
     def getAccuracy(self) -> Optional[float]:
         return self._model.getAccuracy()
 
+    def getEvaluationReport(self) -> Optional[Dict[str, Any]]:
+        getReport = getattr(self._model, "getEvaluationReport", None)
+        report = getReport() if getReport else None
+        return report.to_dict() if report else None
+
     def predictLabel(self, msg: Any) -> None:
         self._recentMqtt.append(msg)
         if len(self._recentMqtt) > 10:
@@ -117,6 +272,44 @@ class ModelService:
             self._logger.warning("Invalid JSON: %s", messageStr)
             return
 
+        if self._coalesceWindow <= 0 or self._isTrainingMessage(entities):
+            with self._coalesceLock:
+                # This message is newer than anything still waiting in the window.
+                if self._pendingEntities is not None:
+                    self._coalescedCount += 1
+                    self._pendingEntities = None
+            self._handleEntities(entities)
+            return
+
+        with self._coalesceLock:
+            if self._pendingEntities is not None:
+                self._coalescedCount += 1
+            self._pendingEntities = entities
+            if self._coalesceTimer is None:
+                self._coalesceTimer = threading.Timer(self._coalesceWindow, self._flushCoalesced)
+                self._coalesceTimer.daemon = True
+                self._coalesceTimer.start()
+
+    @staticmethod
+    def _isTrainingMessage(entities: List[Dict[str, Any]]) -> bool:
+        return isTrainingMessage(entities)
+
+    def _flushCoalesced(self) -> None:
+        with self._coalesceLock:
+            entities = self._pendingEntities
+            self._pendingEntities = None
+            self._coalesceTimer = None
+        if entities is not None:
+            self._handleEntities(entities)
+
+    def _handleEntities(self, entities: List[Dict[str, Any]]) -> None:
+        # The coalescing timer and the MQTT dispatcher both land here; one message at a time.
+        with self._messageLock:
+            self._processEntities(entities)
+
+    def _processEntities(self, entities: List[Dict[str, Any]]) -> None:
+        # One arrival time for the message, so time-based preprocessors see the same time on replay.
+        messageTime = time.time()
         label: str = DISABLED_LABEL
         entityMap: Dict[str, Any] = {}
 
@@ -126,48 +319,60 @@ class ModelService:
             elif "entity_id" in entity and "state" in entity:
                 entityMap[entity["entity_id"]] = entity["state"]
 
-        previousEntityMap = self._modelstore.getDict("mqtt_observations")
-        if "history" in previousEntityMap:
-            previousEntityMap['history'].append(entityMap)
-            if len(previousEntityMap['history']) > 10:
-                previousEntityMap['history'].pop(0)
-        else:
-            previousEntityMap['history'] = [entityMap]    
-        self._modelstore.saveDict("mqtt_observations", previousEntityMap)
-
-        # Apply Preprocessors
-        processor_storage = self._modelstore.getDict("processor_storage")
-        for preprocessor in self._preprocessors:
-            if not preprocessor.dbId in processor_storage:
-                processor_storage[preprocessor.dbId] = {}
-            entityMap = preprocessor.process(entityMap, processor_storage[preprocessor.dbId])
-            if not entityMap:
-                self._logger.debug("No entity values to process.")
-                return
-        self._modelstore.saveDict("processor_storage", processor_storage)
+        learningType = self.getLearningType()
+        # While learning, keep the message as it arrived so a changed pipeline can replay it.
+        rawEntityMap = dict(entityMap) if learningType != "DISABLED" else None
+
+        with self._state.lock:
+            previousEntityMap = self._state.getDict("mqtt_observations")
+            if "history" in previousEntityMap:
+                previousEntityMap['history'].append(entityMap)
+                if len(previousEntityMap['history']) > 10:
+                    previousEntityMap['history'].pop(0)
+            else:
+                previousEntityMap['history'] = [entityMap]
+            self._state.markDirty("mqtt_observations")
+
+            # Apply Preprocessors. State keys are strings so the in-memory dict
+            # matches what a JSON round-trip through the ModelStore gives back.
+            processor_storage = self._state.getDict("processor_storage")
+            for preprocessor in self._preprocessors:
+                stateKey = str(preprocessor.dbId)
+                if not stateKey in processor_storage:
+                    processor_storage[stateKey] = {}
+                entityMap = preprocessor.processAt(entityMap, processor_storage[stateKey], messageTime)
+                if not entityMap:
+                    self._logger.debug("No entity values to process.")
+                    break
+            self._state.markDirty("processor_storage")
 
         if not entityMap:
-            self._logger.debug("No entity values to process.")
-            return        
+            self._keepRawContext(rawEntityMap, messageTime)
+            return
 
         entityValues = {k: v for k, v in entityMap.items() if v is not None}
 
+        trained = False
         if label != DISABLED_LABEL:
-            learningType = self.getLearningType()
             if learningType == "LAZY":
                 prediction, confidence = self._model.predictLabel(entityValues)
                 if prediction != label or confidence < 0.8:
-                    entityValues = self._modelstore.sortEntityValues(entityMap, True)
-                    self._logger.info("Adding training observation for label: %s", label)
-                    self._modelstore.addObservation(label, entityValues)
-                    self._populateModel()
+                    entityValues, trained = self._addTrainingObservation(label, entityMap, rawEntityMap, messageTime)
             elif learningType == "EAGER":
-                entityValues = self._modelstore.sortEntityValues(entityMap, True)
-                self._logger.info("Adding training observation for label: %s", label)
-                self._modelstore.addObservation(label, entityValues)
-                self._populateModel()
+                entityValues, trained = self._addTrainingObservation(label, entityMap, rawEntityMap, messageTime)
+        if not trained:
+            self._keepRawContext(rawEntityMap, messageTime)
+
+        if self._inferenceBatcher is not None:
+            # Postprocessors and publish run on the batcher thread, in submission order.
+            self._inferenceBatcher.submit(self._model, entityValues,
+                                          lambda prediction, confidence: self._publishPrediction(entityValues, prediction, confidence))
+            return
 
         prediction, confidence = self._model.predictLabel(entityValues)
+        self._publishPrediction(entityValues, prediction, confidence)
+
+    def _publishPrediction(self, entityValues: Dict[str, Any], prediction: Optional[str], confidence: float) -> None:
         confidence = round(confidence, 4)
         # Apply postprocessors
         observation = entityValues
@@ -180,11 +385,51 @@ class ModelService:
         self._mqttClient.publish(f"{topic}/state", json.dumps({"state": prediction, "confidence": confidence}))
         self._logger.info(f"Predicted label: {prediction} with confidence {confidence}")
 
+    def _keepRawContext(self, rawEntityMap: Optional[Dict[str, Any]], sampleTime: float) -> None:
+        # Held in memory only; most messages never become training data.
+        if rawEntityMap is not None:
+            self._rawContext.append((sampleTime, rawEntityMap))
+
+    def _addTrainingObservation(self, label: str, entityMap: Dict[str, Any],
+                                rawEntityMap: Optional[Dict[str, Any]] = None,
+                                observationTime: Optional[float] = None) -> Tuple[Dict[str, Any], bool]:
+        """Store a training observation. Returns the values to predict on and whether it was stored."""
+        deduplicator = self._deduplicator
+        if deduplicator is not None and deduplicator.isDuplicate(label, entityMap):
+            self._logger.debug("Skipping duplicate training observation for label: %s", label)
+            return {k: v for k, v in entityMap.items() if v is not None}, False
+
+        # New sensor keys, new strings and the observation itself are one commit.
+        if observationTime is None:
+            observationTime = time.time()
+        with self._modelstore.transaction():
+            entityValues = self._modelstore.sortEntityValues(entityMap, True)
+            self._logger.info("Adding training observation for label: %s", label)
+            self._modelstore.addObservation(label, entityValues, observationTime)
+            if rawEntityMap is not None:
+                samples = [(sampleTime, None, sample) for sampleTime, sample in self._rawContext]
+                samples.append((observationTime, label, rawEntityMap))
+                self._modelstore.addRawSamples(samples)
+        self._rawContext.clear()
+        # Online models absorb the observation directly instead of refitting. A fit that read
+        # its observations before this one was stored replaces the model learnOne() updated,
+        # so that fit is followed by another. The flag is read before the model: if learnOne()
+        # reaches the outgoing model, the fit was still in flight when the flag was read.
+        fitInFlight = self._fitInFlight
+        model = self._model
+        learned = getattr(model, "learnsOnline", False) and model.learnOne(label, entityValues, observationTime)
+        if fitInFlight or not learned:
+            self._trainingScheduler.requestRetrain()
+        if self._retentionPolicy.isEnabled():
+            self._compactionScheduler.requestRetrain()
+        return entityValues, True
+
     def getMqttTopic(self) -> str:
-        return self._modelstore.getMqttTopic() or ""
+        return self._mqttTopic
 
     def setMqttTopic(self, mqttTopic: str) -> None:
         self._modelstore.setMqttTopic(mqttTopic)
+        self._mqttTopic = mqttTopic
 
     def getName(self) -> str:
         return self._modelstore.getName() or ""
@@ -192,17 +437,30 @@ class ModelService:
     def setName(self, modelName: str) -> None:
         self._modelstore.setName(modelName)
 
-    def getObservations(self) -> List[ModelObservation]:
-        return self._modelstore.getObservations()
+    def getObservations(self, limit: Optional[int] = None, offset: int = 0) -> List[ModelObservation]:
+        return self._modelstore.getObservations(limit, offset)
+
+    def getObservationCount(self) -> int:
+        return self._modelstore.getObservationCount()
 
     def getModelSize(self) -> int:
         return self._modelstore.getModelSize()
 
+    def exportDatabase(self, compress: bool = True) -> Iterator[bytes]:
+        """Stream a consistent snapshot of the model database, gzip-compressed by default."""
+        return exportModel(self._modelstore, compress)
+
+    def getQueueStats(self) -> Dict[str, int]:
+        stats = self._mqttClient.getQueueStats(f"{self.getMqttTopic()}/set")
+        stats["coalesced"] = self._coalescedCount
+        return stats
+
     def getLabels(self) -> List[str]:
         return self._modelstore.getLabels() + self.getModelConfig("labels", [])
 
     def deleteEntity(self, entityName: str) -> None:
         self._modelstore.deleteEntity(entityName)
+        self._clearDeduplicator()
         # Rebuild the model after entity deletion
         self._populateModel()
 
@@ -216,41 +474,85 @@ class ModelService:
                     "recall": 0,
                     "f1": 0,
                 }        
+        labelCounts = self._modelstore.getLabelCounts()
+        for label, stats in labelStats.items():
+            stats["observations"] = labelCounts.get(label, 0)
         return labelStats
 
     def deleteObservationsByLabel(self, label: str) -> None:
         """Delete all observations with the given label."""
         self._modelstore.deleteObservationsByLabel(label)
+        self._clearDeduplicator()
 
         presavedLabels = self.getModelConfig("labels", [])
         presavedLabels.remove(label)
         self.setModelConfig("labels", presavedLabels)
 
         # Rebuild the model after deletion
-        self._populateModel()
+        if not self._forgetObservations(lambda times, labels: labels == label):
+            self._populateModel()
 
     def deleteObservation(self, time: int) -> None:
         """Delete an observation by its timestamp."""
         self._modelstore.deleteObservation(time)
+        self._clearDeduplicator()
         # Rebuild the model after deletion
-        self._populateModel()
+        if not self._forgetObservations(lambda times, labels: times == time):
+            self._populateModel()
 
     def deleteObservationsSince(self, timestamp: int) -> None:
             """Delete an observation by its timestamp."""
             self._modelstore.deleteObservationsSince(timestamp)
+            self._clearDeduplicator()
             # Rebuild the model after deletion
-            self._populateModel()
+            if not self._forgetObservations(lambda times, labels: times >= timestamp):
+                self._populateModel()
+
+    def _clearDeduplicator(self) -> None:
+        # Deleted observations may be sent again and must not be skipped as duplicates.
+        if self._deduplicator is not None:
+            self._deduplicator.clear()
 
-    def optimizeParameters(self) -> None:
-        best_params = self._model.optimizeParameters(self._modelstore.getObservations())
+    def _forgetObservations(self, predicate) -> bool:
+        """Let a model that supports it drop deleted rows in place. False means it needs a full fit."""
+        # As in _addTrainingObservation(), a fit in flight may still serve the deleted rows.
+        fitInFlight = self._fitInFlight
+        forget = getattr(self._model, "forgetObservations", None)
+        return forget is not None and forget(predicate) and not fitInFlight
 
+    def optimizeParameters(self) -> TuningJob:
+        """Start a background auto-tune job. The best parameters are applied once it completes."""
+        modelSettings = self.getModelSettings()
+        modelType = modelSettings.get("model_type", "RandomForest")
+        params = modelSettings.get("model_parameters", {}).get(modelType, {})
+        return self._tuningJobs.start(
+            self.getName(),
+            modelType,
+            params,
+            self._modelstore.getObservationMatrix(),
+            lambda bestParams: self._applyTunedParameters(modelType, bestParams),
+            modelSettings.get("search_strategy", SEARCH_TWO_STAGE),
+        )
+
+    def _applyTunedParameters(self, modelType: str, bestParams: Dict[str, Any]) -> None:
         modelSettings = self.getModelSettings()
         modelSettings["model_parameters"] = modelSettings.get("model_parameters", {})
-        modelSettings["model_parameters"][self._modelType] = best_params
-        self._modelstore.saveDict("model_settings", modelSettings)
+        modelSettings["model_parameters"][modelType] = bestParams
+        self._state.setDict("model_settings", modelSettings)
+        self._populateModel()
+
+    def getTuningJob(self, jobId: str) -> Optional[TuningJob]:
+        job = self._tuningJobs.getJob(jobId)
+        return job if job is not None and job.modelName == self.getName() else None
+
+    def getRunningTuningJob(self) -> Optional[TuningJob]:
+        return self._tuningJobs.getRunningJob(self.getName())
+
+    def cancelTuningJob(self, jobId: str) -> bool:
+        return self.getTuningJob(jobId) is not None and self._tuningJobs.cancel(jobId)
 
     def getModelSettings(self) -> Dict[str, Any]:
-        settings = self._modelstore.getDict('model_settings') or {}
+        settings = copy.deepcopy(self._state.getDict('model_settings'))
         if not settings:
             settings = {
                 "model_type": "RandomForest",
@@ -271,7 +573,8 @@ class ModelService:
                         "leaf_size": 30,
                         "metric": "minkowski",
                         "p": 2
-                    }
+                    },
+                    "OnlineNaiveBayes": dict(DEFAULT_ONLINE_NAIVE_BAYES_PARAMS)
                 }
             }
         return settings
@@ -280,7 +583,11 @@ class ModelService:
         self._logger.info(f"Setting model settings: {settings}");
         self._modelType = settings.get("model_type", "RandomForest")
         self._allParams = settings.get("model_parameters", {})
-        self._modelstore.saveDict("model_settings", settings)
+        self._state.setDict("model_settings", settings)
+        self._configureTrainingScheduler()
+        self._configureCoalescing()
+        self._configureRetention()
+        self._configureDeduplication()
         self._populateModel()
 
     def getPostprocessors(self) -> List[BasePostprocessor]:
@@ -313,13 +620,62 @@ class ModelService:
             # Then create the postprocessor instance
             preprocessor = self._preprocessorFactory.create(type, dbId, params)
             self._preprocessors.append(preprocessor)
-            self.deleteObservationsSince(0)
+            self.replayPreprocessors()
         except Exception as e:
             # If postprocessor creation fails, delete from database.
             if 'dbId' in locals():
                 self._modelstore.deletePreprocessor(dbId)
             raise e
 
+    def replayPreprocessors(self) -> None:
+        """
+        Re-derive the training observations after a preprocessor change by running the current
+        pipeline over the recorded raw messages in one batch. Observations with no raw message,
+        such as those recorded before raw messages were kept or pruned past the limit, are
+        dropped as before. The refit is left to the training scheduler.
+        """
+        for attempt in range(1, REPLAY_ATTEMPTS + 1):
+            if attempt < REPLAY_ATTEMPTS:
+                if self._replayRawSamples(messagesHeld=False):
+                    break
+                self._logger.info("Training data changed during replay, replaying again")
+            else:
+                # Still changing; hold messages and edits off for the whole replay this time.
+                with self._messageLock, self._modelstore.lock:
+                    self._replayRawSamples(messagesHeld=True)
+        self._clearDeduplicator()
+        self._trainingScheduler.requestRetrain()
+
+    def _replayRawSamples(self, messagesHeld: bool) -> bool:
+        """
+        One replay. Messages are only held off while the raw messages are read and while the
+        observations are replaced, and the result is discarded, returning False, if the
+        training data changed in between.
+        """
+        messageLock = contextlib.nullcontext() if messagesHeld else self._messageLock
+        with messageLock, self._modelstore.lock:
+            revision = self._modelstore.getDataRevision()
+            samples = self._modelstore.getRawSamples()
+
+        frame = ObservationFrame.fromObservations([sample for _, _, sample in samples],
+                                                  [sampleTime for sampleTime, _, _ in samples])
+        for preprocessor in list(self._preprocessors):
+            frame = preprocessor.process_frame(frame)
+
+        # Deleting or compacting an observation clears its raw message's label, so those stay gone.
+        observations = [
+            ModelObservation(sampleTime, label, row)
+            for (sampleTime, label, _), row in zip(samples, frame.toObservations())
+            if label is not None
+        ]
+        with messageLock, self._modelstore.transaction():
+            if self._modelstore.getDataRevision() != revision:
+                return False
+            previous = self._modelstore.getObservationCount()
+            written = self._modelstore.replaceObservations(observations)
+        self._logger.info(f"Replayed {len(samples)} raw messages into {written} observations, previously {previous}")
+        return True
+
     def removePostprocessor(self, index: int) -> None:
         """Remove a postprocessor by index."""
         if 0 <= index < len(self._postprocessors):
@@ -333,7 +689,7 @@ class ModelService:
             deletedProcessor = self._preprocessors.pop(index)
             
             self._modelstore.deletePreprocessor(deletedProcessor.dbId)
-            self.deleteObservationsSince(0)
+            self.replayPreprocessors()
 
     def reorderPreprocessors(self, from_index: int, to_index: int) -> None:
         """Reorder preprocessors."""
@@ -343,7 +699,7 @@ class ModelService:
             self._preprocessors.insert(to_index, preprocessor)
             self._logger.info("Reordering preprocessors: %s", list(map(lambda p: p, self._preprocessors)))
             self._modelstore.reorderPreprocessors(map(lambda p: p.dbId, self._preprocessors))
-            self.deleteObservationsSince(0)
+            self.replayPreprocessors()
 
     def reorderPostprocessors(self, from_index: int, to_index: int) -> None:
         """Reorder postprocessors."""
@@ -355,33 +711,34 @@ class ModelService:
             self._modelstore.reorderPostprocessors(map(lambda p: p.dbId, self._postprocessors))
 
     def getLearningType(self):
-        settings = self.getModelSettings() or {}
+        settings = self._state.getDict('model_settings')
         learningType = settings.get("learning_type", "DISABLED")
-        self._logger.info(f"Getting learning type: {learningType}")
+        self._logger.debug(f"Getting learning type: {learningType}")
         return learningType
     
     def setLearningType(self, learningType: str) -> None:
         settings = self.getModelSettings() or {}
         settings["learning_type"] = learningType
         self._logger.info(f"Setting learning type: {learningType}")
-        self._modelstore.saveDict("model_settings", settings)
+        self._state.setDict("model_settings", settings)
 
     def getMostRecentMqttObservations(self):
-        previousObservations = self._modelstore.getDict("mqtt_observations")
-        if 'history' in previousObservations:
-            return previousObservations['history']
-        else:
-            return []
+        with self._state.lock:
+            previousObservations = self._state.getDict("mqtt_observations")
+            if 'history' in previousObservations:
+                return copy.deepcopy(previousObservations['history'])
+            else:
+                return []
     
     def setModelConfig(self, key, value):
-        current = self._modelstore.getDict("config")
+        current = copy.deepcopy(self._state.getDict("config"))
         current[key] = value
-        self._modelstore.saveDict("config", current)
+        self._state.setDict("config", current)
     
     def getModelConfig(self, key, default):
-        config = self._modelstore.getDict("config")
+        config = self._state.getDict("config")
         if key in config:
-            return config[key]
+            return copy.deepcopy(config[key])
         else:
             return default
 
@@ -0,0 +1,175 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from ModelService import ModelService, RAW_CONTEXT_MESSAGES
+from ModelStore import ModelStore
+from ObservationRetention import RetentionPolicy
+from classifiers.OnlineNaiveBayes import OnlineNaiveBayes
+from preprocessors.type_caster import TypeCaster
+
+
+class FakeMqttClient:
+    def __init__(self):
+        self.published = []
+
+    def subscribe(self, topic, callback):
+        pass
+
+    def unsubscribe(self, topic, callback):
+        pass
+
+    def publish(self, topic, payload):
+        self.published.append((topic, payload))
+
+    def getQueueStats(self, topic):
+        return {}
+
+
+def message(rssi, label=None):
+    entities = [{"entity_id": "rssi", "state": str(rssi)}, {"entity_id": "media", "state": "tv"}]
+    if label is not None:
+        entities.append({"label": label})
+    return entities
+
+
+class TestModelServiceReplay(unittest.TestCase):
+    def setUp(self):
+        self.store = ModelStore(os.path.join(tempfile.mkdtemp(), "test.db"))
+        self.service = ModelService(FakeMqttClient(), self.store)
+        self.service.setLearningType("EAGER")
+        self.service.addPreprocessor("type_caster", {"sensor": "SELECT_ALL"})
+
+    def tearDown(self):
+        self.service.dispose()
+
+    def train(self, count, start=0):
+        for i in range(start, start + count):
+            label = "lounge" if i % 2 else "kitchen"
+            self.service._handleEntities(message(-50 - (i % 2) * 20 - i % 5, label))
+
+    def observationTimes(self):
+        return sorted(observation.time for observation in self.store.getObservations())
+
+    def test_unlabelled_messages_are_only_stored_as_context(self):
+        for i in range(50):
+            self.service._handleEntities(message(-60 - i))
+        self.assertEqual(self.store.getRawSampleCount(), 0)
+
+        self.service._handleEntities(message(-70, "lounge"))
+        samples = self.store.getRawSamples()
+        self.assertEqual(len(samples), RAW_CONTEXT_MESSAGES + 1)
+        self.assertEqual([label for _, label, _ in samples].count(None), RAW_CONTEXT_MESSAGES)
+        self.assertEqual(samples[-1][1:], ("lounge", {"rssi": "-70", "media": "tv"}))
+
+    def test_observations_survive_preprocessor_edits(self):
+        self.train(40)
+        before = self.observationTimes()
+        self.assertEqual(len(before), 40)
+
+        self.service.addPreprocessor("rolling_average", {"sensor": "rssi", "windowSize": 3})
+        self.assertEqual(self.observationTimes(), before)
+        self.service.reorderPreprocessors(1, 0)
+        self.assertEqual(self.observationTimes(), before)
+        self.service.removePreprocessor(0)
+        self.assertEqual(self.observationTimes(), before)
+        self.assertEqual(self.store.getLabelCounts(), {"kitchen": 20, "lounge": 20})
+
+    def test_refit_is_left_to_the_scheduler(self):
+        self.train(10)
+        with mock.patch.object(self.service._trainingScheduler, "requestRetrain") as requestRetrain, \
+                mock.patch.object(ModelService, "_populateModel") as populateModel:
+            self.service.addPreprocessor("rolling_average", {"sensor": "rssi", "windowSize": 3})
+        requestRetrain.assert_called()
+        populateModel.assert_not_called()
+
+    def test_messages_arriving_during_replay_are_kept(self):
+        self.train(10)
+        processFrame = TypeCaster.process_frame
+        calls = []
+
+        def processFrameWithMessage(preprocessor, frame):
+            # Messages are not held off while the pipeline runs, so one can land meanwhile.
+            if not calls:
+                self.train(1, start=10)
+            calls.append(frame)
+            return processFrame(preprocessor, frame)
+
+        with mock.patch.object(TypeCaster, "process_frame", processFrameWithMessage):
+            self.service.reorderPreprocessors(0, 0)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.store.getObservationCount(), 11)
+
+
+class TestModelServiceOnlineLearning(unittest.TestCase):
+    def setUp(self):
+        self.store = ModelStore(os.path.join(tempfile.mkdtemp(), "test.db"))
+        self.service = ModelService(FakeMqttClient(), self.store)
+        settings = self.service.getModelSettings()
+        settings["model_type"] = "OnlineNaiveBayes"
+        self.service.setModelSettings(settings)
+        self.service.setLearningType("EAGER")
+
+    def tearDown(self):
+        self.service.dispose()
+
+    def test_learns_without_refitting(self):
+        with mock.patch.object(self.service._trainingScheduler, "requestRetrain") as requestRetrain:
+            self.service._handleEntities(message(-50, "kitchen"))
+        requestRetrain.assert_not_called()
+        self.assertEqual(self.service._model._labelCounts, {"kitchen": 1})
+
+    def test_fit_in_flight_is_followed_by_another(self):
+        self.service._handleEntities(message(-50, "kitchen"))
+        snapshotTaken = threading.Event()
+        release = threading.Event()
+        populateDataframe = OnlineNaiveBayes.populateDataframe
+
+        def slowPopulateDataframe(model, observations):
+            snapshotTaken.set()
+            release.wait(5)
+            populateDataframe(model, observations)
+
+        with mock.patch.object(OnlineNaiveBayes, "populateDataframe", slowPopulateDataframe):
+            fit = threading.Thread(target=self.service._populateModel)
+            fit.start()
+            self.assertTrue(snapshotTaken.wait(5))
+            with mock.patch.object(self.service._trainingScheduler, "requestRetrain") as requestRetrain:
+                self.service._handleEntities(message(-80, "lounge"))
+            release.set()
+            fit.join(5)
+
+        # The fit read one observation and replaced the model that learnt the second.
+        requestRetrain.assert_called_once()
+        self.assertEqual(self.service._model._total, 1)
+        self.assertFalse(self.service._fitInFlight)
+
+
+class TestModelServiceCompaction(unittest.TestCase):
+    def setUp(self):
+        self.store = ModelStore(os.path.join(tempfile.mkdtemp(), "test.db"))
+        self.service = ModelService(FakeMqttClient(), self.store)
+        settings = self.service.getModelSettings()
+        settings["ingest_dedupe_capacity"] = 100
+        self.service.setModelSettings(settings)
+        self.service.setLearningType("EAGER")
+
+    def tearDown(self):
+        self.service.dispose()
+
+    def test_compacted_away_observations_can_be_sent_again(self):
+        for i in range(4):
+            self.service._handleEntities(message(-50 - i, "kitchen"))
+        self.service._handleEntities(message(-50, "kitchen"))
+        self.assertEqual(self.store.getObservationCount(), 4)
+
+        self.service._retentionPolicy = RetentionPolicy(maxRows=2)
+        self.service._compactObservations()
+        self.assertEqual(self.store.getObservationCount(), 2)
+        # The oldest reading was compacted away, so sending it again is not a duplicate.
+        self.service._handleEntities(message(-50, "kitchen"))
+        self.assertEqual(self.store.getObservationCount(), 3)
+
+if __name__ == '__main__':
+    unittest.main()
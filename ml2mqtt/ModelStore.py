@@ -1,14 +1,22 @@
 import sqlite3
 import struct
+import hashlib
+import hmac
+import os
 import logging
 import threading
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 import time
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Set, Union
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 from pathlib import Path
 import json
+import pickle
 from enum import Enum
+import numpy as np
+import pandas as pd
+from ObservationRetention import CompactionResult, RetentionPolicy, selectForRemoval
 
 @dataclass
 class EntityKey:
@@ -35,6 +43,44 @@ class ModelObservation:
         return datetime.fromtimestamp(self.time, tz=timezone.utc).isoformat()
 
 
+class ObservationMatrix:
+    """
+    Read-only columnar snapshot of the Observations table.
+
+    `features` has one column per entity key in `entityKeys` order. Float sensors hold their
+    value, string sensors hold their StringTable id, and values an observation did not record
+    are NaN. Rows are in insertion order.
+    """
+
+    def __init__(self, entityKeys: List[EntityKey], features: np.ndarray, labels: np.ndarray,
+                 times: np.ndarray, strings: Dict[int, str]):
+        self.entityKeys = entityKeys
+        self.features = features
+        self.labels = labels
+        self.times = times
+        self._strings = strings
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def toDataFrame(self) -> pd.DataFrame:
+        """Decode the matrix into the DataFrame the classifiers train on. Empty columns are dropped."""
+        columns: Dict[str, np.ndarray] = {}
+        for i, entityKey in enumerate(self.entityKeys):
+            values = self.features[:, i]
+            missing = np.isnan(values)
+            if missing.all():
+                continue
+            if entityKey.type == ModelStore.TYPE_STRING:
+                ids, inverse = np.unique(np.where(missing, -1, values), return_inverse=True)
+                decoded = np.empty(len(ids), dtype=object)
+                decoded[:] = [self._strings.get(int(v)) for v in ids]
+                columns[entityKey.name] = decoded[inverse]
+            else:
+                columns[entityKey.name] = values
+        return pd.DataFrame(columns)
+
+
 @dataclass
 class ProcessorEntry:
     id: int
@@ -46,54 +92,308 @@ class ProcessorType(Enum):
     PREPROCESSOR = "Preprocessors"
     POSTPROCESSOR = "Postprocessors"
 
+def _stateToJson(value: Any) -> Any:
+    """Let objects kept in state dictionaries, such as preprocessor ring buffers, store themselves."""
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+DEFAULT_RAW_SAMPLE_LIMIT = 50000
+# Pruning the raw samples counts and deletes rows, so only do it every this many inserts.
+RAW_SAMPLE_PRUNE_INTERVAL = 500
+
+ARTIFACT_KEY_BYTES = 32
+
+
+def loadArtifactKey(path: str) -> bytes:
+    """
+    Read the key fitted models are signed with, creating it on first use.
+
+    The key lives outside the model files, so a database written anywhere else, for example
+    one that was uploaded, never carries a signature this installation accepts.
+    """
+    try:
+        with open(path, "rb") as keyFile:
+            key = keyFile.read()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another process created it first.
+        return loadArtifactKey(path)
+    key = os.urandom(ARTIFACT_KEY_BYTES)
+    with os.fdopen(fd, "wb") as keyFile:
+        keyFile.write(key)
+    return key
+
+
 class ModelStore:
     TYPE_INT = 0
     TYPE_FLOAT = 1
     TYPE_STRING = 2
 
+    FITTED_MODEL_FORMAT = 3
+    # Number of migrations in _createTables(); files with a higher user_version are from a newer release.
+    SCHEMA_VERSION = 8
+
     TYPE_FORMATS = {
         TYPE_FLOAT: "f",
         TYPE_STRING: "f",  # stored as int reference to string table
     }
 
-    def __init__(self, modelPath: str):
+    def __init__(self, modelPath: str, groupCommitWindow: float = 0.0, maxStrings: Optional[int] = None,
+                 maxRawSamples: Optional[int] = DEFAULT_RAW_SAMPLE_LIMIT, artifactKey: Optional[bytes] = None):
         self.modelPath = modelPath
         self.logger = logging.getLogger(__name__)
-        self.lock = threading.Lock()
-        self._db = sqlite3.connect(modelPath, check_same_thread=False)
+        # Reentrant so a unit of work can call the other mutators while holding it.
+        self.lock = threading.RLock()
+        # Autocommit mode: transactions are managed explicitly by transaction().
+        self._db = sqlite3.connect(modelPath, check_same_thread=False, isolation_level=None)
+        # Before WAL, whose switch writes the file header on a new file.
+        self._enableIncrementalVacuum()
         self._db.execute("PRAGMA journal_mode=WAL")
         self._cursor = self._db.cursor()
 
+        # With a group-commit window, units of work are committed together at most that many
+        # seconds later. WAL with synchronous=NORMAL then only syncs on checkpoints, trading the
+        # last window of writes on power loss for far fewer fsyncs.
+        self._groupCommitWindow = max(0.0, groupCommitWindow)
+        self._synchronous = "NORMAL" if self._groupCommitWindow > 0 else "FULL"
+        self._db.execute(f"PRAGMA synchronous={self._synchronous}")
+        self._transactionDepth = 0
+        self._commitTimer: Optional[threading.Timer] = None
+        self._writeStats = {"units_of_work": 0, "commits": 0, "synced_commits": 0, "rollbacks": 0}
+
+        # Optional cap on the StringTable. Past it the strings no stored observation refers to any
+        # more are removed, oldest first. Strings in use are never evicted, so the cap is soft.
+        self._maxStrings = maxStrings if maxStrings and maxStrings > 0 else None
+        # Raw messages kept for replaying the preprocessors. Past this many the oldest unlabelled
+        # ones go first; a labelled one stays for as long as its observation does.
+        self._maxRawSamples = maxRawSamples if maxRawSamples and maxRawSamples > 0 else None
+        self._rawSamplesSincePrune = 0
+        # Fitted models are pickles, so one is only loaded if this key signed it. Without a
+        # key they are neither stored nor reused.
+        self._artifactKey = artifactKey or None
+
+        # Columnar cache of the Observations table, loaded on first use and kept in sync
+        # by addObservation and the delete methods. Rows past _rowCount are spare capacity.
+        self._features: Optional[np.ndarray] = None
+        self._labels: Optional[np.ndarray] = None
+        self._times: Optional[np.ndarray] = None
+        self._rowCount = 0
+
         self._createTables()
         self._populateSensors()
         self._populateStringTable()
 
         self.logger.info("ModelStore initialized with model: %s", modelPath)
 
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Group every write made inside the block into one unit of work.
+
+        Blocks nest: an inner block that raises only rolls back its own writes. The outermost
+        block commits on exit, or within the group-commit window if one is configured.
+        """
+        with self.lock:
+            if not self._db.in_transaction:
+                self._db.execute("BEGIN")
+            savepoint = f"unit_of_work_{self._transactionDepth}"
+            self._db.execute(f"SAVEPOINT {savepoint}")
+            self._transactionDepth += 1
+            try:
+                yield self._db
+            except BaseException:
+                self._transactionDepth -= 1
+                self._db.execute(f"ROLLBACK TO {savepoint}")
+                self._db.execute(f"RELEASE {savepoint}")
+                self._writeStats["rollbacks"] += 1
+                # The caches may hold rows that were just rolled back.
+                self._reloadCaches()
+                raise
+            self._transactionDepth -= 1
+            self._db.execute(f"RELEASE {savepoint}")
+            if self._transactionDepth == 0:
+                self._writeStats["units_of_work"] += 1
+                if self._groupCommitWindow > 0:
+                    self._scheduleCommit()
+                else:
+                    self._commit()
+
+    def flush(self) -> None:
+        """Commit units of work still waiting for the group-commit window."""
+        with self.lock:
+            if self._commitTimer is not None:
+                self._commitTimer.cancel()
+                self._commitTimer = None
+            if self._transactionDepth == 0:
+                self._commit()
+
+    def getWriteStats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self._writeStats, "synchronous": self._synchronous}
+
+    def _commit(self) -> None:
+        if not self._db.in_transaction:
+            return
+        self._db.execute("COMMIT")
+        self._writeStats["commits"] += 1
+        if self._synchronous == "FULL":
+            self._writeStats["synced_commits"] += 1
+
+    def _scheduleCommit(self) -> None:
+        if self._commitTimer is None:
+            self._commitTimer = threading.Timer(self._groupCommitWindow, self.flush)
+            self._commitTimer.daemon = True
+            self._commitTimer.start()
+
+    def _reloadCaches(self) -> None:
+        self._features = None
+        self._populateSensors()
+        self._populateStringTable()
+
     def _createTables(self) -> None:
-        with self.lock, self._db:
-            cursor = self._db.cursor()
-            cursor.execute("CREATE TABLE IF NOT EXISTS SensorKeys (name TEXT PRIMARY KEY, type INTEGER)")
-            cursor.execute("CREATE TABLE IF NOT EXISTS Observations (time INTEGER, label TEXT, data BLOB)")
-            cursor.execute("CREATE TABLE IF NOT EXISTS StringTable (name TEXT)")
-            cursor.execute("CREATE TABLE IF NOT EXISTS Settings (name TEXT PRIMARY KEY, value)")
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS Preprocessors (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    type TEXT,
-                    params TEXT,
-                    order_num INTEGER
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS Postprocessors (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    type TEXT,
-                    params TEXT,
-                    order_num INTEGER
-                )
-            """)
-            self._db.commit()
+        """Bring the schema up to date. PRAGMA user_version records how many migrations have run."""
+        migrations = [
+            self._migrateBaseSchema,
+            self._migrateObservationKeys,
+            self._migrateLabelCounts,
+            self._migrateStringKeys,
+            self._migrateFittedModel,
+            self._migrateSampleKeys,
+            self._migrateRawSamples,
+            self._migrateFittedModelSignature,
+        ]
+        with self.transaction():
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            for number, migration in enumerate(migrations[version:], start=version + 1):
+                self.logger.info("Migrating %s to schema version %d", self.modelPath, number)
+                migration()
+                self._db.execute(f"PRAGMA user_version = {number}")
+
+    def _migrateBaseSchema(self) -> None:
+        # Files created before migrations existed already have these tables.
+        cursor = self._db.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS SensorKeys (name TEXT PRIMARY KEY, type INTEGER)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS Observations (time INTEGER, label TEXT, data BLOB)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS StringTable (name TEXT)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS Settings (name TEXT PRIMARY KEY, value)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS Preprocessors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT,
+                params TEXT,
+                order_num INTEGER
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS Postprocessors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT,
+                params TEXT,
+                order_num INTEGER
+            )
+        """)
+
+    def _migrateObservationKeys(self) -> None:
+        # Rebuild with an explicit integer key (keeping ROWIDs, so insertion order is unchanged)
+        # and index the columns the delete and listing queries filter and sort on.
+        cursor = self._db.cursor()
+        cursor.execute("CREATE TABLE Observations_new (id INTEGER PRIMARY KEY, time INTEGER, label TEXT, data BLOB)")
+        cursor.execute("INSERT INTO Observations_new (id, time, label, data) SELECT ROWID, time, label, data FROM Observations")
+        cursor.execute("DROP TABLE Observations")
+        cursor.execute("ALTER TABLE Observations_new RENAME TO Observations")
+        cursor.execute("CREATE INDEX ObservationsByTime ON Observations (time)")
+        cursor.execute("CREATE INDEX ObservationsByLabel ON Observations (label)")
+
+    def _migrateLabelCounts(self) -> None:
+        cursor = self._db.cursor()
+        cursor.execute("CREATE TABLE LabelCounts (label TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+        cursor.execute("INSERT INTO LabelCounts (label, count) SELECT label, COUNT(*) FROM Observations GROUP BY label")
+        cursor.execute("""
+            CREATE TRIGGER LabelCountsInsert AFTER INSERT ON Observations BEGIN
+                INSERT INTO LabelCounts (label, count) VALUES (NEW.label, 1)
+                    ON CONFLICT (label) DO UPDATE SET count = count + 1;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER LabelCountsDelete AFTER DELETE ON Observations BEGIN
+                UPDATE LabelCounts SET count = count - 1 WHERE label = OLD.label;
+                DELETE FROM LabelCounts WHERE label = OLD.label AND count <= 0;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER LabelCountsUpdate AFTER UPDATE OF label ON Observations BEGIN
+                UPDATE LabelCounts SET count = count - 1 WHERE label = OLD.label;
+                DELETE FROM LabelCounts WHERE label = OLD.label AND count <= 0;
+                INSERT INTO LabelCounts (label, count) VALUES (NEW.label, 1)
+                    ON CONFLICT (label) DO UPDATE SET count = count + 1;
+            END
+        """)
+
+    def _migrateStringKeys(self) -> None:
+        # AUTOINCREMENT so ids of evicted strings are never handed out again, and a unique name
+        # index for lookups. Existing ids are kept because observations reference them.
+        cursor = self._db.cursor()
+        cursor.execute("CREATE TABLE StringTable_new (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE)")
+        cursor.execute("INSERT OR IGNORE INTO StringTable_new (id, name) SELECT ROWID, name FROM StringTable ORDER BY ROWID")
+        cursor.execute("DROP TABLE StringTable")
+        cursor.execute("ALTER TABLE StringTable_new RENAME TO StringTable")
+
+    def _migrateFittedModel(self) -> None:
+        cursor = self._db.cursor()
+        cursor.execute("CREATE TABLE FittedModel (id INTEGER PRIMARY KEY CHECK (id = 0), format INTEGER, fit_hash TEXT, created REAL, artifact BLOB)")
+        # Bumped by any change to the training data, so a fit can be matched to the data it saw
+        # without hashing every row.
+        cursor.execute("CREATE TABLE DataRevision (id INTEGER PRIMARY KEY CHECK (id = 0), revision INTEGER NOT NULL)")
+        cursor.execute("INSERT INTO DataRevision (id, revision) VALUES (0, 0)")
+        for table, events in [("Observations", ["INSERT", "DELETE", "UPDATE"]),
+                              ("SensorKeys", ["INSERT", "DELETE", "UPDATE"]),
+                              ("StringTable", ["DELETE", "UPDATE"])]:
+            for event in events:
+                cursor.execute(f"""
+                    CREATE TRIGGER {table}Revision{event.capitalize()} AFTER {event} ON {table} BEGIN
+                        UPDATE DataRevision SET revision = revision + 1 WHERE id = 0;
+                    END
+                """)
+
+    def _migrateSampleKeys(self) -> None:
+        # A uniform random key per row; retention keeps the lowest keys of each label, which
+        # is a reservoir sample that survives any number of compactions.
+        cursor = self._db.cursor()
+        cursor.execute("ALTER TABLE Observations ADD COLUMN sample_key INTEGER")
+        cursor.execute("UPDATE Observations SET sample_key = random()")
+
+    def _migrateRawSamples(self) -> None:
+        # Messages as they arrived, before any preprocessor. `label` is set on the ones stored as
+        # a training observation, whose time they share, and cleared when that observation is
+        # deleted; the rest are context for windows.
+        cursor = self._db.cursor()
+        cursor.execute("CREATE TABLE RawSamples (id INTEGER PRIMARY KEY, time REAL NOT NULL, label TEXT, sample TEXT NOT NULL)")
+        cursor.execute("CREATE INDEX RawSamplesByTime ON RawSamples (time)")
+
+    def _migrateFittedModelSignature(self) -> None:
+        # Fitted models stored before signing existed cannot be trusted, so they are refitted.
+        cursor = self._db.cursor()
+        cursor.execute("ALTER TABLE FittedModel ADD COLUMN signature BLOB")
+        cursor.execute("DELETE FROM FittedModel")
+
+    def _enableIncrementalVacuum(self) -> None:
+        """Create new files with auto_vacuum=INCREMENTAL so compact() can return free pages to the filesystem."""
+        if self._db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        if self._db.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+            self._db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            return
+        # Switching an existing file takes a full VACUUM, which rewrites it while blocking every
+        # other access, so it keeps its mode. compact() still frees pages for reuse; the file
+        # just does not shrink.
+        self.logger.info("%s was created without incremental vacuum; compaction will not shrink the file", self.modelPath)
 
     def _populateSensors(self) -> None:
         self._entityKeys: List[EntityKey] = []
@@ -102,16 +402,57 @@ class ModelStore:
         self._entityKeySet: Set[str] = set(sk.name for sk in self._entityKeys)
 
     def _populateStringTable(self) -> None:
-        self._stringTable: Dict[str, int] = dict((row[1], row[0]) for row in self._cursor.execute("SELECT ROWID, name FROM StringTable"))
+        self._stringTable: Dict[str, int] = dict((row[1], row[0]) for row in self._cursor.execute("SELECT id, name FROM StringTable ORDER BY id"))
         self._reverseStringTable: Dict[int, str] = {v: k for k, v in self._stringTable.items()}
 
     def _getStringId(self, string: str) -> int:
-        if string not in self._stringTable:
-            with self.lock, self._db:
-                self._db.execute("INSERT INTO StringTable (name) VALUES (?)", (string,))
-                self._db.commit()
-            self._populateStringTable()
-        return self._stringTable[string]
+        stringId = self._stringTable.get(string)
+        if stringId is None:
+            with self.transaction():
+                stringId = self._db.execute("INSERT INTO StringTable (name) VALUES (?)", (string,)).lastrowid
+                self._stringTable[string] = stringId
+                self._reverseStringTable[stringId] = string
+        return stringId
+
+    def internStrings(self, strings: Iterable[str]) -> Dict[str, int]:
+        """Return the StringTable id of every string, adding the new ones with one batched insert."""
+        unique = list(dict.fromkeys(strings))
+        with self.transaction():
+            new = [string for string in unique if string not in self._stringTable]
+            if new:
+                self._db.executemany("INSERT INTO StringTable (name) VALUES (?)", [(string,) for string in new])
+                for start in range(0, len(new), 500):
+                    chunk = new[start:start + 500]
+                    placeholders = ", ".join("?" * len(chunk))
+                    for stringId, string in self._db.execute(
+                            f"SELECT id, name FROM StringTable WHERE name IN ({placeholders}) ORDER BY id", chunk):
+                        self._stringTable[string] = stringId
+                        self._reverseStringTable[stringId] = string
+            ids = {string: self._getStringId(string) for string in unique}
+            # The caller is about to store these, so they are in use already.
+            self._evictStrings(set(ids.values()))
+            return ids
+
+    def _referencedStringIds(self) -> Set[int]:
+        """Ids of the strings stored observations hold. Callers must hold the lock."""
+        if self._features is None:
+            self._loadMatrix()
+        columns = [i for i, entityKey in enumerate(self._entityKeys) if entityKey.type == self.TYPE_STRING]
+        values = self._features[:self._rowCount, columns]
+        return {int(value) for value in np.unique(values[~np.isnan(values)])}
+
+    def _evictStrings(self, inUse: Optional[Set[int]] = None) -> None:
+        if self._maxStrings is None or len(self._stringTable) <= self._maxStrings:
+            return
+        referenced = self._referencedStringIds() | (inUse or set())
+        unused = sorted(stringId for stringId in self._reverseStringTable if stringId not in referenced)
+        evicted = unused[:len(self._stringTable) - self._maxStrings]
+        if not evicted:
+            return
+        for stringId in evicted:
+            del self._stringTable[self._reverseStringTable.pop(stringId)]
+        self._db.executemany("DELETE FROM StringTable WHERE id = ?", [(stringId,) for stringId in evicted])
+        self.logger.debug(f"Evicted {len(evicted)} unused strings from the string table")
 
     def _getType(self, variable: Any) -> int:
         if isinstance(variable, int):
@@ -153,15 +494,15 @@ class ModelStore:
 
     def _addSensorType(self, name: str, value: Any) -> None:
         sensorType = self._getType(value)
-        with self.lock, self._db:
-            try:
-                self._db.execute("INSERT INTO SensorKeys (name, type) VALUES (?, ?)", (name, sensorType))
-                self._db.commit()
-            except sqlite3.IntegrityError:
-                pass
+        with self.transaction():
+            self._db.execute("INSERT OR IGNORE INTO SensorKeys (name, type) VALUES (?, ?)", (name, sensorType))
         if not name in self._entityKeySet:
-            self._entityKeys.append(EntityKey(name, sensorType))
-            self._entityKeySet.add(name)
+            with self.lock:
+                self._entityKeys.append(EntityKey(name, sensorType))
+                self._entityKeySet.add(name)
+                if self._features is not None:
+                    newColumn = np.full((self._features.shape[0], 1), np.nan)
+                    self._features = np.hstack([self._features, newColumn])
 
     def sortEntityValues(self, entityMap: Dict[str, Any], forTraining: bool) -> Dict[str, Any]:
         values: Dict[str, Any] = {}
@@ -182,25 +523,159 @@ class ModelStore:
     def addObservation(self, label: str, sensors: Dict[str, Any], assignedTime: Optional[float] = None) -> None:
         if assignedTime is None:
             assignedTime = time.time()
-        for sensor in sensors:
-            if sensor not in self._entityKeySet:
-                self._addSensorType(sensor, sensors[sensor])
-        self.logger.info(f"Observation to be added: {sensors}")
-        formatStr = self._generateFormatString()
-        try:
-            values = [self._getDbValue(sensors.get(entity.name)) for entity in self._entityKeys]
-            packed = struct.pack(formatStr, *values)
-
-            with self.lock, self._db:
-                self._db.execute("INSERT INTO Observations (time, label, data) VALUES (?, ?, ?)", (assignedTime, label, packed))
-                self._db.commit()
-        except Exception as e:
-            self.logger.exception("Exception while adding observation")
+        # New sensor keys, new strings and the row itself commit together.
+        with self.transaction():
+            for sensor in sensors:
+                if sensor not in self._entityKeySet:
+                    self._addSensorType(sensor, sensors[sensor])
+            self.logger.info(f"Observation to be added: {sensors}")
+            formatStr = self._generateFormatString()
+            try:
+                values = [self._getDbValue(sensors.get(entity.name)) for entity in self._entityKeys]
+                packed = struct.pack(formatStr, *values)
+
+                self._db.execute("INSERT INTO Observations (time, label, data, sample_key) VALUES (?, ?, ?, random())", (assignedTime, label, packed))
+                self._appendToMatrix(assignedTime, label, values)
+                self._evictStrings()
+            except Exception as e:
+                self.logger.exception("Exception while adding observation")
+
+    def addRawSample(self, sample: Dict[str, Any], label: Optional[str], assignedTime: float) -> None:
+        """Record a message before preprocessing. Pass the label only if it became a training observation."""
+        self.addRawSamples([(assignedTime, label, sample)])
+
+    def addRawSamples(self, samples: List[Tuple[float, Optional[str], Dict[str, Any]]]) -> None:
+        """Record (time, label, sample) messages, oldest first, with one batched insert."""
+        if not samples:
+            return
+        with self.transaction():
+            self._db.executemany("INSERT INTO RawSamples (time, label, sample) VALUES (?, ?, ?)",
+                                 [(assignedTime, label, json.dumps(sample)) for assignedTime, label, sample in samples])
+            self._rawSamplesSincePrune += len(samples)
+            if self._maxRawSamples is not None and self._rawSamplesSincePrune >= RAW_SAMPLE_PRUNE_INTERVAL:
+                self._rawSamplesSincePrune = 0
+                self._pruneRawSamples()
+
+    def _pruneRawSamples(self) -> None:
+        # Only unlabelled rows, context and the messages of deleted observations, are dropped;
+        # replay needs every labelled one to rebuild its observation.
+        excess = self._db.execute("SELECT COUNT(*) FROM RawSamples").fetchone()[0] - self._maxRawSamples
+        if excess > 0:
+            self._db.execute("DELETE FROM RawSamples WHERE id IN "
+                             "(SELECT id FROM RawSamples WHERE label IS NULL ORDER BY id LIMIT ?)", (excess,))
+
+    def getRawSamples(self) -> List[Tuple[float, Optional[str], Dict[str, Any]]]:
+        """Every recorded message as (time, label, sample), oldest first."""
+        with self.lock:
+            rows = self._db.execute("SELECT time, label, sample FROM RawSamples ORDER BY id ASC").fetchall()
+        return [(timeVal, label, json.loads(sample)) for timeVal, label, sample in rows]
+
+    def getRawSampleCount(self) -> int:
+        with self.lock:
+            return self._db.execute("SELECT COUNT(*) FROM RawSamples").fetchone()[0]
+
+    def replaceObservations(self, observations: List[ModelObservation]) -> int:
+        """
+        Rewrite the Observations table from `observations` in one unit of work and return how
+        many rows were stored. Sensor keys are rebuilt from the new rows, so sensors no longer
+        produced stop being columns. Rows that could not be stored as training data are skipped,
+        as they would have been when first recorded.
+        """
+        with self.transaction():
+            self._db.execute("DELETE FROM Observations")
+            self._db.execute("DELETE FROM SensorKeys")
+            self._entityKeys = []
+            self._entityKeySet = set()
+            self._features = None
+            for observation in observations:
+                try:
+                    with self.transaction():
+                        sensors = self.sortEntityValues(observation.sensorValues, True)
+                        self.addObservation(observation.label, sensors, observation.time)
+                except ValueError as e:
+                    self.logger.debug(f"Skipping observation at {observation.time}: {e}")
+            return self.getObservationCount()
+
+    def _loadMatrix(self) -> None:
+        """Build the columnar cache from the Observations table. Callers must hold the lock."""
+        rows = self._db.execute("SELECT time, label, data FROM Observations ORDER BY id ASC").fetchall()
+        count = len(rows)
+        self._features = np.full((max(count, 16), len(self._entityKeys)), np.nan)
+        self._labels = np.empty(self._features.shape[0], dtype=object)
+        self._times = np.zeros(self._features.shape[0], dtype=np.float64)
+        self._rowCount = count
+        if count == 0:
+            return
+
+        self._labels[:count] = [row[1] for row in rows]
+        self._times[:count] = [row[0] for row in rows]
+
+        # Rows written before a sensor was added are shorter; decode each blob length in one go.
+        lengths = np.fromiter((len(row[2]) for row in rows), dtype=np.int64, count=count)
+        for length in np.unique(lengths):
+            indexes = np.flatnonzero(lengths == length)
+            width = min(int(length) // 4, len(self._entityKeys))
+            if width == 0:
+                continue
+            blob = b"".join(rows[i][2] for i in indexes)
+            values = np.frombuffer(blob, dtype=np.float32).reshape(len(indexes), int(length) // 4)
+            self._features[indexes, :width] = values[:, :width]
+
+    def _appendToMatrix(self, assignedTime: float, label: str, values: List[float]) -> None:
+        if self._features is None:
+            return
+        if self._rowCount == self._features.shape[0]:
+            capacity = max(16, self._features.shape[0] * 2)
+            features = np.full((capacity, self._features.shape[1]), np.nan)
+            features[:self._rowCount] = self._features[:self._rowCount]
+            labels = np.empty(capacity, dtype=object)
+            labels[:self._rowCount] = self._labels[:self._rowCount]
+            times = np.zeros(capacity, dtype=np.float64)
+            times[:self._rowCount] = self._times[:self._rowCount]
+            self._features, self._labels, self._times = features, labels, times
+        self._features[self._rowCount, :len(values)] = values
+        self._labels[self._rowCount] = label
+        self._times[self._rowCount] = assignedTime
+        self._rowCount += 1
+
+    def _removeFromMatrix(self, removed: np.ndarray) -> None:
+        """Drop rows flagged in `removed`. Builds new arrays so existing snapshots stay valid."""
+        if self._features is None:
+            return
+        keep = ~removed
+        self._features = self._features[:self._rowCount][keep]
+        self._labels = self._labels[:self._rowCount][keep]
+        self._times = self._times[:self._rowCount][keep]
+        self._rowCount = len(self._labels)
+
+    def getObservationMatrix(self) -> ObservationMatrix:
+        with self.lock:
+            if self._features is None:
+                self._loadMatrix()
+            count = self._rowCount
+            return ObservationMatrix(
+                list(self._entityKeys),
+                self._features[:count],
+                self._labels[:count],
+                self._times[:count],
+                dict(self._reverseStringTable),
+            )
 
-    def getObservations(self) -> List[ModelObservation]:
-        self._cursor.execute("SELECT time, label, data FROM Observations ORDER BY time DESC")
+    def getObservationCount(self) -> int:
+        with self.lock:
+            if self._features is not None:
+                return self._rowCount
+            return self._db.execute("SELECT COUNT(*) FROM Observations").fetchone()[0]
+
+    def getObservations(self, limit: Optional[int] = None, offset: int = 0) -> List[ModelObservation]:
+        # Retrains read from a worker thread, so use a private cursor rather than the shared one.
+        with self.lock:
+            rows = self._db.execute(
+                "SELECT time, label, data FROM Observations ORDER BY time DESC LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset)
+            ).fetchall()
         observations: List[ModelObservation] = []
-        for timeVal, label, data in self._cursor.fetchall():
+        for timeVal, label, data in rows:
             formatStr = self._generateFormatString(len(data))
             unpacked = struct.unpack(formatStr, data)
             sensorValues = {
@@ -211,6 +686,61 @@ class ModelStore:
             observations.append(ModelObservation(timeVal, label, sensorValues))
         return observations
 
+    def getDataRevision(self) -> int:
+        with self.lock:
+            return self._db.execute("SELECT revision FROM DataRevision WHERE id = 0").fetchone()[0]
+
+    def _signArtifact(self, fitHash: str, blob: bytes) -> bytes:
+        message = f"{self.FITTED_MODEL_FORMAT}:{fitHash}:".encode() + blob
+        return hmac.new(self._artifactKey, message, hashlib.sha256).digest()
+
+    def saveFittedModel(self, fitHash: str, artifact: Dict[str, Any]) -> None:
+        """Store the fitted model, replacing the previous one. `fitHash` identifies the data and parameters it was fitted on."""
+        if self._artifactKey is None:
+            return
+        blob = pickle.dumps(artifact, protocol=pickle.HIGHEST_PROTOCOL)
+        signature = self._signArtifact(fitHash, blob)
+        with self.transaction():
+            self._db.execute(
+                "INSERT OR REPLACE INTO FittedModel (id, format, fit_hash, created, artifact, signature) VALUES (0, ?, ?, ?, ?, ?)",
+                (self.FITTED_MODEL_FORMAT, fitHash, time.time(), blob, signature)
+            )
+
+    def loadFittedModel(self, fitHash: str) -> Optional[Dict[str, Any]]:
+        """Return the stored fitted model if it was fitted with `fitHash` and signed with our key, otherwise None."""
+        if self._artifactKey is None:
+            return None
+        with self.lock:
+            row = self._db.execute(
+                "SELECT artifact, signature FROM FittedModel WHERE id = 0 AND format = ? AND fit_hash = ?",
+                (self.FITTED_MODEL_FORMAT, fitHash)
+            ).fetchone()
+        if row is None:
+            return None
+        blob, signature = row
+        # Checked before unpickling, which can run arbitrary code.
+        if signature is None or not hmac.compare_digest(signature, self._signArtifact(fitHash, blob)):
+            self.logger.warning("Discarding fitted model with an invalid signature in %s", self.modelPath)
+            return None
+        try:
+            return pickle.loads(blob)
+        except Exception as e:
+            self.logger.warning(f"Discarding unreadable fitted model: {e}")
+            return None
+
+    def backup(self, targetPath: str) -> None:
+        """Copy a consistent snapshot of the database to `targetPath` without holding up writers."""
+        self.flush()
+        source = sqlite3.connect(Path(self.modelPath).resolve().as_uri() + "?mode=ro", uri=True)
+        target = sqlite3.connect(targetPath)
+        try:
+            # A single step copies every page inside one read transaction. Under WAL that is a
+            # consistent snapshot and writers carry on meanwhile.
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
     def getEntityKeys(self):
         return self._entityKeys
 
@@ -218,20 +748,19 @@ class ModelStore:
         return Path(self.modelPath).stat().st_size
 
     def _getSetting(self, name: str, default_value: Any) -> Any:
-        with self._db as conn:
-            row = conn.execute("SELECT value FROM Settings WHERE name = ?", (name,)).fetchone()
+        with self.lock:
+            row = self._db.execute("SELECT value FROM Settings WHERE name = ?", (name,)).fetchone()
             return row[0] if row else default_value
 
     def getDict(self, name: str) -> Optional[Dict[str, Any]]:
         return json.loads(self._getSetting(name, "{}"))
 
     def saveDict(self, name: str, value: Dict[str, Any]) -> None:
-        self._saveSetting(name, json.dumps(value))
+        self._saveSetting(name, json.dumps(value, default=_stateToJson))
 
     def _saveSetting(self, name: str, value: Any) -> None:
-        with self.lock, self._db:
+        with self.transaction():
             self._db.execute("INSERT OR REPLACE INTO Settings (name, value) VALUES (?, ?)", (name, value))
-            self._db.commit()
 
     def setMqttTopic(self, mqttTopic: str) -> None:
         self._saveSetting("mqtt_topic", mqttTopic)
@@ -246,47 +775,105 @@ class ModelStore:
         return self._getSetting("name", None)
 
     def getLabels(self) -> List[str]:
-        return [row[0] for row in self._cursor.execute("SELECT DISTINCT label FROM Observations ORDER BY label ASC")]
+        with self.lock:
+            rows = self._db.execute("SELECT label FROM LabelCounts ORDER BY label ASC").fetchall()
+        return [row[0] for row in rows]
+
+    def getLabelCounts(self) -> Dict[str, int]:
+        """Number of stored observations per label, kept up to date by triggers on Observations."""
+        with self.lock:
+            rows = self._db.execute("SELECT label, count FROM LabelCounts ORDER BY label ASC").fetchall()
+        return {label: count for label, count in rows}
 
     def deleteObservationsByLabel(self, label: str) -> None:
-        with self.lock, self._db:
+        with self.transaction():
             self._db.execute("DELETE FROM Observations WHERE label = ?", (label,))
-            self._db.commit()
+            self._db.execute("UPDATE RawSamples SET label = NULL WHERE label = ?", (label,))
+            if self._features is not None:
+                self._removeFromMatrix(self._labels[:self._rowCount] == label)
 
     def deleteObservation(self, time: int) -> None:
-        with self.lock, self._db:
+        with self.transaction():
             self._db.execute("DELETE FROM Observations WHERE time = ?", (time,))
-            self._db.commit()
+            self._db.execute("UPDATE RawSamples SET label = NULL WHERE time = ?", (time,))
+            if self._features is not None:
+                self._removeFromMatrix(self._times[:self._rowCount] == time)
 
     def deleteObservationsSince(self, timestamp: float) -> None:
         """
         Deletes all observations with a timestamp greater than or equal to the provided timestamp.
         """
-        with self.lock, self._db:
+        with self.transaction():
             self._db.execute("DELETE FROM Observations WHERE time >= ?", (timestamp,))
-            self._db.commit()
+            self._db.execute("UPDATE RawSamples SET label = NULL WHERE time >= ?", (timestamp,))
+            if self._features is not None:
+                self._removeFromMatrix(self._times[:self._rowCount] >= timestamp)
+
+    def compact(self, policy: RetentionPolicy, now: Optional[float] = None) -> CompactionResult:
+        """Delete the observations `policy` does not retain. See selectForRemoval() for the rules."""
+        with self.transaction():
+            if self._features is None:
+                self._loadMatrix()
+            rows = self._db.execute("SELECT id, sample_key FROM Observations ORDER BY id ASC").fetchall()
+            if len(rows) != self._rowCount:
+                self._loadMatrix()
+            count = self._rowCount
+            ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            sampleKeys = np.fromiter((row[1] or 0 for row in rows), dtype=np.int64, count=len(rows))
+            floatColumns = np.array([entityKey.type == self.TYPE_FLOAT for entityKey in self._entityKeys], dtype=bool)
+
+            removed, result = selectForRemoval(
+                self._features[:count], self._labels[:count], self._times[:count], sampleKeys,
+                floatColumns, policy, time.time() if now is None else now
+            )
+            if result.removed:
+                self._db.executemany("DELETE FROM Observations WHERE id = ?", [(int(rowId),) for rowId in ids[removed]])
+                self._db.executemany("UPDATE RawSamples SET label = NULL WHERE time = ?",
+                                     [(float(removedTime),) for removedTime in self._times[:count][removed]])
+                self._removeFromMatrix(removed)
+        if result.removed:
+            result.reclaimedPages = self.reclaimSpace()
+            self.logger.info(f"Compacted {self.modelPath}: {result.to_dict()}")
+        return result
+
+    def reclaimSpace(self) -> int:
+        """Commit, then hand free pages back to the filesystem. Returns how many pages were released."""
+        with self.lock:
+            self.flush()
+            if self._transactionDepth > 0:
+                return 0
+            freePages = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+            if freePages:
+                # execute() steps the pragma once, freeing a single page; executescript() runs it to completion.
+                self._db.executescript("PRAGMA incremental_vacuum;")
+                # Pages only leave the file once the WAL is checkpointed into it.
+                self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            return freePages
 
     def deleteEntity(self, entityName: str) -> None:
         if entityName not in self._entityKeySet:
             raise ValueError("Entity not found")
         
-        observations = self.getObservations()
-        self._entityKeys = [ek for ek in self._entityKeys if ek.name != entityName]
-        self._entityKeySet.remove(entityName)
+        # One unit of work, so the table is never visible half rewritten.
+        with self.transaction():
+            observations = self.getObservations()
+            self._entityKeys = [ek for ek in self._entityKeys if ek.name != entityName]
+            self._entityKeySet.remove(entityName)
 
-        with self.lock, self._db:
             self._db.execute("DELETE FROM SensorKeys WHERE name = ?", (entityName,))
             self._db.execute("DELETE FROM Observations")
-            self._db.commit()
+            # Column positions shift, so rebuild the cache from the rewritten rows on next use.
+            self._features = None
 
-        for observation in observations:
-            observation.sensorValues.pop(entityName)
-            self.addObservation(observation.label, observation.sensorValues, observation.time)
+            for observation in reversed(observations):
+                observation.sensorValues.pop(entityName, None)
+                self.addObservation(observation.label, observation.sensorValues, observation.time)
 
     # -- Processor management --
 
-    def addPreprocessor(self, type_: str, params: Dict[str, Any], order: Optional[int] = None) -> None:
-        self._addProcessor(ProcessorType.PREPROCESSOR, type_, params, order)
+    def addPreprocessor(self, type_: str, params: Dict[str, Any], order: Optional[int] = None) -> int:
+        """Add a new preprocessor and return its ID."""
+        return self._addProcessor(ProcessorType.PREPROCESSOR, type_, params, order)
 
     def addPostprocessor(self, type_: str, params: Dict[str, Any], order: Optional[int] = None) -> int:
         """Add a new postprocessor and return its ID."""
@@ -306,31 +893,27 @@ class ModelStore:
 
     def _addProcessor(self, processorType: ProcessorType, type_: str, params: Dict[str, Any], order: Optional[int]) -> int:
         table = processorType.value
-        if order is None:
-            cursor = self._db.cursor()
-            cursor.execute(f"SELECT COALESCE(MAX(order_num), 0) + 1 FROM {table}")
-            order = cursor.fetchone()[0]
-        with self.lock, self._db:
+        with self.transaction():
             cursor = self._db.cursor()
+            if order is None:
+                cursor.execute(f"SELECT COALESCE(MAX(order_num), 0) + 1 FROM {table}")
+                order = cursor.fetchone()[0]
             cursor.execute(
                 f"INSERT INTO {table} (type, params, order_num) VALUES (?, ?, ?)",
                 (type_, json.dumps(params), order)
             )
-            self._db.commit()
             return cursor.lastrowid
 
     def _deleteProcessor(self, processorType: ProcessorType, id_: int) -> None:
         table = processorType.value
-        with self.lock, self._db:
+        with self.transaction():
             self._db.execute(f"DELETE FROM {table} WHERE ROWID = ?", (id_,))
-            self._db.commit()
 
     def _reorderProcessors(self, processorType: ProcessorType, idOrderList: List[int]) -> None:
         table = processorType.value
-        with self.lock, self._db:
+        with self.transaction():
             for order, id_ in enumerate(idOrderList):
                 self._db.execute(f"UPDATE {table} SET order_num = ? WHERE ROWID = ?", (order, id_))
-            self._db.commit()
 
     def getPreprocessors(self) -> List[ProcessorEntry]:
         return self._getProcessors(ProcessorType.PREPROCESSOR)
@@ -347,6 +930,7 @@ class ModelStore:
     def close(self) -> None:
         try:
             with self.lock:
+                self.flush()
                 self._db.close()
         except sqlite3.ProgrammingError:
             pass
\ No newline at end of file
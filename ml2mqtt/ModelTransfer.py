@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import tempfile
+import zlib
+from contextlib import closing
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+from ModelStore import ModelStore
+
+CHUNK_SIZE = 1 << 16
+# Refuse imports that expand past this, so a small gzip bomb cannot fill the disk.
+MAX_IMPORT_SIZE = 4 << 30
+GZIP_MAGIC = b"\x1f\x8b"
+SQLITE_MAGIC = b"SQLite format 3\x00"
+REQUIRED_TABLES = {"SensorKeys", "Observations", "StringTable", "Settings", "Preprocessors", "Postprocessors"}
+
+
+class ModelImportError(ValueError):
+    """The uploaded file is not a model database this version can load."""
+
+
+def exportModel(store: ModelStore, compress: bool = True, chunkSize: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Snapshot a model with the online backup API and stream the copy in chunks.
+
+    The snapshot is taken before this returns, from its own read-only connection, so writers
+    keep going while it is copied and the served file holds no half-committed pages. It is
+    written next to the model (never into memory) and deleted once the stream is closed.
+    Stored fits are left out: they are large and importers discard them anyway.
+    """
+    snapshotPath = _temporaryPath(Path(store.modelPath).parent, ".export")
+    try:
+        store.backup(snapshotPath)
+        with closing(sqlite3.connect(snapshotPath, isolation_level=None)) as snapshot:
+            # The copy inherits WAL mode; leave it so every change lands in the file being sent.
+            snapshot.execute("PRAGMA journal_mode=DELETE")
+            _dropFittedModel(snapshot)
+            snapshot.executescript("PRAGMA incremental_vacuum;")
+    except Exception:
+        _unlink(snapshotPath)
+        raise
+    return _streamFile(snapshotPath, compress, chunkSize)
+
+
+def _streamFile(path: str, compress: bool, chunkSize: int) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    try:
+        with open(path, "rb") as snapshot:
+            while chunk := snapshot.read(chunkSize):
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+    finally:
+        _unlink(path)
+
+
+def receiveModel(stream: BinaryIO, directory: Path, modelName: str, chunkSize: int = CHUNK_SIZE,
+                 maxSize: int = MAX_IMPORT_SIZE) -> str:
+    """
+    Write an uploaded model database, raw or gzip-compressed, to a temporary file in
+    `directory`, validate it and rename the model to `modelName`. Returns the path of the
+    checked file; the caller moves it into place or deletes it.
+    """
+    path = _temporaryPath(directory, ".import")
+    try:
+        with open(path, "wb") as target:
+            decompressor = None
+            written = 0
+            first = True
+            while chunk := stream.read(chunkSize):
+                if first:
+                    first = False
+                    if chunk.startswith(GZIP_MAGIC):
+                        decompressor = zlib.decompressobj(31)
+                if decompressor is not None:
+                    # Bounded, so the size check below trips before a bomb is fully expanded.
+                    chunk = decompressor.decompress(chunk, maxSize - written + 1)
+                written += len(chunk)
+                if written > maxSize:
+                    raise ModelImportError("Model database is too large")
+                target.write(chunk)
+            if decompressor is not None and not decompressor.eof:
+                raise ModelImportError("Compressed upload is truncated")
+        validateModel(path, modelName)
+        return path
+    except Exception:
+        _unlink(path)
+        raise
+
+
+def validateModel(path: str, modelName: Optional[str] = None) -> None:
+    """
+    Check that `path` is an intact model database from this or an older version, set its
+    name if one is given and drop its stored fit. Fits are pickles, and unpickling a file
+    from elsewhere could run arbitrary code; the model is refitted from its observations.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(SQLITE_MAGIC)) != SQLITE_MAGIC:
+            raise ModelImportError("Not an SQLite database")
+    try:
+        with closing(sqlite3.connect(path, isolation_level=None)) as db:
+            # Edit the file itself rather than a WAL beside it; the store switches back when it opens.
+            db.execute("PRAGMA journal_mode=DELETE")
+            if db.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                raise ModelImportError("Database failed its integrity check")
+            tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            missing = REQUIRED_TABLES - tables
+            if missing:
+                raise ModelImportError(f"Not a model database, missing tables: {', '.join(sorted(missing))}")
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+            if version > ModelStore.SCHEMA_VERSION:
+                raise ModelImportError(f"Model database is from a newer version (schema {version})")
+            _dropFittedModel(db)
+            if modelName is not None:
+                db.execute("INSERT OR REPLACE INTO Settings (name, value) VALUES ('name', ?)", (modelName,))
+    except sqlite3.DatabaseError as e:
+        raise ModelImportError(f"Unreadable model database: {e}") from e
+
+
+def _dropFittedModel(db: sqlite3.Connection) -> None:
+    if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'FittedModel'").fetchone():
+        db.execute("DELETE FROM FittedModel")
+
+
+def _temporaryPath(directory: Path, suffix: str) -> str:
+    # Same filesystem as the models, so moving an import into place is a rename.
+    descriptor, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+    os.close(descriptor)
+    return path
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,96 @@
+import gzip
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+from ModelStore import ModelStore, loadArtifactKey
+from ModelTransfer import ModelImportError, exportModel, receiveModel
+
+
+class TestModelTransfer(unittest.TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.key = loadArtifactKey(str(self.directory / "artifact.key"))
+        self.store = ModelStore(str(self.directory / "source.db"), groupCommitWindow=10, artifactKey=self.key)
+        self.store.setName("source")
+        with self.store.transaction():
+            for i in range(300):
+                self.store.addObservation(["a", "b"][i % 2], {"rssi": float(i), "media": "tv"}, float(i))
+        self.store.saveFittedModel("hash", {"model": "pickled"})
+
+    def tearDown(self):
+        self.store.close()
+
+    def receive(self, payload: bytes, name: str = "copy") -> ModelStore:
+        path = receiveModel(io.BytesIO(payload), self.directory, name, chunkSize=1000)
+        return ModelStore(path, artifactKey=self.key)
+
+    def test_round_trip(self):
+        for compress in [True, False]:
+            payload = b"".join(exportModel(self.store, compress, chunkSize=1000))
+            self.assertEqual(payload[:2] == b"\x1f\x8b", compress)
+
+            copy = self.receive(payload)
+            # Units still inside the group-commit window are part of the snapshot.
+            self.assertEqual(copy.getObservationCount(), 300)
+            self.assertEqual(copy.getLabelCounts(), {"a": 150, "b": 150})
+            self.assertEqual(copy.getName(), "copy")
+            copy.close()
+
+    def test_fitted_model_is_never_imported(self):
+        path = self.directory / "upload.db"
+        self.store.backup(str(path))
+        copy = self.receive(path.read_bytes())
+        self.assertIsNone(copy.loadFittedModel("hash"))
+        self.assertEqual(copy._db.execute("SELECT COUNT(*) FROM FittedModel").fetchone()[0], 0)
+        copy.close()
+
+    def test_fitted_models_are_signed(self):
+        self.assertEqual(self.store.loadFittedModel("hash"), {"model": "pickled"})
+        self.assertEqual(loadArtifactKey(str(self.directory / "artifact.key")), self.key)
+
+        # A fit stored under another key, or edited afterwards, is never unpickled.
+        path = str(self.directory / "other.db")
+        other = ModelStore(path, artifactKey=b"another installation")
+        other.saveFittedModel("hash", {"model": "pickled"})
+        other.close()
+        for key in [self.key, None]:
+            store = ModelStore(path, artifactKey=key)
+            self.assertIsNone(store.loadFittedModel("hash"))
+            store.close()
+
+        self.store.flush()
+        self.store._db.execute("UPDATE FittedModel SET artifact = ?", (b"tampered",))
+        self.assertIsNone(self.store.loadFittedModel("hash"))
+
+    def test_export_leaves_no_files(self):
+        before = set(os.listdir(self.directory))
+        stream = exportModel(self.store)
+        next(stream)
+        stream.close()
+        self.assertEqual(set(os.listdir(self.directory)), before)
+
+    def test_rejects_invalid_uploads(self):
+        payload = b"".join(exportModel(self.store))
+        before = set(os.listdir(self.directory))
+        for invalid in [b"not a database", gzip.compress(b"not a database"), payload[:len(payload) // 2]]:
+            with self.assertRaises(ModelImportError):
+                self.receive(invalid)
+
+        other = sqlite3.connect(self.directory / "other.db")
+        other.execute("CREATE TABLE Unrelated (x)")
+        other.commit()
+        other.close()
+        with self.assertRaises(ModelImportError):
+            self.receive((self.directory / "other.db").read_bytes())
+        os.unlink(self.directory / "other.db")
+
+        with self.assertRaises(ModelImportError):
+            receiveModel(io.BytesIO(payload), self.directory, "copy", maxSize=1000)
+        self.assertEqual(set(os.listdir(self.directory)), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
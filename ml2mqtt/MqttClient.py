@@ -2,12 +2,23 @@ from collections import defaultdict
 import paho.mqtt.client as mqtt
 import logging
 import time
+from MqttDispatcher import MqttDispatcher
+from utils.helpers import isTrainingPayload
 
 class MqttClient:
     def __init__(self, mqttConfig):
         self.logger = logging.getLogger(__name__)
         self._connected = False
         self.topics = {}
+        # Callbacks run on dispatcher workers, never on paho's network loop thread.
+        self._dispatcher = MqttDispatcher(
+            self._deliver,
+            workers=mqttConfig.get('dispatch_workers'),
+            queueSize=mqttConfig.get('queue_size'),
+            overflowPolicy=mqttConfig.get('overflow_policy'),
+            # Labelled messages are what the model learns from, so overflow never drops them.
+            keep=isTrainingPayload,
+        )
         self._mqttClient = mqtt.Client()
         self._mqttClient.username_pw_set(mqttConfig['username'], mqttConfig['password'])
         self._mqttClient.on_connect = self.onConnect
@@ -46,11 +57,15 @@ class MqttClient:
     def onMessage(self, client, userdata, msg):
         try:
             if msg.topic in self.topics:
-                for callback in self.topics[msg.topic]:
-                    callback(msg.payload.decode('utf-8'))
+                self._dispatcher.submit(msg.topic, msg.payload.decode('utf-8'))
         except Exception as e:
             self.logger.exception("Unhandled exception")
             raise
+
+    def _deliver(self, topic, payload):
+        # Looked up at delivery time so a callback that unsubscribed meanwhile is not called.
+        for callback in list(self.topics.get(topic, [])):
+            callback(payload)
     
     def subscribe(self, topic, callback):
         shouldSubscribe = False
@@ -69,6 +84,7 @@ class MqttClient:
                 self.topics[topic].remove(callback)
                 if len(self.topics[topic]) == 0:
                     del self.topics[topic]
+                    self._dispatcher.discard(topic)
                     self._mqttClient.unsubscribe(topic)
                     self.logger.info("Unsubscribed from topic %s", topic)
             else:
@@ -82,3 +98,11 @@ class MqttClient:
             return
         self.logger.info("Sending message %s to topic %s", message, topic)
         self._mqttClient.publish(topic, message)
+
+    def getQueueStats(self, topic=None):
+        return self._dispatcher.getStats(topic)
+
+    def close(self):
+        self._dispatcher.close(timeout=5)
+        self._mqttClient.loop_stop()
+        self._mqttClient.disconnect()
@@ -0,0 +1,188 @@
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_COALESCE_LATEST = "coalesce_latest"
+OVERFLOW_POLICIES = [OVERFLOW_DROP_OLDEST, OVERFLOW_COALESCE_LATEST]
+
+DEFAULT_DISPATCH_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 100
+
+
+@dataclass
+class TopicQueue:
+    # (payload, kept) in arrival order. Kept messages are never dropped on overflow.
+    messages: Deque[Tuple[str, bool]] = field(default_factory=deque)
+    # True while the topic is waiting for, or held by, a worker.
+    active: bool = False
+    enqueued: int = 0
+    processed: int = 0
+    dropped: int = 0
+    failed: int = 0
+    highWater: int = 0
+    # How many queued messages are kept.
+    kept: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "depth": len(self.messages),
+            "high_water": self.highWater,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+class MqttDispatcher:
+    """
+    Moves message handling off the MQTT network thread.
+
+    Every topic has its own bounded queue. A pool of workers drains the queues, but a topic
+    is only ever held by one worker at a time, so messages on the same topic are handled in
+    arrival order while a slow topic cannot hold up the others. When a queue is full the
+    overflow policy decides what is lost: `drop_oldest` discards the oldest queued message,
+    `coalesce_latest` discards the whole backlog so only the newest message is kept.
+
+    Messages the `keep` predicate accepts, such as labelled training messages, are exempt
+    from both policies: they are never dropped and do not count against the bound, so a full
+    queue of them still takes new messages.
+    """
+
+    def __init__(self, handler: Callable[[str, str], None],
+                 workers: Optional[int] = None,
+                 queueSize: Optional[int] = None,
+                 overflowPolicy: Optional[str] = None,
+                 keep: Optional[Callable[[str], bool]] = None):
+        self._handler = handler
+        self._keep = keep
+        self._logger = logging.getLogger(__name__)
+        self._condition = threading.Condition()
+        self._queues: Dict[str, TopicQueue] = {}
+        self._ready: Deque[Tuple[str, TopicQueue]] = deque()
+        self._closed = False
+
+        self._queueSize = max(1, int(queueSize or DEFAULT_QUEUE_SIZE))
+        if overflowPolicy and overflowPolicy not in OVERFLOW_POLICIES:
+            self._logger.warning(f"Unknown overflow policy {overflowPolicy}, using {OVERFLOW_DROP_OLDEST}")
+            overflowPolicy = None
+        self._overflowPolicy = overflowPolicy or OVERFLOW_DROP_OLDEST
+
+        self._workers: List[threading.Thread] = []
+        for index in range(max(1, int(workers or DEFAULT_DISPATCH_WORKERS))):
+            worker = threading.Thread(target=self._run, name=f"mqtt-dispatch-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, topic: str, payload: str) -> None:
+        # Checked before taking the lock, as it may parse the payload.
+        kept = bool(self._keep and self._keep(payload))
+        with self._condition:
+            if self._closed:
+                return
+            queue = self._queues.get(topic)
+            if queue is None:
+                queue = self._queues[topic] = TopicQueue()
+
+            if not kept and len(queue.messages) - queue.kept >= self._queueSize:
+                self._overflow(queue)
+
+            queue.messages.append((payload, kept))
+            queue.kept += kept
+            queue.enqueued += 1
+            queue.highWater = max(queue.highWater, len(queue.messages))
+            if not queue.active:
+                queue.active = True
+                self._ready.append((topic, queue))
+                self._condition.notify()
+
+    def _overflow(self, queue: TopicQueue) -> None:
+        if not queue.kept:
+            if self._overflowPolicy == OVERFLOW_COALESCE_LATEST:
+                queue.dropped += len(queue.messages)
+                queue.messages.clear()
+            else:
+                queue.dropped += 1
+                queue.messages.popleft()
+            return
+
+        # Drop around the kept messages, leaving them in their place in the order.
+        if self._overflowPolicy == OVERFLOW_COALESCE_LATEST:
+            remaining = deque(message for message in queue.messages if message[1])
+            queue.dropped += len(queue.messages) - len(remaining)
+            queue.messages = remaining
+        else:
+            for index, (_, kept) in enumerate(queue.messages):
+                if not kept:
+                    del queue.messages[index]
+                    queue.dropped += 1
+                    break
+
+    def discard(self, topic: str) -> None:
+        """Forget the queue and counters of a topic nobody listens to any more."""
+        with self._condition:
+            queue = self._queues.get(topic)
+            if queue is None:
+                return
+            queue.messages.clear()
+            queue.kept = 0
+            del self._queues[topic]
+
+    def getStats(self, topic: Optional[str] = None) -> Dict[str, Any]:
+        with self._condition:
+            if topic is not None:
+                queue = self._queues.get(topic)
+                return (queue or TopicQueue()).to_dict()
+            return {
+                "workers": len(self._workers),
+                "queue_size": self._queueSize,
+                "overflow_policy": self._overflowPolicy,
+                "topics": {name: queue.to_dict() for name, queue in self._queues.items()},
+            }
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting messages and let the workers finish what is already queued."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            if worker is not threading.current_thread():
+                worker.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._ready and not self._closed:
+                    self._condition.wait()
+                if not self._ready:
+                    return
+                topic, queue = self._ready.popleft()
+                if self._queues.get(topic) is not queue:
+                    # Discarded while waiting for a worker.
+                    continue
+                payload = None
+                if queue.messages:
+                    payload, kept = queue.messages.popleft()
+                    queue.kept -= kept
+
+            failed = False
+            if payload is not None:
+                try:
+                    self._handler(topic, payload)
+                except Exception:
+                    failed = True
+                    self._logger.exception(f"Handling message on {topic} failed")
+
+            with self._condition:
+                if payload is not None:
+                    queue.processed += 1
+                    queue.failed += failed
+                if queue.messages and self._queues.get(topic) is queue:
+                    # Back of the line, so one busy topic takes turns with the rest.
+                    self._ready.append((topic, queue))
+                    self._condition.notify()
+                else:
+                    queue.active = False
@@ -0,0 +1,129 @@
+import threading
+import time
+import unittest
+
+from MqttDispatcher import MqttDispatcher, OVERFLOW_COALESCE_LATEST, OVERFLOW_DROP_OLDEST
+from utils.helpers import isTrainingPayload
+
+
+class MqttDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def handler(self, topic, payload):
+        self.gate.wait()
+        self.received.append((topic, payload))
+
+    def waitFor(self, dispatcher, count):
+        deadline = time.monotonic() + 5
+        while len(self.received) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        dispatcher.close(timeout=5)
+
+    def testPreservesOrderWithinTopic(self):
+        dispatcher = MqttDispatcher(self.handler, workers=4)
+        for i in range(200):
+            dispatcher.submit(f"topic{i % 3}", str(i))
+        self.waitFor(dispatcher, 200)
+
+        for topic in ["topic0", "topic1", "topic2"]:
+            payloads = [int(payload) for name, payload in self.received if name == topic]
+            self.assertEqual(payloads, sorted(payloads))
+        self.assertEqual(dispatcher.getStats("topic0")["processed"], 67)
+
+    def testSlowTopicDoesNotBlockOthers(self):
+        slow = threading.Event()
+
+        def handler(topic, payload):
+            if topic == "slow":
+                slow.wait(5)
+            self.received.append((topic, payload))
+
+        dispatcher = MqttDispatcher(handler, workers=2)
+        dispatcher.submit("slow", "1")
+        dispatcher.submit("fast", "2")
+        deadline = time.monotonic() + 5
+        while ("fast", "2") not in self.received and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.received, [("fast", "2")])
+        slow.set()
+        self.waitFor(dispatcher, 2)
+
+    def testDropOldest(self):
+        self.gate.clear()
+        dispatcher = MqttDispatcher(self.handler, workers=1, queueSize=3, overflowPolicy=OVERFLOW_DROP_OLDEST)
+        dispatcher.submit("t", "0")
+        time.sleep(0.1)  # the worker now holds "0" and waits on the gate
+        for i in range(1, 6):
+            dispatcher.submit("t", str(i))
+        stats = dispatcher.getStats("t")
+        self.assertEqual((stats["depth"], stats["dropped"], stats["enqueued"]), (3, 2, 6))
+
+        self.gate.set()
+        self.waitFor(dispatcher, 4)
+        self.assertEqual([payload for _, payload in self.received], ["0", "3", "4", "5"])
+
+    def testCoalesceLatest(self):
+        self.gate.clear()
+        dispatcher = MqttDispatcher(self.handler, workers=1, queueSize=3, overflowPolicy=OVERFLOW_COALESCE_LATEST)
+        dispatcher.submit("t", "0")
+        time.sleep(0.1)
+        for i in range(1, 6):
+            dispatcher.submit("t", str(i))
+        self.assertEqual(dispatcher.getStats("t")["dropped"], 3)
+
+        self.gate.set()
+        self.waitFor(dispatcher, 3)
+        self.assertEqual([payload for _, payload in self.received], ["0", "4", "5"])
+
+    def testOverflowKeepsTrainingMessages(self):
+        for policy, expected in [(OVERFLOW_DROP_OLDEST, ["0", "L1", "L2", "L4", "L5", "6", "7"]),
+                                 (OVERFLOW_COALESCE_LATEST, ["0", "L1", "L2", "L4", "L5", "7"])]:
+            self.received = []
+            self.gate.clear()
+            dispatcher = MqttDispatcher(self.handler, workers=1, queueSize=2, overflowPolicy=policy,
+                                        keep=lambda payload: payload.startswith("L"))
+            dispatcher.submit("t", "0")
+            time.sleep(0.1)
+            for payload in ["L1", "L2", "3", "L4", "L5", "6", "7"]:
+                dispatcher.submit("t", payload)
+
+            self.gate.set()
+            self.waitFor(dispatcher, len(expected))
+            self.assertEqual([payload for _, payload in self.received], expected, policy)
+
+    def testTrainingPayloads(self):
+        self.assertTrue(isTrainingPayload('[{"entity_id": "rssi", "state": "-60"}, {"label": "lounge"}]'))
+        self.assertFalse(isTrainingPayload('[{"entity_id": "rssi", "state": "-60"}, {"label": "Disabled"}]'))
+        self.assertFalse(isTrainingPayload('[{"entity_id": "rssi", "state": "-60"}]'))
+        self.assertFalse(isTrainingPayload('{"label": "lounge"}'))
+        self.assertFalse(isTrainingPayload('[{"label": '))
+
+    def testHandlerErrorsAreCounted(self):
+        def handler(topic, payload):
+            raise ValueError(payload)
+
+        dispatcher = MqttDispatcher(handler, workers=1)
+        dispatcher.submit("t", "bad")
+        dispatcher.submit("t", "worse")
+        dispatcher.close(timeout=5)
+        stats = dispatcher.getStats("t")
+        self.assertEqual((stats["processed"], stats["failed"]), (2, 2))
+
+    def testDiscardDropsPendingMessages(self):
+        self.gate.clear()
+        dispatcher = MqttDispatcher(self.handler, workers=1)
+        dispatcher.submit("t", "0")
+        time.sleep(0.1)
+        dispatcher.submit("t", "1")
+        dispatcher.discard("t")
+        self.gate.set()
+        dispatcher.close(timeout=5)
+        self.assertEqual(self.received, [("t", "0")])
+        self.assertEqual(dispatcher.getStats("t")["enqueued"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import math
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+DEFAULT_DEDUPE_CAPACITY = 256
+
+
+def _quantiseValue(value: Any, tolerance: float) -> Any:
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return value
+    if isinstance(value, (int, float)):
+        value = float(value)
+        if math.isnan(value):
+            return None
+        # Same grid as the retention policy's duplicate tolerance.
+        return math.floor(value / tolerance) if tolerance > 0 else value
+    return value
+
+
+class ObservationDeduplicator:
+    """
+    Ingest-time filter for training observations that repeat a recent one.
+
+    Each observation is reduced to a hash of its quantised sensor values: numbers are snapped
+    to a grid of `tolerance` (exact when 0), strings are kept as they are and missing sensors
+    are left out. Every label remembers its last `capacity` hashes in LRU order, and an
+    observation whose hash is already there is reported as a duplicate.
+
+    Not thread-safe; ModelService only calls it while holding its message lock.
+    """
+
+    def __init__(self, tolerance: float = 0.0, capacity: int = DEFAULT_DEDUPE_CAPACITY):
+        self.tolerance = max(0.0, tolerance)
+        self.capacity = max(1, capacity)
+        self._recent: Dict[str, "OrderedDict[int, None]"] = {}
+        self.checked = 0
+        self.suppressed = 0
+
+    def isDuplicate(self, label: str, sensorValues: Dict[str, Any]) -> bool:
+        """Check an observation against the label's recent ones and remember it."""
+        self.checked += 1
+        key = self._hash(sensorValues)
+        recent = self._recent.setdefault(str(label), OrderedDict())
+        if key in recent:
+            recent.move_to_end(key)
+            self.suppressed += 1
+            return True
+        recent[key] = None
+        if len(recent) > self.capacity:
+            recent.popitem(last=False)
+        return False
+
+    def _hash(self, sensorValues: Dict[str, Any]) -> int:
+        quantised = ((name, _quantiseValue(value, self.tolerance)) for name, value in sensorValues.items())
+        return hash(tuple(sorted((name, value) for name, value in quantised if value is not None)))
+
+    def clear(self) -> None:
+        """Forget remembered observations, e.g. after stored ones were deleted."""
+        self._recent.clear()
+
+    def getStats(self) -> Dict[str, int]:
+        return {"checked": self.checked, "suppressed": self.suppressed}
+
+    @classmethod
+    def fromSettings(cls, settings: Dict[str, Any]) -> Optional["ObservationDeduplicator"]:
+        capacity = int(settings.get("ingest_dedupe_capacity") or 0)
+        if capacity <= 0:
+            return None
+        return cls(float(settings.get("ingest_dedupe_tolerance") or 0), capacity)
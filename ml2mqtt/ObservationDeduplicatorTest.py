@@ -0,0 +1,42 @@
+import unittest
+from ObservationDeduplicator import ObservationDeduplicator
+
+
+class TestObservationDeduplicator(unittest.TestCase):
+    def test_exact_duplicates_per_label(self):
+        deduplicator = ObservationDeduplicator()
+        self.assertFalse(deduplicator.isDuplicate("lounge", {"rssi": -60.0, "media": "tv"}))
+        self.assertTrue(deduplicator.isDuplicate("lounge", {"media": "tv", "rssi": -60}))
+        self.assertFalse(deduplicator.isDuplicate("kitchen", {"rssi": -60.0, "media": "tv"}))
+        self.assertFalse(deduplicator.isDuplicate("lounge", {"rssi": -60.5, "media": "tv"}))
+        self.assertEqual(deduplicator.getStats(), {"checked": 4, "suppressed": 1})
+
+    def test_tolerance_and_missing_values(self):
+        deduplicator = ObservationDeduplicator(tolerance=1.0)
+        self.assertFalse(deduplicator.isDuplicate("lounge", {"rssi": -60.2, "door": None}))
+        self.assertTrue(deduplicator.isDuplicate("lounge", {"rssi": "-60.7"}))
+        self.assertTrue(deduplicator.isDuplicate("lounge", {"rssi": -60.9, "power": float("nan")}))
+        self.assertFalse(deduplicator.isDuplicate("lounge", {"rssi": -61.1}))
+
+    def test_lru_capacity(self):
+        deduplicator = ObservationDeduplicator(capacity=2)
+        for value in [1, 2, 1, 3]:
+            deduplicator.isDuplicate("a", {"x": value})
+        # 1 was refreshed by its repeat, so 2 is the one evicted by 3.
+        self.assertTrue(deduplicator.isDuplicate("a", {"x": 1}))
+        self.assertFalse(deduplicator.isDuplicate("a", {"x": 2}))
+
+    def test_clear(self):
+        deduplicator = ObservationDeduplicator()
+        deduplicator.isDuplicate("a", {"x": 1})
+        deduplicator.clear()
+        self.assertFalse(deduplicator.isDuplicate("a", {"x": 1}))
+
+    def test_from_settings(self):
+        self.assertIsNone(ObservationDeduplicator.fromSettings({}))
+        deduplicator = ObservationDeduplicator.fromSettings({"ingest_dedupe_capacity": 10, "ingest_dedupe_tolerance": 0.5})
+        self.assertEqual((deduplicator.capacity, deduplicator.tolerance), (10, 0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from ModelStore import ModelStore
+
+
+class TestObservationMatrixCache(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "test.db")
+        self.store = ModelStore(self.path)
+        with self.store.transaction():
+            for i in range(100):
+                sensors = {"rssi": float(-50 - i % 30), "media": ["tv", "radio"][i % 2]}
+                # A sensor that only appears part way through widens the matrix.
+                if i >= 40:
+                    sensors["power"] = float(i)
+                self.store.addObservation(["kitchen", "lounge", "bedroom"][i % 3], sensors, float(i))
+        self.cached = self.store.getObservationMatrix()
+
+    def tearDown(self):
+        self.store.close()
+
+    def add(self, label, observationTime, **sensors):
+        # Every known sensor needs a value once it exists.
+        values = {"rssi": -40.0, "media": "tv", "power": 5.0, **sensors}
+        self.store.addObservation(label, self.store.sortEntityValues(values, True), observationTime)
+
+    def assertMatchesDatabase(self):
+        """The cache, after whatever was done to it, must equal a fresh load of the table."""
+        cached = self.store.getObservationMatrix()
+        self.store._features = None
+        loaded = self.store.getObservationMatrix()
+        self.assertEqual([key.name for key in cached.entityKeys], [key.name for key in loaded.entityKeys])
+        np.testing.assert_array_equal(cached.features, loaded.features)
+        np.testing.assert_array_equal(cached.labels, loaded.labels)
+        np.testing.assert_array_equal(cached.times, loaded.times)
+        self.assertEqual(len(cached), self.store._db.execute("SELECT COUNT(*) FROM Observations").fetchone()[0])
+        return cached
+
+    def test_appends_and_new_sensors(self):
+        self.add("garage", 100.0, door="open")
+        matrix = self.assertMatchesDatabase()
+        self.assertEqual(len(matrix), 101)
+        self.assertEqual(matrix.toDataFrame()["door"].iloc[-1], "open")
+
+    def test_deletes(self):
+        self.store.deleteObservationsByLabel("lounge")
+        self.assertMatchesDatabase()
+        self.store.deleteObservation(3)
+        self.assertMatchesDatabase()
+        self.store.deleteObservationsSince(90.0)
+        matrix = self.assertMatchesDatabase()
+        self.assertNotIn("lounge", set(matrix.labels))
+        self.assertLess(matrix.times.max(), 90.0)
+
+    def test_delete_entity_rebuilds_columns(self):
+        self.store.deleteEntity("media")
+        matrix = self.assertMatchesDatabase()
+        self.assertNotIn("media", [key.name for key in matrix.entityKeys])
+
+    def test_rollback_drops_uncommitted_rows(self):
+        with self.assertRaises(RuntimeError):
+            with self.store.transaction():
+                self.add("garage", 100.0)
+                self.assertEqual(len(self.store.getObservationMatrix()), 101)
+                raise RuntimeError("abandon the unit of work")
+        matrix = self.assertMatchesDatabase()
+        self.assertEqual(len(matrix), 100)
+
+    def test_snapshots_are_not_changed_by_later_writes(self):
+        labels = self.cached.labels.copy()
+        features = self.cached.features.copy()
+        self.store.deleteObservationsByLabel("kitchen")
+        for i in range(50):
+            self.add("garage", 200.0 + i)
+        self.assertEqual(len(self.store.getObservationMatrix()), 116)
+        np.testing.assert_array_equal(self.cached.labels, labels)
+        np.testing.assert_array_equal(self.cached.features, features)
+
+    def test_reopened_store_matches(self):
+        self.store.deleteObservation(5)
+        self.add("garage", 100.0)
+        before = self.store.getObservationMatrix()
+        self.assertEqual(len(before), 100)
+        self.store.close()
+        self.store = ModelStore(self.path)
+        after = self.store.getObservationMatrix()
+        np.testing.assert_array_equal(before.features, after.features)
+        np.testing.assert_array_equal(before.times, after.times)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, Tuple
+import numpy as np
+
+
+@dataclass
+class RetentionPolicy:
+    """Limits ModelStore.compact() applies to the Observations table. Zero disables a limit."""
+    maxRows: int = 0
+    maxAge: float = 0.0            # seconds
+    maxPerLabel: int = 0
+    dedupeTolerance: float = 0.0   # float sensors closer than this count as the same reading
+
+    def isEnabled(self) -> bool:
+        return self.maxRows > 0 or self.maxAge > 0 or self.maxPerLabel > 0 or self.dedupeTolerance > 0
+
+    @classmethod
+    def fromSettings(cls, settings: Dict[str, Any]) -> "RetentionPolicy":
+        return cls(
+            maxRows=max(0, int(settings.get("retention_max_rows") or 0)),
+            maxAge=max(0.0, float(settings.get("retention_max_age_days") or 0)) * 86400,
+            maxPerLabel=max(0, int(settings.get("retention_max_per_label") or 0)),
+            dedupeTolerance=max(0.0, float(settings.get("retention_dedupe_tolerance") or 0)),
+        )
+
+
+@dataclass
+class CompactionResult:
+    expired: int = 0
+    duplicates: int = 0
+    sampled: int = 0
+    trimmed: int = 0
+    reclaimedPages: int = 0
+    removedTimes: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.float64))
+
+    @property
+    def removed(self) -> int:
+        return self.expired + self.duplicates + self.sampled + self.trimmed
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "removed": self.removed,
+            "expired": self.expired,
+            "duplicates": self.duplicates,
+            "sampled": self.sampled,
+            "trimmed": self.trimmed,
+            "reclaimed_pages": self.reclaimedPages,
+        }
+
+
+def quantise(features: np.ndarray, floatColumns: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Snap float columns onto a grid of `tolerance` so near-identical readings compare equal.
+    Other columns (string ids) are left exact and missing values become +inf.
+    """
+    quantised = features.astype(np.float64, copy=True)
+    quantised[:, floatColumns] = np.floor(quantised[:, floatColumns] / tolerance)
+    quantised[np.isnan(quantised)] = np.inf
+    return quantised
+
+
+def duplicateRows(features: np.ndarray, labels: np.ndarray, floatColumns: np.ndarray, tolerance: float) -> np.ndarray:
+    """Flag every row with a later row of the same label and the same quantised values."""
+    count = len(labels)
+    if count == 0:
+        return np.zeros(0, dtype=bool)
+    _, labelCodes = np.unique(labels.astype(str), return_inverse=True)
+    keys = np.column_stack([labelCodes.astype(np.float64), quantise(features, floatColumns, tolerance)])
+    _, groups = np.unique(keys, axis=0, return_inverse=True)
+    groups = groups.reshape(-1)
+    newest = np.full(groups.max() + 1, -1, dtype=np.int64)
+    np.maximum.at(newest, groups, np.arange(count))
+    return newest[groups] != np.arange(count)
+
+
+def selectForRemoval(features: np.ndarray, labels: np.ndarray, times: np.ndarray, sampleKeys: np.ndarray,
+                     floatColumns: np.ndarray, policy: RetentionPolicy, now: float) -> Tuple[np.ndarray, CompactionResult]:
+    """
+    Decide which rows (in insertion order) a policy removes.
+
+    Limits apply in order: rows older than maxAge; near-duplicates, keeping the newest of each
+    group; per-label reservoirs, keeping the maxPerLabel rows with the lowest sample keys; and
+    finally the oldest rows beyond maxRows. Sample keys are drawn uniformly once per row, so the
+    lowest keys of a label are a uniform sample of everything it has ever stored, however many
+    compactions ran in between.
+    """
+    result = CompactionResult()
+    removed = np.zeros(len(labels), dtype=bool)
+
+    if policy.maxAge > 0:
+        expired = times < now - policy.maxAge
+        result.expired = int(expired.sum())
+        removed |= expired
+
+    if policy.dedupeTolerance > 0:
+        remaining = np.flatnonzero(~removed)
+        duplicates = remaining[duplicateRows(features[remaining], labels[remaining], floatColumns, policy.dedupeTolerance)]
+        result.duplicates = len(duplicates)
+        removed[duplicates] = True
+
+    if policy.maxPerLabel > 0:
+        labelStrings = labels.astype(str)
+        for label in np.unique(labelStrings[~removed]):
+            candidates = np.flatnonzero((labelStrings == label) & ~removed)
+            if len(candidates) <= policy.maxPerLabel:
+                continue
+            dropped = candidates[np.argsort(sampleKeys[candidates], kind="stable")[policy.maxPerLabel:]]
+            result.sampled += len(dropped)
+            removed[dropped] = True
+
+    if policy.maxRows > 0:
+        remaining = np.flatnonzero(~removed)
+        if len(remaining) > policy.maxRows:
+            dropped = remaining[:len(remaining) - policy.maxRows]
+            result.trimmed = len(dropped)
+            removed[dropped] = True
+
+    result.removedTimes = times[removed].astype(np.float64)
+    return removed, result
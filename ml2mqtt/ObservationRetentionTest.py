@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+import numpy as np
+from ModelStore import ModelStore
+from ObservationRetention import RetentionPolicy, duplicateRows, selectForRemoval
+
+
+class TestObservationRetention(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.count = 1000
+        self.features = np.column_stack([rng.normal(size=self.count), rng.integers(1, 4, self.count).astype(np.float64)])
+        self.labels = np.array(["a", "b", "c", "c"], dtype=object)[rng.integers(0, 4, self.count)]
+        self.times = np.arange(self.count, dtype=np.float64)
+        self.sampleKeys = rng.integers(-2**62, 2**62, self.count)
+        self.floatColumns = np.array([True, False])
+
+    def select(self, policy, now=1000.0):
+        return selectForRemoval(self.features, self.labels, self.times, self.sampleKeys, self.floatColumns, policy, now)
+
+    def test_disabled_policy_keeps_everything(self):
+        removed, result = self.select(RetentionPolicy())
+        self.assertFalse(removed.any())
+        self.assertEqual(result.removed, 0)
+
+    def test_max_age_and_max_rows(self):
+        removed, result = self.select(RetentionPolicy(maxAge=600, maxRows=300))
+        self.assertEqual(result.expired, 400)
+        self.assertEqual(result.trimmed, 300)
+        np.testing.assert_array_equal(np.flatnonzero(~removed), np.arange(700, 1000))
+        np.testing.assert_array_equal(result.removedTimes, self.times[removed])
+
+    def test_per_label_reservoir(self):
+        removed, result = self.select(RetentionPolicy(maxPerLabel=100))
+        kept = self.labels[~removed]
+        for label in ["a", "b", "c"]:
+            self.assertEqual((kept == label).sum(), 100)
+            candidates = np.flatnonzero(self.labels == label)
+            lowest = candidates[np.argsort(self.sampleKeys[candidates])[:100]]
+            self.assertFalse(removed[lowest].any())
+        self.assertEqual(result.sampled, self.count - 300)
+
+    def test_duplicates_keep_newest(self):
+        features = np.array([[1.00, 1], [1.04, 1], [1.00, 2], [1.00, 1], [np.nan, 1], [np.nan, 1]])
+        labels = np.array(["a", "a", "a", "b", "a", "a"], dtype=object)
+        duplicates = duplicateRows(features, labels, self.floatColumns, 0.1)
+        np.testing.assert_array_equal(duplicates, [True, False, False, False, True, False])
+
+    def test_compact_store(self):
+        store = ModelStore(os.path.join(tempfile.mkdtemp(), "test.db"))
+        with store.transaction():
+            for i in range(600):
+                store.addObservation(["a", "b"][i % 3 == 0], {"rssi": float(i % 50), "media": "tv"}, float(i))
+
+        result = store.compact(RetentionPolicy(maxPerLabel=150, dedupeTolerance=1.0), now=600.0)
+        self.assertEqual(result.duplicates, 600 - 100)
+        self.assertEqual(store.getLabelCounts(), {"a": 50, "b": 50})
+        matrix = store.getObservationMatrix()
+        self.assertEqual(len(matrix), 100)
+        self.assertTrue((matrix.times >= 450).all())
+        self.assertEqual(store._db.execute("PRAGMA freelist_count").fetchone()[0], 0)
+        store.close()
+
+
+    def test_new_files_use_incremental_vacuum(self):
+        store = ModelStore(os.path.join(tempfile.mkdtemp(), "test.db"))
+        self.assertEqual(store._db.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        self.assertEqual(store._db.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        store.close()
+
+    def test_existing_files_are_not_vacuumed_on_open(self):
+        path = os.path.join(tempfile.mkdtemp(), "test.db")
+        legacy = sqlite3.connect(path)
+        legacy.execute("CREATE TABLE Unrelated (x)")
+        legacy.executemany("INSERT INTO Unrelated VALUES (?)", [("x" * 1000,)] * 100)
+        legacy.execute("DELETE FROM Unrelated")
+        legacy.commit()
+        legacy.close()
+        freePages = os.path.getsize(path)
+
+        store = ModelStore(path)
+        # A VACUUM would have switched the mode and dropped the free pages.
+        self.assertEqual(store._db.execute("PRAGMA auto_vacuum").fetchone()[0], 0)
+        self.assertGreater(store._db.execute("PRAGMA freelist_count").fetchone()[0], 0)
+        with store.transaction():
+            for i in range(300):
+                store.addObservation(["a", "b"][i % 2], {"rssi": float(i)}, float(i))
+        store.compact(RetentionPolicy(maxRows=10), now=300.0)
+        self.assertEqual(store.getObservationCount(), 10)
+        store.close()
+        self.assertGreaterEqual(os.path.getsize(path), freePages)
+
+
+if __name__ == '__main__':
+    unittest.main()
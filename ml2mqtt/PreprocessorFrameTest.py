@@ -0,0 +1,137 @@
+import os
+import random
+import tempfile
+import unittest
+from ModelStore import ModelObservation, ModelStore
+from preprocessors.base import ObservationFrame
+from preprocessors.null_handler import NullHandler
+from preprocessors.rolling_average import RollingAverage
+from preprocessors.temporal_expander import TemporalExpander
+from preprocessors.type_caster import TypeCaster
+
+
+def makeStream(count, seed=0):
+    """Messages like Home Assistant sends: string states, unknowns, and sensors that come and go."""
+    rng = random.Random(seed)
+    stream = []
+    for _ in range(count):
+        message = {}
+        if rng.random() < 0.9:
+            message["rssi"] = rng.choice([str(round(rng.gauss(-70, 8), 1)), "unavailable", None])
+        if rng.random() < 0.7:
+            message["power"] = rng.choice([rng.uniform(0, 200), None])
+        message["media"] = rng.choice(["tv", "radio", "Unknown"])
+        stream.append(message)
+    return stream
+
+
+def processOneByOne(preprocessor, stream):
+    state = {}
+    return [preprocessor.process(message, state) for message in stream]
+
+
+class TestObservationFrame(unittest.TestCase):
+    def assertSameObservations(self, actual, expected):
+        self.assertEqual(len(actual), len(expected))
+        for row, (a, e) in enumerate(zip(actual, expected)):
+            self.assertEqual(set(a), set(e), f"row {row}")
+            for key in e:
+                if isinstance(e[key], float) and isinstance(a[key], float):
+                    self.assertAlmostEqual(a[key], e[key], places=3, msg=f"row {row} {key}")
+                else:
+                    self.assertEqual(a[key], e[key], f"row {row} {key}")
+
+    def assertFrameMatchesProcess(self, preprocessor, stream):
+        frame = ObservationFrame.fromObservations(stream)
+        self.assertSameObservations(preprocessor.process_frame(frame).toObservations(),
+                                    processOneByOne(preprocessor, stream))
+
+    def test_round_trip_keeps_missing_and_none_apart(self):
+        stream = [{"a": None}, {"b": 1.0}, {}, {"a": "x", "b": None}]
+        self.assertEqual(ObservationFrame.fromObservations(stream).toObservations(), stream)
+
+    def test_type_caster(self):
+        self.assertFrameMatchesProcess(TypeCaster(1, sensor="SELECT_ALL"), makeStream(300))
+
+    def test_null_handler(self):
+        stream = processOneByOne(TypeCaster(1, sensor="SELECT_ALL"), makeStream(300))
+        self.assertFrameMatchesProcess(NullHandler(2, sensor="SELECT_ALL", replacementType="float", nullReplacement="-100"), stream)
+        self.assertFrameMatchesProcess(NullHandler(2, sensor="media", replacementType="string", nullReplacement="off"), stream)
+
+    def test_rolling_average(self):
+        stream = processOneByOne(TypeCaster(1, sensor="SELECT_ALL"), makeStream(300))
+        stream = [{k: v for k, v in message.items() if k != "media"} for message in stream]
+        for windowSize in [1, 3, 10]:
+            self.assertFrameMatchesProcess(RollingAverage(3, sensor="SELECT_ALL", windowSize=windowSize), stream)
+
+    def test_temporal_expander(self):
+        for lookback in [1, 3]:
+            self.assertFrameMatchesProcess(TemporalExpander(4, sensor=[{"rssi": True}, {"media": True}], lookback=lookback),
+                                           makeStream(100))
+
+    def test_pipeline(self):
+        stream = makeStream(200)
+        pipeline = [
+            TypeCaster(1, sensor="SELECT_ALL"),
+            RollingAverage(2, sensor="rssi", windowSize=5),
+            TemporalExpander(3, sensor="rssi", lookback=2),
+            NullHandler(4, sensor="SELECT_ALL", replacementType="float", nullReplacement="0"),
+        ]
+        expected = stream
+        frame = ObservationFrame.fromObservations(stream)
+        for preprocessor in pipeline:
+            expected = processOneByOne(preprocessor, expected)
+            frame = preprocessor.process_frame(frame)
+        self.assertSameObservations(frame.toObservations(), expected)
+
+
+class TestRawSamples(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "test.db")
+
+    def test_raw_samples_are_pruned_to_the_limit(self):
+        store = ModelStore(self.path, maxRawSamples=600)
+        for i in range(1200):
+            store.addRawSample({"rssi": str(i)}, "lounge" if i % 2 else None, float(i))
+        samples = store.getRawSamples()
+        self.assertLessEqual(len(samples), 1100)
+        self.assertEqual(samples[-1], (1199.0, "lounge", {"rssi": "1199"}))
+        store.close()
+
+    def test_pruning_never_drops_labelled_samples(self):
+        store = ModelStore(self.path, maxRawSamples=500)
+        store.addRawSamples([(float(i), "lounge", {"rssi": str(i)}) for i in range(400)])
+        store.addRawSamples([(float(i), None, {"rssi": str(i)}) for i in range(400, 1000)])
+        labels = [label for _, label, _ in store.getRawSamples()]
+        # Unlabelled rows go first, and past the limit labelled ones are kept regardless.
+        self.assertEqual(labels.count("lounge"), 400)
+        self.assertEqual(len(labels), 500)
+        store.addRawSamples([(float(i), "kitchen", {"rssi": str(i)}) for i in range(1000, 1500)])
+        self.assertEqual([label for _, label, _ in store.getRawSamples()].count(None), 0)
+        self.assertEqual(store.getRawSampleCount(), 900)
+        store.close()
+
+    def test_deleting_observations_unlabels_their_raw_samples(self):
+        store = ModelStore(self.path)
+        for i, label in enumerate(["lounge", "kitchen", "lounge", "kitchen"]):
+            store.addObservation(label, {"rssi": -60.0 - i}, float(i))
+            store.addRawSample({"rssi": str(-60 - i)}, label, float(i))
+        store.deleteObservation(0.0)
+        store.deleteObservationsByLabel("kitchen")
+        self.assertEqual([label for _, label, _ in store.getRawSamples()], [None, None, "lounge", None])
+        store.close()
+
+    def test_replace_observations_rebuilds_sensor_keys(self):
+        store = ModelStore(self.path)
+        store.addObservation("lounge", {"rssi": -60.0, "rssi_0": -61.0}, 1.0)
+        store.replaceObservations([ModelObservation(1.0, "lounge", {"rssi": -60.5}),
+                                   ModelObservation(2.0, "kitchen", {"rssi": -80.0})])
+        self.assertEqual([key.name for key in store.getEntityKeys()], ["rssi"])
+        matrix = store.getObservationMatrix()
+        self.assertEqual(matrix.labels.tolist(), ["lounge", "kitchen"])
+        self.assertEqual(matrix.features[:, 0].tolist(), [-60.5, -80.0])
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
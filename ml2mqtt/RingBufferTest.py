@@ -0,0 +1,106 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from ModelStore import ModelStore
+from preprocessors.ring_buffer import RingBuffer
+from preprocessors.rolling_average import RollingAverage
+from preprocessors.temporal_expander import TemporalExpander
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_mean_matches_a_plain_window(self):
+        rng = random.Random(0)
+        buffer = RingBuffer(7)
+        window = []
+        for _ in range(500):
+            value = None if rng.random() < 0.2 else rng.uniform(-100, 100)
+            buffer.append(value)
+            window = (window + [value])[-7:]
+            known = [v for v in window if v is not None]
+            expected = sum(known) / len(known) if known else None
+            if expected is None:
+                self.assertIsNone(buffer.mean())
+            else:
+                self.assertAlmostEqual(buffer.mean(), expected, places=9)
+        self.assertEqual(buffer.tolist(), window)
+
+    def test_object_buffer_keeps_values(self):
+        buffer = RingBuffer(3, numeric=False)
+        for value in ["tv", 5, None, "radio"]:
+            buffer.append(value)
+        self.assertEqual(buffer.tolist(), [5, None, "radio"])
+        self.assertEqual(buffer[0], 5)
+
+    def test_serialises_compactly_and_restores(self):
+        buffer = RingBuffer.fromValues(4, [1.5, None, -2.0, 3.25, 8.0])
+        stored = json.loads(json.dumps(buffer.to_dict()))
+        self.assertIsInstance(stored["values"], str)
+        restored = RingBuffer.fromState(stored, 4)
+        self.assertEqual(restored.tolist(), [None, -2.0, 3.25, 8.0])
+        self.assertEqual(restored.mean(), buffer.mean())
+
+    def test_restores_legacy_lists_and_resizes(self):
+        self.assertEqual(RingBuffer.fromState([1, 2, 3, 4], 2).tolist(), [3.0, 4.0])
+        self.assertEqual(RingBuffer.fromState(RingBuffer.fromValues(3, [1, 2, 3]), 5).tolist(), [1.0, 2.0, 3.0])
+        self.assertEqual(len(RingBuffer.fromState(None, 3)), 0)
+
+    def test_zero_size(self):
+        buffer = RingBuffer(0, numeric=False)
+        buffer.append("x")
+        self.assertEqual(buffer.tolist(), [])
+
+
+class TestPreprocessorState(unittest.TestCase):
+    def test_state_survives_a_store_round_trip(self):
+        store = ModelStore(os.path.join(tempfile.mkdtemp(), "test.db"))
+        rng = random.Random(1)
+        stream = [{"rssi": rng.choice([None, rng.uniform(-90, -40)]), "media": rng.choice(["tv", "radio"])}
+                  for _ in range(60)]
+        pipeline = [RollingAverage(1, sensor="rssi", windowSize=5), TemporalExpander(2, sensor="SELECT_ALL", lookback=3)]
+
+        def run(messages, states):
+            outputs = []
+            for message in messages:
+                for preprocessor in pipeline:
+                    message = preprocessor.process(message, states.setdefault(str(preprocessor.dbId), {}))
+                outputs.append(message)
+            return outputs
+
+        uninterrupted = run(stream, {})
+        states = {}
+        first = run(stream[:30], states)
+        store.saveDict("processor_storage", states)
+        second = run(stream[30:], store.getDict("processor_storage"))
+        self.assertEqual(first + second, uninterrupted)
+        store.close()
+
+    def test_legacy_state_is_picked_up(self):
+        preprocessor = RollingAverage(1, sensor="SELECT_ALL", windowSize=3)
+        state = {"rollingData": {"rssi": [-60, None, -70]}}
+        self.assertEqual(preprocessor.process({"rssi": -80}, state), {"rssi": -75.0})
+
+
+    def test_float_sizes_keep_their_buffers(self):
+        # Sizes from the UI arrive as floats; a fractional one must not rebuild the buffer on every message.
+        average = RollingAverage(1, sensor="SELECT_ALL", windowSize=3.5)
+        expander = TemporalExpander(2, sensor="SELECT_ALL", lookback=2.5)
+        averageState, expanderState = {}, {}
+        for value in [-60, -70, -80]:
+            average.process({"rssi": value}, averageState)
+            expander.process({"rssi": value}, expanderState)
+        window = averageState["rollingData"]["rssi"]
+        self.assertEqual(average.process({"rssi": -90}, averageState), {"rssi": -80.0})
+        self.assertIs(averageState["rollingData"]["rssi"], window)
+        self.assertEqual(expander.process({"rssi": -90}, expanderState),
+                         {"rssi": -90, "rssi_0": -70, "rssi_1": -80})
+
+    def test_sizes_below_one_are_rejected(self):
+        with self.assertRaises(ValueError):
+            RollingAverage(1, sensor="SELECT_ALL", windowSize=0)
+        with self.assertRaises(ValueError):
+            TemporalExpander(2, sensor="SELECT_ALL", lookback=0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import copy
+import logging
+import threading
+from typing import Any, Dict, Optional, Set
+
+from ModelStore import ModelStore
+
+DEFAULT_FLUSH_INTERVAL = 10.0
+
+
+class StateCache:
+    """
+    Write-behind cache for the JSON dictionaries ModelService keeps in the Settings table.
+
+    Hot-path state (message history, preprocessor state) is mutated in memory and marked
+    dirty; dirty entries are written back to the ModelStore by a timer or on close().
+    Callers that mutate a cached dictionary in place must hold `lock` while doing so.
+    """
+
+    def __init__(self, modelstore: ModelStore, flushInterval: float = DEFAULT_FLUSH_INTERVAL):
+        self._modelstore = modelstore
+        self._flushInterval = flushInterval
+        self._logger = logging.getLogger(__name__)
+        self.lock = threading.RLock()
+        self._dicts: Dict[str, Dict[str, Any]] = {}
+        self._dirty: Set[str] = set()
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+
+    def getDict(self, name: str) -> Dict[str, Any]:
+        """Return the live cached dictionary, loading it from the ModelStore on first use."""
+        with self.lock:
+            if name not in self._dicts:
+                self._dicts[name] = self._modelstore.getDict(name) or {}
+            return self._dicts[name]
+
+    def setDict(self, name: str, value: Dict[str, Any]) -> None:
+        """Replace a dictionary and write it through to the ModelStore immediately."""
+        with self.lock:
+            self._dicts[name] = value
+            self._dirty.discard(name)
+            self._modelstore.saveDict(name, value)
+
+    def markDirty(self, name: str) -> None:
+        """Schedule a write-back of a dictionary that was mutated in place."""
+        with self.lock:
+            self._dirty.add(name)
+            if self._timer is None and not self._closed:
+                self._timer = threading.Timer(self._flushInterval, self._onTimer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self) -> None:
+        with self.lock:
+            pending = {name: copy.deepcopy(self._dicts[name]) for name in self._dirty}
+            self._dirty.clear()
+
+        if not pending:
+            return
+        # One commit for the whole flush rather than one per dictionary.
+        with self._modelstore.transaction():
+            for name, value in pending.items():
+                try:
+                    self._modelstore.saveDict(name, value)
+                except Exception:
+                    self._logger.exception("Failed to flush cached state '%s'", name)
+
+    def close(self) -> None:
+        with self.lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self.flush()
+
+    def _onTimer(self) -> None:
+        with self.lock:
+            self._timer = None
+        self.flush()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+import unittest
+from ModelStore import ModelStore
+from StateCache import StateCache
+
+
+class TestStateCache(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "test.db")
+        self.store = ModelStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_dirty_state_is_written_behind(self):
+        cache = StateCache(self.store, flushInterval=0.05)
+        with cache.lock:
+            cache.getDict("processor_storage")["1"] = {"window": [1, 2]}
+            cache.markDirty("processor_storage")
+        self.assertEqual(self.store.getDict("processor_storage"), {})
+
+        deadline = time.monotonic() + 5
+        while not self.store.getDict("processor_storage") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.store.getDict("processor_storage"), {"1": {"window": [1, 2]}})
+        self.assertIsNone(cache._timer)
+        cache.close()
+
+    def test_flush_writes_a_snapshot(self):
+        cache = StateCache(self.store, flushInterval=60)
+        state = cache.getDict("mqtt_observations")
+        with cache.lock:
+            state["history"] = [{"rssi": -60}]
+            cache.markDirty("mqtt_observations")
+        cache.flush()
+        # Changes after the flush wait for the next markDirty().
+        with cache.lock:
+            state["history"].append({"rssi": -70})
+        cache.flush()
+        self.assertEqual(self.store.getDict("mqtt_observations"), {"history": [{"rssi": -60}]})
+        cache.close()
+
+    def test_set_dict_writes_through(self):
+        cache = StateCache(self.store, flushInterval=60)
+        with cache.lock:
+            cache.getDict("model_settings")["model_type"] = "KNN"
+            cache.markDirty("model_settings")
+        cache.setDict("model_settings", {"model_type": "RandomForest"})
+        self.assertEqual(self.store.getDict("model_settings"), {"model_type": "RandomForest"})
+        self.assertEqual(cache._dirty, set())
+        cache.close()
+
+    def test_close_flushes_and_stops_the_timer(self):
+        cache = StateCache(self.store, flushInterval=60)
+        with cache.lock:
+            cache.getDict("processor_storage")["1"] = {"sum": 3}
+            cache.markDirty("processor_storage")
+        self.assertIsNotNone(cache._timer)
+        cache.close()
+        self.assertIsNone(cache._timer)
+
+        # Nothing is scheduled once closed.
+        cache.markDirty("processor_storage")
+        self.assertIsNone(cache._timer)
+
+        self.store.close()
+        self.store = ModelStore(self.path)
+        self.assertEqual(StateCache(self.store).getDict("processor_storage"), {"1": {"sum": 3}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from ModelStore import ModelStore
+
+
+class TestStringTable(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "test.db")
+
+    def decoded(self, store):
+        return sorted(observation.sensorValues["media"] for observation in store.getObservations())
+
+    def test_incremental_interning_keeps_ids(self):
+        store = ModelStore(self.path)
+        for i, media in enumerate(["tv", "radio", "tv", "off"]):
+            store.addObservation("lounge", {"media": media}, float(i))
+        ids = dict(store._stringTable)
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(store._getStringId("radio"), ids["radio"])
+        store.close()
+
+        reopened = ModelStore(self.path)
+        self.assertEqual(reopened._stringTable, ids)
+        self.assertEqual(self.decoded(reopened), ["off", "radio", "tv", "tv"])
+        reopened.close()
+
+    def test_bulk_interning(self):
+        store = ModelStore(self.path)
+        existing = store.internStrings(["tv"])["tv"]
+        ids = store.internStrings(["radio", "tv", "radio", "off"])
+        self.assertEqual(set(ids), {"radio", "tv", "off"})
+        self.assertEqual(ids["tv"], existing)
+        self.assertEqual(len(set(ids.values())), 3)
+        self.assertEqual({name: store._reverseStringTable[stringId] for name, stringId in ids.items()},
+                         {"radio": "radio", "tv": "tv", "off": "off"})
+        store.close()
+        self.assertEqual(ModelStore(self.path)._stringTable, ids)
+
+    def test_eviction_keeps_strings_in_use(self):
+        store = ModelStore(self.path, maxStrings=2)
+        for i, media in enumerate(["tv", "radio", "off", "game"]):
+            store.addObservation("lounge" if i < 2 else "kitchen", {"media": media}, float(i))
+        # Every string is still referenced, so the cap is exceeded rather than data lost.
+        self.assertEqual(self.decoded(store), ["game", "off", "radio", "tv"])
+        highestId = max(store._reverseStringTable)
+
+        store.deleteObservationsByLabel("lounge")
+        store.addObservation("kitchen", {"media": "music"}, 5.0)
+        self.assertEqual(set(store._stringTable), {"off", "game", "music"})
+        self.assertEqual(self.decoded(store), ["game", "music", "off"])
+        store.close()
+
+        reopened = ModelStore(self.path, maxStrings=2)
+        self.assertEqual(self.decoded(reopened), ["game", "music", "off"])
+        # Ids of evicted strings are never handed out again.
+        self.assertGreater(reopened.internStrings(["tv"])["tv"], highestId + 1)
+        reopened.close()
+
+    def test_bulk_interned_strings_are_not_evicted_before_use(self):
+        store = ModelStore(self.path, maxStrings=1)
+        ids = store.internStrings(["tv", "radio", "off"])
+        self.assertEqual(set(store._stringTable), set(ids))
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import json
+import random
+import unittest
+from unittest import mock
+from ModelStore import _stateToJson
+from postprocessors.time_window_vote import TimeWindowVotePostprocessor
+from preprocessors.base import ObservationFrame
+from preprocessors.exponential_average import ExponentialMovingAverage
+from preprocessors.resampled_lag import IntervalHistory, ResampledLag
+
+
+def makeTimedStream(count, seed=0):
+    """Messages with irregular gaps and bursts, as (time, message)."""
+    rng = random.Random(seed)
+    now = 1_700_000_000.0
+    stream = []
+    for _ in range(count):
+        now += rng.choice([0.0, 0.01, 0.5, 3.0, 11.0])
+        message = {"media": rng.choice(["tv", "radio", None])}
+        if rng.random() < 0.8:
+            message["rssi"] = rng.choice([None, round(rng.uniform(-90, -40), 1)])
+        stream.append((now, message))
+    return stream
+
+
+class TestExponentialMovingAverage(unittest.TestCase):
+    def test_weights_halve_every_half_life(self):
+        preprocessor = ExponentialMovingAverage(1, sensor="SELECT_ALL", halfLife=10)
+        state = {}
+        self.assertEqual(preprocessor.processAt({"rssi": -80}, state, 100.0), {"rssi": -80.0})
+        # The first reading has half the weight of the second: (-80 * 0.5 - 50) / 1.5
+        self.assertEqual(preprocessor.processAt({"rssi": -50}, state, 110.0), {"rssi": -60.0})
+        self.assertEqual(preprocessor.processAt({"rssi": None}, state, 500.0), {"rssi": -60.0})
+
+    def test_bursts_do_not_shorten_the_memory(self):
+        preprocessor = ExponentialMovingAverage(1, sensor="SELECT_ALL", halfLife=60)
+        state = {}
+        preprocessor.processAt({"rssi": -40}, state, 0.0)
+        # Readings in a burst each count, but the burst stops counting once it is old, not
+        # once some number of newer messages has arrived.
+        for _ in range(50):
+            burst = preprocessor.processAt({"rssi": -40}, state, 1.0)
+        for _ in range(50):
+            burst = preprocessor.processAt({"rssi": -90}, state, 1.0)
+        self.assertAlmostEqual(burst["rssi"], -64.7553, places=3)
+        later = preprocessor.processAt({"rssi": -40}, state, 3601.0)
+        self.assertAlmostEqual(later["rssi"], -40.0, places=3)
+
+    def test_state_is_json(self):
+        preprocessor = ExponentialMovingAverage(1, sensor="rssi", halfLife=5)
+        state = {}
+        for observationTime, message in makeTimedStream(50):
+            preprocessor.processAt(message, state, observationTime)
+        json.dumps(state)
+
+    def test_rejects_non_positive_half_life(self):
+        with self.assertRaises(ValueError):
+            ExponentialMovingAverage(1, sensor="SELECT_ALL", halfLife=0)
+
+
+class TestResampledLag(unittest.TestCase):
+    def test_lags_are_values_held_at_interval_ends(self):
+        preprocessor = ResampledLag(1, sensor="rssi", interval=10, steps=2)
+        state = {}
+        preprocessor.processAt({"rssi": -70}, state, 1.0)
+        preprocessor.processAt({"rssi": -60}, state, 9.0)
+        # Many messages in one interval only keep the last.
+        self.assertEqual(preprocessor.processAt({"rssi": -50}, state, 12.0),
+                         {"rssi": -50, "rssi_10s": -60, "rssi_20s": None})
+        self.assertEqual(preprocessor.processAt({"rssi": -40}, state, 25.0),
+                         {"rssi": -40, "rssi_10s": -50, "rssi_20s": -60})
+        # A quiet interval holds the previous value.
+        self.assertEqual(preprocessor.processAt({"rssi": -30}, state, 41.0),
+                         {"rssi": -30, "rssi_10s": -40, "rssi_20s": -40})
+
+    def test_history_is_bounded_by_steps(self):
+        history = IntervalHistory()
+        for bucket in range(1000):
+            for _ in range(20):
+                history.append(bucket, bucket, 3)
+            self.assertLessEqual(len(history), 4)
+        self.assertEqual(history.lags(1000, 3), [999, 998, 997])
+
+    def test_frame_matches_process(self):
+        stream = makeTimedStream(300)
+        for interval, steps in [(1, 1), (5, 3), (30, 4)]:
+            preprocessor = ResampledLag(1, sensor="SELECT_ALL", interval=interval, steps=steps)
+            state = {}
+            expected = [preprocessor.processAt(message, state, observationTime) for observationTime, message in stream]
+            frame = ObservationFrame.fromObservations([message for _, message in stream],
+                                                      [observationTime for observationTime, _ in stream])
+            self.assertEqual(preprocessor.process_frame(frame).toObservations(), expected)
+
+    def test_state_survives_json_and_clock_steps(self):
+        preprocessor = ResampledLag(1, sensor="rssi", interval=10, steps=2)
+        state = {}
+        preprocessor.processAt({"rssi": -70}, state, 100.0)
+        preprocessor.processAt({"rssi": -60}, state, 115.0)
+        restored = json.loads(json.dumps(state, default=_stateToJson))
+        # A clock that steps back is treated as still being in the newest interval.
+        self.assertEqual(preprocessor.processAt({"rssi": -50}, restored, 90.0),
+                         {"rssi": -50, "rssi_10s": -70, "rssi_20s": None})
+
+
+class TestTimedReplay(unittest.TestCase):
+    def test_fallback_frame_uses_frame_times(self):
+        stream = makeTimedStream(200)
+        preprocessor = ExponentialMovingAverage(1, sensor="rssi", halfLife=20)
+        state = {}
+        expected = [preprocessor.processAt(message, state, observationTime) for observationTime, message in stream]
+        frame = ObservationFrame.fromObservations([message for _, message in stream],
+                                                  [observationTime for observationTime, _ in stream])
+        frame = preprocessor.process_frame(frame)
+        self.assertEqual(frame.toObservations(), expected)
+        self.assertIsNotNone(frame.times)
+
+
+class TestTimeWindowVote(unittest.TestCase):
+    def vote(self, postprocessor, now, label, confidence=1.0):
+        with mock.patch("postprocessors.time_window_vote.time.monotonic", return_value=now):
+            return postprocessor.process({}, label, confidence)[1]
+
+    def test_waits_for_a_window_then_votes_over_it(self):
+        postprocessor = TimeWindowVotePostprocessor(dbId=1, window_seconds=10)
+        self.assertIsNone(self.vote(postprocessor, 0.0, "lounge"))
+        self.assertIsNone(self.vote(postprocessor, 1.0, "kitchen"))
+        self.assertIsNone(self.vote(postprocessor, 2.0, "kitchen"))
+        self.assertEqual(self.vote(postprocessor, 10.0, "lounge"), "kitchen")
+        # By 12.5 both kitchen results have expired.
+        self.assertEqual(self.vote(postprocessor, 12.5, "lounge"), "lounge")
+        self.assertEqual(set(postprocessor.votes), {"lounge"})
+
+    def test_bursts_are_bounded_by_time(self):
+        postprocessor = TimeWindowVotePostprocessor(dbId=1, window_seconds=5)
+        for step in range(1000):
+            self.vote(postprocessor, step * 0.01, "lounge")
+        self.assertLessEqual(len(postprocessor.window), 501)
+
+    def test_confidence_weighting(self):
+        counted = TimeWindowVotePostprocessor(dbId=1, window_seconds=5)
+        weighted = TimeWindowVotePostprocessor(dbId=2, window_seconds=5, weighting="confidence")
+        for postprocessor in (counted, weighted):
+            self.vote(postprocessor, 0.0, "lounge", 0.95)
+            self.vote(postprocessor, 1.0, "kitchen", 0.3)
+            self.vote(postprocessor, 2.0, "kitchen", 0.3)
+        self.assertEqual(self.vote(counted, 5.5, "bedroom", 0.1), "kitchen")
+        self.assertEqual(self.vote(weighted, 5.5, "bedroom", 0.1), "kitchen")
+        self.assertEqual(self.vote(weighted, 5.6, "lounge", 0.9), "lounge")
+        self.assertEqual(self.vote(counted, 5.6, "lounge", 0.9), "kitchen")
+
+    def test_rejects_bad_config(self):
+        with self.assertRaises(ValueError):
+            TimeWindowVotePostprocessor(dbId=1, window_seconds=0)
+        with self.assertRaises(ValueError):
+            TimeWindowVotePostprocessor(dbId=1, weighting="loudest")
+
+
+if __name__ == '__main__':
+    unittest.main()
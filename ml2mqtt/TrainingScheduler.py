@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+DEFAULT_RETRAIN_DEBOUNCE = 2.0
+DEFAULT_RETRAIN_MIN_INTERVAL = 10.0
+DEFAULT_RETRAIN_MAX_DELAY = 60.0
+
+
+class TrainingScheduler:
+    """
+    Coalesces retrain requests for a single model and runs them on a worker thread.
+
+    A retrain starts once no new request has arrived for `debounce` seconds, but never
+    sooner than `minInterval` seconds after the previous retrain finished and never later
+    than `maxDelay` seconds after the first pending request. Requests that arrive while a
+    retrain is running are folded into the next one.
+    """
+
+    def __init__(self, name: str, retrain: Callable[[], None],
+                 debounce: float = DEFAULT_RETRAIN_DEBOUNCE,
+                 minInterval: float = DEFAULT_RETRAIN_MIN_INTERVAL,
+                 maxDelay: float = DEFAULT_RETRAIN_MAX_DELAY, activity: str = "retrain"):
+        self._name = name
+        self._retrain = retrain
+        # Names the work in thread names and logs; the scheduler also runs compactions.
+        self._activity = activity
+        self._logger = logging.getLogger(__name__)
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+        self._pending = False
+        self._firstRequest = 0.0
+        self._lastRequest = 0.0
+        self._lastFinished = float("-inf")
+        self.configure(debounce, minInterval, maxDelay)
+
+    def configure(self, debounce: float, minInterval: float, maxDelay: float = DEFAULT_RETRAIN_MAX_DELAY) -> None:
+        with self._condition:
+            self._debounce = max(0.0, float(debounce))
+            self._minInterval = max(0.0, float(minInterval))
+            self._maxDelay = max(self._debounce, float(maxDelay))
+            self._condition.notify_all()
+
+    def requestRetrain(self) -> None:
+        with self._condition:
+            if self._closed:
+                return
+            now = time.monotonic()
+            if not self._pending:
+                self._pending = True
+                self._firstRequest = now
+            self._lastRequest = now
+
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"{self._activity}-{self._name}", daemon=True)
+                self._worker.start()
+            else:
+                self._condition.notify_all()
+
+    def isPending(self) -> bool:
+        with self._condition:
+            return self._pending
+
+    def close(self) -> None:
+        """Drop pending requests and wait for a running retrain to finish."""
+        with self._condition:
+            self._closed = True
+            self._pending = False
+            worker = self._worker
+            self._condition.notify_all()
+        if worker is not None and worker is not threading.current_thread():
+            worker.join()
+
+    def _nextRunTime(self) -> float:
+        debounced = min(self._lastRequest + self._debounce, self._firstRequest + self._maxDelay)
+        return max(debounced, self._lastFinished + self._minInterval)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._pending and not self._closed:
+                    delay = self._nextRunTime() - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+
+                if not self._pending or self._closed:
+                    self._worker = None
+                    return
+                self._pending = False
+
+            started = time.monotonic()
+            try:
+                self._retrain()
+                self._logger.info("Ran %s for model %s in %.2fs", self._activity, self._name, time.monotonic() - started)
+            except Exception:
+                self._logger.exception("Background %s failed for model %s", self._activity, self._name)
+
+            with self._condition:
+                self._lastFinished = time.monotonic()
@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+from TrainingScheduler import TrainingScheduler
+
+
+class TestTrainingScheduler(unittest.TestCase):
+    def setUp(self):
+        self.runs = []
+        self.started = time.monotonic()
+
+    def retrain(self):
+        self.runs.append(time.monotonic() - self.started)
+
+    def requestFor(self, scheduler, seconds, every=0.01):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            scheduler.requestRetrain()
+            time.sleep(every)
+
+    def waitForRuns(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.runs) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_debounce_coalesces_a_burst(self):
+        scheduler = TrainingScheduler("test", self.retrain, debounce=0.1, minInterval=0, maxDelay=10)
+        self.requestFor(scheduler, 0.3)
+        lastRequest = time.monotonic() - self.started
+        self.assertEqual(self.runs, [])
+        self.waitForRuns(1)
+        time.sleep(0.2)
+        scheduler.close()
+        self.assertEqual(len(self.runs), 1)
+        self.assertGreaterEqual(self.runs[0], lastRequest + 0.05)
+
+    def test_max_delay_bounds_a_steady_stream(self):
+        scheduler = TrainingScheduler("test", self.retrain, debounce=0.1, minInterval=0, maxDelay=0.2)
+        self.requestFor(scheduler, 0.7)
+        scheduler.close()
+        # Requests never pause for the debounce, yet a retrain runs at least every maxDelay.
+        self.assertGreaterEqual(len(self.runs), 2)
+        self.assertLess(self.runs[0], 0.4)
+
+    def test_min_interval_spaces_retrains(self):
+        scheduler = TrainingScheduler("test", self.retrain, debounce=0, minInterval=0.3)
+        scheduler.requestRetrain()
+        self.waitForRuns(1)
+        scheduler.requestRetrain()
+        self.waitForRuns(2)
+        scheduler.close()
+        self.assertEqual(len(self.runs), 2)
+        self.assertGreaterEqual(self.runs[1] - self.runs[0], 0.29)
+
+    def test_requests_during_a_retrain_fold_into_one(self):
+        release = threading.Event()
+
+        def slowRetrain():
+            self.retrain()
+            release.wait(5)
+
+        scheduler = TrainingScheduler("test", slowRetrain, debounce=0, minInterval=0)
+        scheduler.requestRetrain()
+        self.waitForRuns(1)
+        for _ in range(10):
+            scheduler.requestRetrain()
+        self.assertTrue(scheduler.isPending())
+        release.set()
+        self.waitForRuns(2)
+        time.sleep(0.1)
+        scheduler.close()
+        self.assertEqual(len(self.runs), 2)
+
+    def test_close_drops_pending_requests(self):
+        scheduler = TrainingScheduler("test", self.retrain, debounce=10, minInterval=0)
+        scheduler.requestRetrain()
+        scheduler.close()
+        self.assertFalse(scheduler.isPending())
+        scheduler.requestRetrain()
+        self.assertFalse(scheduler.isPending())
+        self.assertEqual(self.runs, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from ModelStore import ModelStore
+
+
+class TestTransactions(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "test.db")
+
+    def committedCount(self):
+        """Observations visible to another connection, i.e. committed."""
+        reader = sqlite3.connect(self.path)
+        try:
+            return reader.execute("SELECT COUNT(*) FROM Observations").fetchone()[0]
+        finally:
+            reader.close()
+
+    def add(self, store, i):
+        store.addObservation("a", {"rssi": float(i)}, float(i))
+
+    def test_inner_failure_only_rolls_back_its_own_writes(self):
+        store = ModelStore(self.path)
+        with store.transaction():
+            self.add(store, 0)
+            with self.assertRaises(RuntimeError):
+                with store.transaction():
+                    self.add(store, 1)
+                    raise RuntimeError("inner")
+            self.add(store, 2)
+        self.assertEqual(sorted(store.getObservationMatrix().times.tolist()), [0.0, 2.0])
+        self.assertEqual(self.committedCount(), 2)
+        self.assertEqual(store.getWriteStats()["rollbacks"], 1)
+        store.close()
+
+    def test_outer_failure_rolls_back_everything(self):
+        store = ModelStore(self.path)
+        with self.assertRaises(RuntimeError):
+            with store.transaction():
+                with store.transaction():
+                    self.add(store, 0)
+                self.add(store, 1)
+                raise RuntimeError("outer")
+        self.assertEqual(store.getObservationCount(), 0)
+        self.assertEqual(self.committedCount(), 0)
+        store.close()
+
+    def test_only_the_outermost_block_commits(self):
+        store = ModelStore(self.path)
+        before = store.getWriteStats()
+        with store.transaction():
+            for i in range(10):
+                self.add(store, i)
+            self.assertEqual(self.committedCount(), 0)
+        stats = store.getWriteStats()
+        self.assertEqual(stats["commits"] - before["commits"], 1)
+        self.assertEqual(stats["units_of_work"] - before["units_of_work"], 1)
+        self.assertEqual(stats["synchronous"], "FULL")
+        self.assertEqual(self.committedCount(), 10)
+        store.close()
+
+    def test_group_commit_batches_units_of_work(self):
+        store = ModelStore(self.path, groupCommitWindow=0.2)
+        store.flush()
+        before = store.getWriteStats()
+        for i in range(20):
+            self.add(store, i)
+        # Each add is its own unit of work, but none is committed until the window closes.
+        self.assertEqual(self.committedCount(), 0)
+        self.assertEqual(store.getObservationCount(), 20)
+
+        deadline = time.monotonic() + 5
+        while self.committedCount() < 20 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        stats = store.getWriteStats()
+        self.assertEqual(self.committedCount(), 20)
+        self.assertEqual(stats["units_of_work"] - before["units_of_work"], 20)
+        self.assertEqual(stats["commits"] - before["commits"], 1)
+        self.assertEqual((stats["synchronous"], stats["synced_commits"]), ("NORMAL", 0))
+        store.close()
+
+    def test_flush_and_close_commit_the_window(self):
+        store = ModelStore(self.path, groupCommitWindow=60)
+        self.add(store, 0)
+        store.flush()
+        self.assertEqual(self.committedCount(), 1)
+        self.assertIsNone(store._commitTimer)
+
+        self.add(store, 1)
+        store.close()
+        self.assertEqual(self.committedCount(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
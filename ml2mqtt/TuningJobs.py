@@ -0,0 +1,235 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from ModelStore import ObservationMatrix
+from classifiers.ParameterSearch import SEARCH_TWO_STAGE
+
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+DEFAULT_TUNING_NICENESS = 10
+
+
+def _defaultTuningCores() -> int:
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def _runTuning(modelType: str, params: Dict[str, Any], observations: ObservationMatrix, strategy: str,
+               cores: int, niceness: int, messages: Any) -> None:
+    """Entry point of the tuning subprocess. Reports progress and the result through `messages`."""
+    try:
+        # Own process group, so cancelling the job also stops the joblib workers it starts.
+        if hasattr(os, "setpgrp"):
+            os.setpgrp()
+        if niceness > 0:
+            os.nice(niceness)
+
+        # Imported here so the parent process does not pay for it when spawning.
+        from classifiers.KNNClassifier import KNNClassifier
+        from classifiers.OnlineNaiveBayes import OnlineNaiveBayes
+        from classifiers.RandomForest import RandomForest
+
+        if modelType == "KNN":
+            classifier = KNNClassifier(params=params)
+        elif modelType == "OnlineNaiveBayes":
+            classifier = OnlineNaiveBayes(params=params)
+        else:
+            classifier = RandomForest(params=params)
+        bestParams = classifier.optimizeParameters(
+            observations,
+            nJobs=cores,
+            progress=lambda done, total: messages.put(("progress", done, total)),
+            strategy=strategy,
+        )
+        messages.put(("result", bestParams))
+    except Exception as e:
+        messages.put(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        # Exit without the multiprocessing atexit hooks, which would otherwise wait forever on
+        # joblib's reusable worker pool. The parent stops the leftover workers.
+        messages.close()
+        messages.join_thread()
+        os._exit(0)
+
+
+def _terminateProcessGroup(process: Any) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (AttributeError, OSError):
+        # No process groups on this platform, the child has not detached yet, or the group
+        # cannot be signalled; fall back to the child alone.
+        process.terminate()
+
+
+@dataclass
+class TuningJob:
+    id: str
+    modelName: str
+    modelType: str
+    status: str = JOB_RUNNING
+    completedFits: int = 0
+    plannedFits: int = 0
+    startedAt: float = field(default_factory=time.time)
+    finishedAt: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    @property
+    def progress(self) -> float:
+        if self.status == JOB_COMPLETED:
+            return 1.0
+        if self.plannedFits == 0:
+            return 0.0
+        return min(1.0, self.completedFits / self.plannedFits)
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds until completion, extrapolated from the fits finished so far."""
+        if self.status != JOB_RUNNING or self.completedFits == 0:
+            return None
+        elapsed = time.time() - self.startedAt
+        return elapsed / self.completedFits * max(0, self.plannedFits - self.completedFits)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "modelName": self.modelName,
+            "modelType": self.modelType,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "eta": None if self.eta is None else round(self.eta, 1),
+            "elapsed": round((self.finishedAt or time.time()) - self.startedAt, 1),
+            "error": self.error,
+        }
+
+
+class TuningJobManager:
+    """
+    Runs hyperparameter auto-tuning in background subprocesses.
+
+    Each job gets its own process limited to `cores` worker processes and lowered by `niceness`,
+    so a tune cannot starve MQTT inference. Jobs can be polled for progress and cancelled; the
+    `onComplete` callback only runs when a job finishes successfully.
+    """
+
+    def __init__(self, cores: Optional[int] = None, niceness: Optional[int] = None):
+        self._cores = cores if cores and cores > 0 else _defaultTuningCores()
+        self._niceness = DEFAULT_TUNING_NICENESS if niceness is None else max(0, niceness)
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, TuningJob] = {}
+        self._processes: Dict[str, Any] = {}
+        # Spawn rather than fork: the parent has MQTT and scheduler threads running.
+        self._context = multiprocessing.get_context("spawn")
+
+    def start(self, modelName: str, modelType: str, params: Dict[str, Any], observations: ObservationMatrix,
+              onComplete: Callable[[Dict[str, Any]], None], strategy: str = SEARCH_TWO_STAGE) -> TuningJob:
+        with self._lock:
+            running = self._getRunningJob(modelName)
+            if running is not None:
+                return running
+
+            job = TuningJob(id=uuid.uuid4().hex, modelName=modelName, modelType=modelType)
+            messages = self._context.Queue()
+            process = self._context.Process(
+                target=_runTuning,
+                args=(modelType, params, observations, strategy, self._cores, self._niceness, messages),
+                name=f"autotune-{modelName}",
+                # Not a daemon: joblib refuses to start workers from daemonic processes. Shutdown
+                # cancels running jobs instead.
+                daemon=False,
+            )
+            process.start()
+            self._jobs[job.id] = job
+            self._processes[job.id] = process
+
+        self._logger.info("Started auto-tune job %s for model %s (%d cores, nice %d)",
+                          job.id, modelName, self._cores, self._niceness)
+        threading.Thread(target=self._monitor, args=(job, process, messages, onComplete),
+                         name=f"autotune-monitor-{modelName}", daemon=True).start()
+        return job
+
+    def getJob(self, jobId: str) -> Optional[TuningJob]:
+        with self._lock:
+            return self._jobs.get(jobId)
+
+    def getRunningJob(self, modelName: str) -> Optional[TuningJob]:
+        with self._lock:
+            return self._getRunningJob(modelName)
+
+    def cancel(self, jobId: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(jobId)
+            process = self._processes.get(jobId)
+            if job is None or job.status != JOB_RUNNING:
+                return False
+            job.status = JOB_CANCELLED
+            job.finishedAt = time.time()
+        if process is not None:
+            _terminateProcessGroup(process)
+        self._logger.info("Cancelled auto-tune job %s for model %s", jobId, job.modelName)
+        return True
+
+    def cancelAll(self, modelName: Optional[str] = None) -> None:
+        with self._lock:
+            jobIds = [job.id for job in self._jobs.values()
+                      if job.status == JOB_RUNNING and (modelName is None or job.modelName == modelName)]
+        for jobId in jobIds:
+            self.cancel(jobId)
+
+    def _getRunningJob(self, modelName: str) -> Optional[TuningJob]:
+        for job in self._jobs.values():
+            if job.modelName == modelName and job.status == JOB_RUNNING:
+                return job
+        return None
+
+    def _monitor(self, job: TuningJob, process: Any, messages: Any,
+                 onComplete: Callable[[Dict[str, Any]], None]) -> None:
+        result: Optional[Dict[str, Any]] = None
+        error: Optional[str] = None
+        while result is None and error is None:
+            try:
+                message = messages.get(timeout=1.0)
+            except queue.Empty:
+                if not process.is_alive():
+                    error = f"Tuning process exited with code {process.exitcode}"
+                continue
+            if message[0] == "progress":
+                job.completedFits, job.plannedFits = message[1], message[2]
+            elif message[0] == "result":
+                result = message[1]
+            else:
+                error = message[1]
+
+        process.join()
+        _terminateProcessGroup(process)
+        with self._lock:
+            self._processes.pop(job.id, None)
+            if job.status == JOB_CANCELLED:
+                return
+
+        if error is None and result:
+            try:
+                onComplete(result)
+            except Exception as e:
+                self._logger.exception("Applying auto-tune result for model %s failed", job.modelName)
+                error = str(e)
+        elif error is None:
+            error = "Tuning produced no parameters"
+
+        with self._lock:
+            job.result = result
+            job.error = error
+            job.status = JOB_FAILED if error else JOB_COMPLETED
+            job.finishedAt = time.time()
+        self._logger.info("Auto-tune job %s for model %s %s", job.id, job.modelName, job.status)
@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+import unittest
+from unittest import mock
+import TuningJobs
+from TuningJobs import JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED, JOB_RUNNING, TuningJob, TuningJobManager
+
+
+class FakeProcess:
+    """Stands in for the tuning subprocess; the test speaks for it through its message queue."""
+
+    def __init__(self, target, args, name, daemon):
+        self.messages = args[-1]
+        self.pid = -1
+        self.exitcode = None
+        self.alive = True
+        self.terminated = False
+
+    def start(self):
+        pass
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self, timeout=None):
+        pass
+
+    def terminate(self):
+        self.terminated = True
+
+
+class FakeContext:
+    def __init__(self):
+        self.processes = []
+
+    def Queue(self):
+        return queue.Queue()
+
+    def Process(self, **kwargs):
+        process = FakeProcess(**kwargs)
+        self.processes.append(process)
+        return process
+
+
+class TestTuningJobManager(unittest.TestCase):
+    def setUp(self):
+        self.manager = TuningJobManager(cores=1, niceness=0)
+        self.context = self.manager._context = FakeContext()
+        self.results = []
+        self.applied = threading.Event()
+        patcher = mock.patch("TuningJobs._terminateProcessGroup")
+        self.terminate = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.exitProcesses)
+
+    def exitProcesses(self):
+        # Ends the monitor threads of jobs left running while _terminateProcessGroup is still patched,
+        # so none outlives its test.
+        for process in self.context.processes:
+            process.alive = False
+            process.messages.put(("error", "test finished"))
+        for thread in threading.enumerate():
+            if thread.name.startswith("autotune-monitor-"):
+                thread.join(5)
+                self.assertFalse(thread.is_alive())
+
+    def onComplete(self, params):
+        self.results.append(params)
+        self.applied.set()
+
+    def start(self, modelName="model"):
+        job = self.manager.start(modelName, "RandomForest", {}, None, self.onComplete)
+        return job, self.context.processes[-1]
+
+    def waitFor(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_progress_then_result(self):
+        job, process = self.start()
+        self.assertEqual((job.status, job.progress, job.eta), (JOB_RUNNING, 0.0, None))
+
+        process.messages.put(("progress", 3, 12))
+        self.waitFor(lambda: job.completedFits == 3)
+        self.assertEqual(job.progress, 0.25)
+        self.assertIsNotNone(job.eta)
+        self.assertEqual(job.to_dict()["progress"], 0.25)
+
+        process.messages.put(("result", {"n_estimators": 50}))
+        self.assertTrue(self.applied.wait(5))
+        self.waitFor(lambda: job.status == JOB_COMPLETED)
+        self.assertEqual(self.results, [{"n_estimators": 50}])
+        self.assertEqual((job.progress, job.result), (1.0, {"n_estimators": 50}))
+        self.assertIsNone(self.manager.getRunningJob("model"))
+
+    def test_cancel_discards_the_result(self):
+        job, process = self.start()
+        self.assertTrue(self.manager.cancel(job.id))
+        self.terminate.assert_called_once_with(process)
+        self.assertEqual(job.status, JOB_CANCELLED)
+        self.assertFalse(self.manager.cancel(job.id))
+
+        # A result that was already on its way is not applied.
+        process.messages.put(("result", {"n_estimators": 50}))
+        self.waitFor(lambda: job.id not in self.manager._processes)
+        self.assertEqual(self.results, [])
+        self.assertEqual(job.status, JOB_CANCELLED)
+
+    def test_one_running_job_per_model(self):
+        job, _ = self.start("model")
+        again, _ = self.start("model")
+        other, _ = self.start("other")
+        self.assertIs(again, job)
+        self.assertIsNot(other, job)
+        self.assertEqual(len(self.context.processes), 2)
+
+        self.manager.cancelAll("model")
+        self.assertEqual((job.status, other.status), (JOB_CANCELLED, JOB_RUNNING))
+        self.manager.cancelAll()
+        self.assertEqual(other.status, JOB_CANCELLED)
+
+    def test_errors_fail_the_job(self):
+        job, process = self.start("model")
+        process.messages.put(("error", "ValueError: no data"))
+        self.waitFor(lambda: job.status == JOB_FAILED)
+        self.assertEqual(job.error, "ValueError: no data")
+
+        crashed, process = self.start("other")
+        process.exitcode = -9
+        process.alive = False
+        self.waitFor(lambda: crashed.status == JOB_FAILED)
+        self.assertIn("-9", crashed.error)
+        self.assertEqual(self.results, [])
+
+    def test_eta_extrapolates_finished_fits(self):
+        job = TuningJob(id="job", modelName="model", modelType="RandomForest", completedFits=10, plannedFits=40,
+                        startedAt=time.time() - 20)
+        self.assertAlmostEqual(job.eta, 60, delta=1)
+        job.status = JOB_CANCELLED
+        self.assertIsNone(job.eta)
+
+
+class TestTerminateProcessGroup(unittest.TestCase):
+    def test_unsignallable_group_terminates_the_child(self):
+        process = FakeProcess(None, (queue.Queue(),), "autotune-model", False)
+        with mock.patch("TuningJobs.os.killpg", side_effect=OSError(22, "Invalid argument")):
+            TuningJobs._terminateProcessGroup(process)
+        self.assertTrue(process.terminated)
+
+
+if __name__ == '__main__':
+    unittest.main()
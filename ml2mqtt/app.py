@@ -1,14 +1,18 @@
 from Config import Config
 from MqttClient import MqttClient
-from flask import Flask, send_file, abort
+from InferenceBatcher import InferenceBatcher
+from flask import Flask, Response, abort, jsonify, request
 from ModelManager import ModelManager
+from TuningJobs import TuningJobManager
 from io import StringIO
+import atexit
 import logging
 import os
-from pathlib import Path
 from datetime import datetime, timezone
 from routes.model_routes import init_model_routes
 from routes.log_routes import init_log_routes
+from ModelTransfer import ModelImportError
+from ModelStore import DEFAULT_RAW_SAMPLE_LIMIT, loadArtifactKey
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -73,27 +77,62 @@ def inject_globals():
 config = Config()
 
 mqttClient = MqttClient(config.getValue("mqtt"))
-modelManager = ModelManager(mqttClient, config.getDataPath() + "/models")
+tuningJobs = TuningJobManager(config.getValue("autotune", "cores"), config.getValue("autotune", "niceness"))
+batchLatencyMs = config.getValue("inference", "batch_latency_ms") or 0
+inferenceBatcher = InferenceBatcher(batchLatencyMs / 1000) if batchLatencyMs > 0 else None
+rawSampleLimit = config.getValue("storage", "raw_sample_limit")
+modelManager = ModelManager(mqttClient, config.getDataPath() + "/models", tuningJobs, {
+    "groupCommitWindow": (config.getValue("storage", "group_commit_ms") or 0) / 1000,
+    "maxStrings": config.getValue("storage", "string_table_limit"),
+    # 0 keeps every raw message; unset falls back to the default limit.
+    "maxRawSamples": rawSampleLimit if rawSampleLimit is not None else DEFAULT_RAW_SAMPLE_LIMIT,
+    # Signs stored fits so only ones written by this installation are unpickled.
+    "artifactKey": loadArtifactKey(config.getDataPath() + "/artifact.key"),
+}, inferenceBatcher=inferenceBatcher)
+atexit.register(modelManager.shutdown)
+if inferenceBatcher is not None:
+    atexit.register(inferenceBatcher.close)
+# atexit runs in reverse, so message delivery stops before the models are disposed.
+atexit.register(mqttClient.close)
 
 # Register blueprints
 app.register_blueprint(init_model_routes(modelManager))
 app.register_blueprint(init_log_routes(logStream))
 
+def _isValidSlug(model_slug: str) -> bool:
+    # Ensure model_slug is safe to use as a file name component (basic check)
+    return bool(model_slug) and ".." not in model_slug and "/" not in model_slug
+
 @app.route('/download_model_db/<model_slug>')
 def download_model_db(model_slug: str):
-    data_path = config.getDataPath()
-    # Ensure model_slug is safe to use as a file name component (basic check)
-    if not model_slug or ".." in model_slug or "/" in model_slug:
+    if not _isValidSlug(model_slug):
         abort(400, description="Invalid model slug.")
-
-    db_file_name = model_slug + ".db"
-    db_file_path = Path(data_path) / "models" / db_file_name
-
-    if not db_file_path.is_file():
+    service = modelManager.findModel(model_slug)
+    if service is None:
+        if model_slug in modelManager:
+            # The file exists but the model failed to load, so there is nothing to snapshot.
+            abort(503, description="Model is not loaded.")
         abort(404, description="Database file not found.")
 
-    return send_file(
-        db_file_path,
-        as_attachment=True,
-        download_name=db_file_name
-    )
\ No newline at end of file
+    # Streamed in chunks from a backup snapshot, so a busy or large model is never read half-written.
+    compress = request.args.get("compress", "1") not in ["0", "false"]
+    chunks = service.exportDatabase(compress)
+    downloadName = model_slug + (".db.gz" if compress else ".db")
+    return Response(
+        chunks,
+        mimetype="application/gzip" if compress else "application/vnd.sqlite3",
+        headers={"Content-Disposition": f'attachment; filename="{downloadName}"'}
+    )
+
+@app.route('/upload_model_db/<model_slug>', methods=['POST'])
+def upload_model_db(model_slug: str):
+    """Import a model from a raw or gzip-compressed database sent as the request body."""
+    if not _isValidSlug(model_slug):
+        return jsonify(success=False, error="Invalid model slug."), 400
+    try:
+        modelManager.importModel(model_slug, request.stream)
+    except ModelImportError as e:
+        return jsonify(success=False, error=str(e)), 400
+    except ValueError as e:
+        return jsonify(success=False, error=str(e)), 409
+    return jsonify(success=True)
@@ -0,0 +1,92 @@
+"""
+Throughput and added latency of micro-batched inference vs one predict_proba call per message.
+
+Four models (two RandomForest, two KNN) share one batcher. The saturated run submits every
+message at once; the paced run submits at a fixed rate and reports submit-to-result latency
+and CPU time per message.
+
+Run from the ml2mqtt directory:  python benchmarks/batching_benchmark.py [messages/s]
+"""
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from inference_benchmark import makeMatrix, makeObservations
+from InferenceBatcher import InferenceBatcher
+from classifiers.RandomForest import RandomForest
+from classifiers.KNNClassifier import KNNClassifier
+
+LATENCIES_MS = [0, 1, 2, 5, 10]
+
+
+class Collector:
+    def __init__(self, expected):
+        self.expected = expected
+        self.latencies = []
+        self.done = threading.Event()
+
+    def callback(self, submitted):
+        def onResult(prediction, confidence):
+            self.latencies.append(time.perf_counter() - submitted)
+            if len(self.latencies) == self.expected:
+                self.done.set()
+        return onResult
+
+
+def run(classifiers, queries, latencyMs, rate=None):
+    messages = [(classifiers[i % len(classifiers)], query) for i, query in enumerate(queries)]
+    collector = Collector(len(messages))
+    batcher = InferenceBatcher(latencyMs / 1000) if latencyMs > 0 else None
+
+    started = time.perf_counter()
+    cpuStarted = time.process_time()
+    for i, (classifier, query) in enumerate(messages):
+        if rate is not None:
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        onResult = collector.callback(time.perf_counter())
+        if batcher is None:
+            onResult(*classifier.predictLabel(query))
+        else:
+            batcher.submit(classifier, query, onResult)
+    collector.done.wait()
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpuStarted
+
+    stats = batcher.getStats() if batcher else {"mean_batch_size": 1.0}
+    if batcher:
+        batcher.close()
+    latencies = sorted(collector.latencies)
+    return {
+        "throughput": len(messages) / elapsed,
+        "cpu_us": cpu / len(messages) * 1e6,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "batch": stats["mean_batch_size"],
+    }
+
+
+def main():
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 400
+    observations = makeMatrix(makeObservations(5000))
+    classifiers = [RandomForest(), RandomForest(), KNNClassifier(), KNNClassifier()]
+    for classifier in classifiers:
+        classifier.populateDataframe(observations)
+    queries = [o.sensorValues for o in makeObservations(2000, seed=1)]
+
+    for name, pacing in [("saturated", None), (f"paced {rate:.0f}/s", rate)]:
+        print(name)
+        for latencyMs in LATENCIES_MS:
+            result = run(classifiers, queries, latencyMs, pacing)
+            label = "per message" if latencyMs == 0 else f"batch {latencyMs}ms"
+            print(f"  {label:12s} {result['throughput']:8.0f} msg/s   cpu {result['cpu_us']:7.0f} us/msg   "
+                  f"p50 {result['p50_ms']:7.2f} ms   p99 {result['p99_ms']:7.2f} ms   "
+                  f"mean batch {result['batch']:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
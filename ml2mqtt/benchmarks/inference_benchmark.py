@@ -0,0 +1,75 @@
+"""
+Per-message inference latency: legacy one-row DataFrame pipeline vs the FastPredictor path,
+and the pickled size of each fitted model.
+
+Run from the ml2mqtt directory:  python benchmarks/inference_benchmark.py
+"""
+import os
+import sys
+import time
+import pickle
+import random
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ModelStore import ModelObservation, ModelStore
+from classifiers.RandomForest import RandomForest
+from classifiers.KNNClassifier import KNNClassifier
+
+LABELS = ["kitchen", "lounge", "bedroom", "office", "garage"]
+
+
+def makeObservations(count, sensorCount=12, seed=0):
+    rng = random.Random(seed)
+    observations = []
+    for i in range(count):
+        label = rng.choice(LABELS)
+        offset = LABELS.index(label) * 10
+        sensors = {f"rssi_{s}": -90 + offset + s + rng.gauss(0, 6) for s in range(sensorCount)}
+        sensors["media"] = rng.choice(["tv", "radio", "off"])
+        observations.append(ModelObservation(i, label, sensors))
+    return observations
+
+
+def makeMatrix(observations):
+    store = ModelStore(os.path.join(tempfile.mkdtemp(), "benchmark.db"))
+    for observation in observations:
+        store.addObservation(observation.label, observation.sensorValues, observation.time)
+    matrix = store.getObservationMatrix()
+    store.close()
+    return matrix
+
+
+def legacyPredict(classifier, sensorValues):
+    X = pd.DataFrame([sensorValues]).reindex(columns=classifier._X_test.columns, fill_value=None)
+    label = classifier.labelEncoder.inverse_transform(classifier._pipeline.predict(X))[0]
+    return label, max(classifier._pipeline.predict_proba(X)[0])
+
+
+def timePerCall(fn, queries, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            fn(query)
+    return (time.perf_counter() - started) / (repeat * len(queries))
+
+
+def main():
+    observations = makeMatrix(makeObservations(5000))
+    queries = [o.sensorValues for o in makeObservations(200, seed=1)]
+
+    for name, classifier in [("RandomForest", RandomForest()), ("RF compact", RandomForest(compact=True)),
+                             ("KNN", KNNClassifier())]:
+        classifier.populateDataframe(observations)
+        mismatches = sum(legacyPredict(classifier, q) != classifier.predictLabel(q) for q in queries)
+        legacy = timePerCall(lambda q: legacyPredict(classifier, q), queries, 1)
+        fast = timePerCall(classifier.predictLabel, queries, 3)
+        print(f"{name:13s} legacy {legacy * 1e6:9.1f} us/msg   fast {fast * 1e6:9.1f} us/msg   "
+              f"speedup {legacy / fast:5.1f}x   mismatches {mismatches}   "
+              f"pickled {len(pickle.dumps(classifier._pipeline)) / 1024:8.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
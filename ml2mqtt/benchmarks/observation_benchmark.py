@@ -0,0 +1,52 @@
+"""
+Training-set load time: dict-per-observation path vs the ModelStore columnar cache.
+
+Run from the ml2mqtt directory:  python benchmarks/observation_benchmark.py [rows]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ModelStore import ModelStore
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rng = random.Random(0)
+    path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    store = ModelStore(path)
+    for i in range(rows):
+        sensors = {f"rssi_{s}": rng.uniform(-100, -40) for s in range(20)}
+        sensors["media"] = rng.choice(["tv", "radio", "off"])
+        store.addObservation(rng.choice(["kitchen", "lounge", "bedroom"]), sensors, i)
+    store.close()
+
+    store = ModelStore(path)
+    started = time.perf_counter()
+    observations = store.getObservations()
+    frame = pd.DataFrame([o.sensorValues for o in observations])
+    labels = [o.label for o in observations]
+    legacy = time.perf_counter() - started
+
+    started = time.perf_counter()
+    matrix = store.getObservationMatrix()
+    coldFrame = matrix.toDataFrame()
+    cold = time.perf_counter() - started
+
+    store.addObservation("kitchen", observations[0].sensorValues, rows)
+    started = time.perf_counter()
+    warmFrame = store.getObservationMatrix().toDataFrame()
+    warm = time.perf_counter() - started
+
+    print(f"{rows} rows: dicts {legacy:.3f}s   matrix cold {cold:.3f}s   matrix warm {warm:.3f}s")
+    assert frame.shape == coldFrame.shape and len(labels) == len(matrix)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
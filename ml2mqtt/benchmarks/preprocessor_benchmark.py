@@ -0,0 +1,58 @@
+"""
+Per-message cost of RollingAverage with list windows (pop(0) and a full re-sum, as before)
+vs ring buffers, and the size of the persisted state.
+
+Run from the ml2mqtt directory:  python benchmarks/preprocessor_benchmark.py [messages] [window] [sensors]
+"""
+import json
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ModelStore import _stateToJson
+from preprocessors.rolling_average import RollingAverage
+
+
+def listRollingAverage(observation, state, windowSize):
+    result = observation.copy()
+    rollingData = state.setdefault("rollingData", {})
+    for entity, value in observation.items():
+        window = rollingData.setdefault(entity, [])
+        window.append(value)
+        if len(window) > windowSize:
+            window.pop(0)
+        filteredData = [x for x in window if x is not None]
+        result[entity] = round(sum(filteredData) / len(filteredData), 4) if filteredData else None
+    return result
+
+
+def makeMessages(count, sensors, seed=0):
+    rng = random.Random(seed)
+    return [{f"rssi_{s}": rng.choice([None, rng.uniform(-100, -40)]) for s in range(sensors)} for _ in range(count)]
+
+
+def run(name, process, messages):
+    state = {}
+    started = time.perf_counter()
+    for message in messages:
+        process(message, state)
+    elapsed = time.perf_counter() - started
+    stateBytes = len(json.dumps(state, default=_stateToJson))
+    print(f"{name:12s} {elapsed / len(messages) * 1e6:8.1f} us/msg   state {stateBytes / 1024:8.1f} KiB")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    window = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    sensors = int(sys.argv[3]) if len(sys.argv) > 3 else 40
+    messages = makeMessages(count, sensors)
+    run("list", lambda message, state: listRollingAverage(message, state, window), messages)
+    preprocessor = RollingAverage(1, sensor="SELECT_ALL", windowSize=window)
+    run("ring buffer", preprocessor.process, messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Auto-tune wall-clock time and held-out accuracy: two-stage random+grid search vs successive halving.
+
+Run from the ml2mqtt directory:  python benchmarks/tuning_benchmark.py [observation count]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from inference_benchmark import makeMatrix, makeObservations
+from classifiers.ParameterSearch import SEARCH_HALVING, SEARCH_TWO_STAGE
+from classifiers.RandomForest import RandomForest
+from classifiers.KNNClassifier import KNNClassifier
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    # Few sensors keep the classes overlapping, so the searches have something to separate.
+    observations = makeMatrix(makeObservations(count, sensorCount=3))
+
+    for name, classifierType in [("RandomForest", RandomForest), ("KNN", KNNClassifier)]:
+        for strategy in [SEARCH_TWO_STAGE, SEARCH_HALVING]:
+            classifier = classifierType()
+            fits = []
+            started = time.perf_counter()
+            classifier.optimizeParameters(observations, progress=lambda done, total: fits.append(done),
+                                          strategy=strategy)
+            elapsed = time.perf_counter() - started
+            print(f"{name:13s} {strategy:10s} {elapsed:8.1f} s   fits {fits[-1] if fits else 0:4d}   "
+                  f"held-out accuracy {classifier.getAccuracy():.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Commits and fsyncs per training message: one commit per write vs one unit of work per message,
+with and without a group-commit window.
+
+Run from the ml2mqtt directory:  python benchmarks/write_benchmark.py [messages]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from contextlib import nullcontext
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ModelStore import ModelStore
+
+
+def makeMessages(count, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        sensors = {f"rssi_{s}": rng.uniform(-100, -40) for s in range(8)}
+        # A growing set of string values and the occasional new sensor, like a live install.
+        sensors["media"] = f"source_{rng.randrange(i // 4 + 1)}"
+        sensors.update({f"sensor_{s}": rng.uniform(0, 1) for s in range(i // 50 + 1)})
+        messages.append((rng.choice(["kitchen", "lounge", "bedroom"]), sensors))
+    return messages
+
+
+def run(messages, unitOfWork, groupCommitWindow):
+    store = ModelStore(os.path.join(tempfile.mkdtemp(), "benchmark.db"), groupCommitWindow)
+    started = time.perf_counter()
+    for i, (label, sensors) in enumerate(messages):
+        with store.transaction() if unitOfWork else nullcontext():
+            values = store.sortEntityValues(sensors, True)
+            store.addObservation(label, values, i)
+            store.saveDict("mqtt_observations", {"history": [sensors]})
+            store.saveDict("processor_storage", {})
+    store.flush()
+    elapsed = time.perf_counter() - started
+    stats = store.getWriteStats()
+    store.close()
+    return elapsed, stats
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    messages = makeMessages(count)
+    for name, unitOfWork, window in [("commit per write", False, 0.0),
+                                     ("unit of work", True, 0.0),
+                                     ("group commit 50ms", True, 0.05)]:
+        elapsed, stats = run(messages, unitOfWork, window)
+        print(f"{name:18s} {elapsed / count * 1e6:8.1f} us/msg   commits/msg {stats['commits'] / count:5.2f}   "
+              f"fsyncs/msg {stats['synced_commits'] / count:5.2f}   synchronous={stats['synchronous']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import numpy as np
+from typing import Any, Dict
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.ensemble import RandomForestClassifier
+
+
+class CompactForest(ClassifierMixin, BaseEstimator):
+    """
+    A fitted RandomForestClassifier flattened into a handful of NumPy arrays.
+
+    All trees share one node table. Internal nodes store their split feature, threshold and
+    global child indices; a leaf is marked by a negative left child, -1 - leafIndex, and its
+    class probabilities live in a separate leaf table. Rows are routed through every tree at
+    once, one tree level per step, so a prediction is a few dozen array operations with no
+    per-call estimator validation.
+
+    Thresholds are stored as float32, rounded down so that `x <= threshold` gives the same
+    answer as sklearn for float32 inputs. Leaf probabilities are float32 as well, so
+    probabilities match sklearn to about 1e-7.
+
+    The instance offers the predict / predict_proba / classes_ / feature_importances_
+    surface the rest of the code uses, so it can replace the classifier step of a Pipeline.
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 missingLeft: np.ndarray, roots: np.ndarray, leafValues: np.ndarray,
+                 classes: np.ndarray, featureImportances: np.ndarray, nFeatures: int):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missingLeft = missingLeft
+        self.roots = roots
+        self.leafValues = leafValues
+        self.classes_ = classes
+        self.feature_importances_ = featureImportances
+        self.n_features_in_ = nFeatures
+
+    @classmethod
+    def fromEstimator(cls, forest: RandomForestClassifier) -> "CompactForest":
+        features, thresholds, lefts, rights, missingLefts, roots, leafValues = [], [], [], [], [], [], []
+        nodeOffset = 0
+        leafOffset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            isLeaf = tree.children_left < 0
+            leafIndex = np.cumsum(isLeaf) - 1 + leafOffset
+
+            left = np.where(isLeaf, -1 - leafIndex, tree.children_left + nodeOffset)
+            right = np.where(isLeaf, -1, tree.children_right + nodeOffset)
+
+            threshold64 = tree.threshold
+            threshold = threshold64.astype(np.float32)
+            rounded = threshold.astype(np.float64) > threshold64
+            threshold[rounded] = np.nextafter(threshold[rounded], np.float32(-np.inf))
+
+            missing = getattr(tree, "missing_go_to_left", None)
+            if missing is None:
+                missing = np.zeros(tree.node_count, dtype=bool)
+
+            values = tree.value[isLeaf, 0, :]
+            values = values / values.sum(axis=1, keepdims=True)
+
+            features.append(np.where(isLeaf, 0, tree.feature))
+            thresholds.append(np.where(isLeaf, 0, threshold))
+            lefts.append(left)
+            rights.append(right)
+            missingLefts.append(missing.astype(bool))
+            roots.append(nodeOffset)
+            leafValues.append(values.astype(np.float32))
+            nodeOffset += tree.node_count
+            leafOffset += int(isLeaf.sum())
+
+        indexType = np.int32 if max(nodeOffset, leafOffset) < 2 ** 31 else np.int64
+        featureType = np.int16 if forest.n_features_in_ < 2 ** 15 else np.int32
+        return cls(
+            feature=np.concatenate(features).astype(featureType),
+            threshold=np.concatenate(thresholds).astype(np.float32),
+            left=np.concatenate(lefts).astype(indexType),
+            right=np.concatenate(rights).astype(indexType),
+            missingLeft=np.concatenate(missingLefts),
+            roots=np.asarray(roots, dtype=indexType),
+            leafValues=np.concatenate(leafValues),
+            classes=forest.classes_,
+            featureImportances=forest.feature_importances_,
+            nFeatures=forest.n_features_in_,
+        )
+
+    def __sklearn_is_fitted__(self) -> bool:
+        return True
+
+    def get_params(self, deep: bool = True) -> Dict[str, Any]:
+        # Nothing to tune; the arrays are fitted state, not hyperparameters.
+        return {}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.feature, self.threshold, self.left, self.right,
+                                               self.missingLeft, self.roots, self.leafValues))
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Leaf index reached by each row in each tree, shape (rows, trees)."""
+        X = np.asarray(X, dtype=np.float32)
+        nTrees = len(self.roots)
+        # One entry per (row, tree) pair still walking; finished pairs drop out each level.
+        pairs = np.arange(X.shape[0] * nTrees)
+        rows = pairs // nTrees
+        nodes = self.roots[pairs % nTrees]
+        leaves = np.empty(X.shape[0] * nTrees, dtype=self.left.dtype)
+        while len(pairs):
+            left = self.left[nodes]
+            done = left < 0
+            leaves[pairs[done]] = -1 - left[done]
+            walking = ~done
+            pairs, rows, nodes, left = pairs[walking], rows[walking], nodes[walking], left[walking]
+            values = X[rows, self.feature[nodes]]
+            goLeft = np.where(np.isnan(values), self.missingLeft[nodes], values <= self.threshold[nodes])
+            nodes = np.where(goLeft, left, self.right[nodes])
+        return leaves.reshape(X.shape[0], nTrees)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        leaves = self.apply(X)
+        return self.leafValues[leaves].sum(axis=1, dtype=np.float64) / len(self.roots)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
@@ -0,0 +1,88 @@
+import pickle
+import unittest
+import numpy as np
+from classifiers.CompactForest import CompactForest
+from classifiers.FastPredictorTest import makeMatrix, makeObservations
+from classifiers.RandomForest import RandomForest
+
+
+class TestCompactForest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.classifier = RandomForest({"n_estimators": 30})
+        cls.classifier.populateDataframe(makeMatrix(makeObservations(400)))
+        pipeline = cls.classifier._pipeline
+        cls.forest = pipeline.named_steps["classifier"]
+        cls.X = np.asarray(pipeline.named_steps["preprocessor"].transform(cls.classifier._X_test), dtype=np.float64)
+
+    def test_matches_sklearn_probabilities(self):
+        compact = CompactForest.fromEstimator(self.forest)
+        np.testing.assert_allclose(compact.predict_proba(self.X), self.forest.predict_proba(self.X), atol=1e-6)
+        np.testing.assert_array_equal(compact.predict(self.X), self.forest.predict(self.X))
+
+    def test_missing_values_follow_sklearn(self):
+        X = self.X.copy()
+        X[::3, 0] = np.nan
+        X[1::3, -1] = np.nan
+        compact = CompactForest.fromEstimator(self.forest)
+        np.testing.assert_allclose(compact.predict_proba(X), self.forest.predict_proba(X), atol=1e-6)
+
+    def test_threshold_boundaries_follow_sklearn(self):
+        # Values on, and one float32 or float64 step either side of, every split threshold,
+        # where rounding the thresholds to float32 could send a row the other way.
+        rows = []
+        for estimator in self.forest.estimators_[:5]:
+            tree = estimator.tree_
+            # Splits that only separate missing values have an infinite threshold.
+            for node in np.flatnonzero((tree.children_left >= 0) & np.isfinite(tree.threshold)):
+                threshold = tree.threshold[node]
+                threshold32 = np.float32(threshold)
+                for value in (threshold, np.nextafter(threshold, -np.inf), np.nextafter(threshold, np.inf),
+                              threshold32, np.nextafter(threshold32, np.float32(-np.inf)),
+                              np.nextafter(threshold32, np.float32(np.inf))):
+                    row = self.X[node % len(self.X)].copy()
+                    row[tree.feature[node]] = value
+                    rows.append(row)
+        X = np.asarray(rows)
+        compact = CompactForest.fromEstimator(self.forest)
+        np.testing.assert_array_equal(compact.apply(X), self.compactLeaves(self.forest.apply(X)))
+        np.testing.assert_allclose(compact.predict_proba(X), self.forest.predict_proba(X), atol=1e-6)
+        np.testing.assert_array_equal(compact.predict(X), self.forest.predict(X))
+
+    def compactLeaves(self, nodes):
+        # sklearn numbers nodes within each tree; the compact forest numbers leaves across all trees.
+        leaves = np.empty_like(nodes)
+        offset = 0
+        for column, estimator in enumerate(self.forest.estimators_):
+            isLeaf = estimator.tree_.children_left < 0
+            leaves[:, column] = (np.cumsum(isLeaf) - 1 + offset)[nodes[:, column]]
+            offset += int(isLeaf.sum())
+        return leaves
+
+    def test_smaller_than_estimator(self):
+        compact = CompactForest.fromEstimator(self.forest)
+        self.assertLess(len(pickle.dumps(compact)), len(pickle.dumps(self.forest)) / 2)
+
+    def test_compact_random_forest(self):
+        classifier = RandomForest({"n_estimators": 30}, compact=True)
+        classifier.populateDataframe(makeMatrix(makeObservations(400)))
+        self.assertIsInstance(classifier._pipeline.named_steps["classifier"], CompactForest)
+
+        queries = [observation.sensorValues for observation in makeObservations(50, seed=1)]
+        self.assertEqual(classifier.predictLabels(queries), [classifier.predictLabel(query) for query in queries])
+        self.assertIsNotNone(classifier.getAccuracy())
+        self.assertTrue(classifier.getFeatureImportance())
+
+
+    def test_loaded_full_forest_is_compacted(self):
+        classifier = RandomForest({"n_estimators": 30}, compact=True)
+        classifier.loadArtifact(pickle.loads(pickle.dumps(self.classifier.getArtifact())))
+        self.assertIsInstance(classifier._pipeline.named_steps["classifier"], CompactForest)
+
+        queries = [observation.sensorValues for observation in makeObservations(50, seed=1)]
+        self.assertEqual([label for label, _ in classifier.predictLabels(queries)],
+                         [label for label, _ in self.classifier.predictLabels(queries)])
+
+
+if __name__ == '__main__':
+    unittest.main()
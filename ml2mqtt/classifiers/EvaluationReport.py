@@ -0,0 +1,139 @@
+import copy
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from sklearn.pipeline import Pipeline
+
+# Score a random 30% split that the served model never sees.
+EVALUATION_HOLDOUT = "holdout"
+# Score out-of-fold predictions from stratified k-fold CV; the served model is fit on every row.
+EVALUATION_CROSS_VALIDATION = "cross_validation"
+# Score each row with the trees that did not sample it (bootstrapped forests only); fit on every row.
+EVALUATION_OUT_OF_BAG = "out_of_bag"
+EVALUATION_MODES = [EVALUATION_HOLDOUT, EVALUATION_CROSS_VALIDATION, EVALUATION_OUT_OF_BAG]
+DEFAULT_CV_FOLDS = 5
+
+
+@dataclass
+class EvaluationReport:
+    """
+    Held-out evaluation of one fit, computed once when the model is trained so that
+    accuracy, label statistics and importances can be served without predicting again.
+
+    Under cross-validation `accuracy` is the mean over folds and `accuracyStd` their
+    standard deviation; label statistics and the confusion matrix pool the out-of-fold
+    predictions of every row.
+    """
+    accuracy: float
+    labelStats: Dict[str, Dict[str, Any]]
+    labels: List[str]
+    # confusionMatrix[i][j] counts held-out rows of labels[i] predicted as labels[j].
+    confusionMatrix: List[List[int]]
+    featureImportance: Optional[Dict[str, float]] = None
+    trainRows: int = 0
+    testRows: int = 0
+    method: str = EVALUATION_HOLDOUT
+    accuracyStd: Optional[float] = None
+    folds: int = 0
+    createdAt: float = field(default_factory=time.time)
+
+    @classmethod
+    def fromPredictions(cls, yTrue: Sequence[int], yPred: Sequence[int], classes: Sequence[str],
+                        featureImportance: Optional[Dict[str, float]] = None,
+                        trainRows: int = 0, method: str = EVALUATION_HOLDOUT,
+                        foldAccuracies: Optional[Sequence[float]] = None) -> "EvaluationReport":
+        """Build a report from label-encoded true and predicted labels; `classes` decodes them."""
+        labels = [str(label) for label in classes]
+        codes = np.arange(len(labels))
+        report = classification_report(yTrue, yPred, labels=codes, target_names=labels,
+                                       output_dict=True, zero_division=0)
+        labelStats = {
+            label: {
+                "support": int(report[label]["support"]),
+                "precision": round(report[label]["precision"], 3),
+                "recall": round(report[label]["recall"], 3),
+                "f1": round(report[label]["f1-score"], 3),
+            }
+            for label in labels
+        }
+        if foldAccuracies:
+            accuracy, accuracyStd = float(np.mean(foldAccuracies)), float(np.std(foldAccuracies))
+        else:
+            accuracy, accuracyStd = float(accuracy_score(yTrue, yPred)), None
+        return cls(
+            accuracy=accuracy,
+            labelStats=labelStats,
+            labels=labels,
+            confusionMatrix=confusion_matrix(yTrue, yPred, labels=codes).tolist(),
+            featureImportance=featureImportance,
+            trainRows=int(trainRows),
+            testRows=len(yTrue),
+            method=method,
+            accuracyStd=accuracyStd,
+            folds=len(foldAccuracies) if foldAccuracies else 0,
+        )
+
+    def getLabelStats(self) -> Dict[str, Dict[str, Any]]:
+        # Callers add their own fields to these dicts.
+        return copy.deepcopy(self.labelStats)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "accuracy": self.accuracy,
+            "label_stats": self.getLabelStats(),
+            "labels": list(self.labels),
+            "confusion_matrix": [list(row) for row in self.confusionMatrix],
+            "feature_importance": dict(self.featureImportance) if self.featureImportance else None,
+            "train_rows": self.trainRows,
+            "test_rows": self.testRows,
+            "method": self.method,
+            "accuracy_std": self.accuracyStd,
+            "folds": self.folds,
+            "created_at": self.createdAt,
+        }
+
+
+def transformedFeatureNames(preprocessor: ColumnTransformer) -> List[str]:
+    """Input column names in the order a fitted ColumnTransformer outputs them."""
+    return [
+        column
+        for name, _, columns in preprocessor.transformers_
+        if name != "remainder"
+        for column in columns
+    ]
+
+
+def usableFolds(y: np.ndarray, folds: int) -> int:
+    """Folds stratified CV can use: every label needs a row in each fold. Below 2, CV is not possible."""
+    counts = np.bincount(y)
+    return min(folds, int(counts[counts > 0].min())) if len(y) else 0
+
+
+def resolveEvaluationMode(mode: str, y: np.ndarray, folds: int, outOfBag: bool = False) -> str:
+    """The mode a fit can actually use: out-of-bag needs bootstrapping and CV enough rows per label."""
+    if mode == EVALUATION_OUT_OF_BAG and not outOfBag:
+        mode = EVALUATION_CROSS_VALIDATION
+    if mode == EVALUATION_CROSS_VALIDATION and usableFolds(y, folds) < 2:
+        mode = EVALUATION_HOLDOUT
+    return mode if mode in EVALUATION_MODES else EVALUATION_HOLDOUT
+
+
+def crossValidatedPredictions(pipeline: Pipeline, X: pd.DataFrame, y: np.ndarray, folds: int,
+                              nJobs: Optional[int] = -1) -> Tuple[np.ndarray, List[float]]:
+    """Out-of-fold predictions for every row and the accuracy of each fold, fitting folds in parallel."""
+    splits = list(StratifiedKFold(usableFolds(y, folds), shuffle=True, random_state=42).split(X, y))
+    yPred = cross_val_predict(pipeline, X, y, cv=splits, n_jobs=nJobs)
+    return yPred, [float(accuracy_score(y[test], yPred[test])) for _, test in splits]
+
+
+def outOfBagPredictions(forest: RandomForestClassifier, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """True and predicted labels for the rows left out of at least one tree of a forest fit with oob_score."""
+    decision = forest.oob_decision_function_
+    scored = ~np.isnan(decision).any(axis=1) & (decision.sum(axis=1) > 0)
+    return y[scored], forest.classes_[np.argmax(decision[scored], axis=1)]
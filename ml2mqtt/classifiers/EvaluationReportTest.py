@@ -0,0 +1,106 @@
+import pickle
+import unittest
+import numpy as np
+from unittest import mock
+from classifiers.EvaluationReport import (EvaluationReport, resolveEvaluationMode, EVALUATION_HOLDOUT,
+                                          EVALUATION_CROSS_VALIDATION, EVALUATION_OUT_OF_BAG)
+from classifiers.FastPredictorTest import makeMatrix, makeObservations
+from classifiers.KNNClassifier import KNNClassifier
+from classifiers.RandomForest import RandomForest
+
+
+class TestEvaluationReport(unittest.TestCase):
+    def test_from_predictions(self):
+        report = EvaluationReport.fromPredictions([0, 0, 1, 1], [0, 1, 1, 1], ["garage", "hall"], trainRows=12)
+        self.assertEqual(report.accuracy, 0.75)
+        self.assertEqual(report.confusionMatrix, [[1, 1], [0, 2]])
+        self.assertEqual(report.labelStats["garage"]["support"], 2)
+        self.assertEqual(report.labelStats["hall"]["recall"], 1.0)
+        self.assertEqual((report.trainRows, report.testRows), (12, 4))
+
+    def test_label_stats_are_copies(self):
+        report = EvaluationReport.fromPredictions([0, 1], [0, 1], ["garage", "hall"])
+        report.getLabelStats()["garage"]["observations"] = 5
+        self.assertNotIn("observations", report.labelStats["garage"])
+
+    def test_classifiers_do_not_predict_per_page_view(self):
+        # KNN has no notion of a missing value, so the fixtures have no gaps.
+        matrix = makeMatrix(makeObservations(300, withGaps=False))
+        for classifier in (RandomForest({"n_estimators": 10}), KNNClassifier()):
+            classifier.populateDataframe(matrix)
+            report = classifier.getEvaluationReport()
+            self.assertEqual(report.trainRows + report.testRows, 300)
+            with mock.patch.object(classifier._pipeline, "predict", side_effect=AssertionError):
+                self.assertEqual(classifier.getAccuracy(), report.accuracy)
+                self.assertEqual(set(classifier.getLabelStats()), {"kitchen", "lounge", "bedroom"})
+
+    def test_feature_importance_follows_preprocessor_order(self):
+        classifier = RandomForest({"n_estimators": 10})
+        classifier.populateDataframe(makeMatrix(makeObservations(300)))
+        importance = classifier.getFeatureImportance()
+        self.assertEqual(set(importance), set(classifier._X_test.columns))
+        # "media" is the only string sensor and carries no signal.
+        self.assertLess(importance["media"], importance["rssi_a"])
+
+    def test_report_survives_artifact_round_trip(self):
+        classifier = RandomForest({"n_estimators": 10})
+        classifier.populateDataframe(makeMatrix(makeObservations(200)))
+        restored = RandomForest({"n_estimators": 10})
+        restored.loadArtifact(pickle.loads(pickle.dumps(classifier.getArtifact())))
+        self.assertEqual(restored.getEvaluationReport().to_dict(), classifier.getEvaluationReport().to_dict())
+
+    def test_artifacts_hold_no_training_rows(self):
+        matrix = makeMatrix(makeObservations(200, withGaps=False))
+        for classifier in (RandomForest({"n_estimators": 10}), KNNClassifier()):
+            classifier.populateDataframe(matrix)
+            artifact = classifier.getArtifact()
+            self.assertNotIn("X_test", artifact)
+            self.assertNotIn("y_test", artifact)
+            self.assertEqual(artifact["columns"], classifier._X_test.columns.tolist())
+
+            restored = type(classifier)()
+            restored.loadArtifact(pickle.loads(pickle.dumps(artifact)))
+            query = makeObservations(1, seed=1, withGaps=False)[0].sensorValues
+            self.assertEqual(restored.predictLabel(query), classifier.predictLabel(query))
+
+    def test_fold_accuracies_give_mean_and_spread(self):
+        report = EvaluationReport.fromPredictions([0, 1, 0, 1], [0, 1, 1, 1], ["garage", "hall"],
+                                                  method=EVALUATION_CROSS_VALIDATION, foldAccuracies=[1.0, 0.5])
+        self.assertEqual((report.accuracy, report.accuracyStd, report.folds), (0.75, 0.25, 2))
+
+    def test_modes_fall_back_when_unusable(self):
+        y = np.array([0, 0, 0, 1, 1, 1])
+        self.assertEqual(resolveEvaluationMode(EVALUATION_OUT_OF_BAG, y, 5), EVALUATION_CROSS_VALIDATION)
+        self.assertEqual(resolveEvaluationMode(EVALUATION_OUT_OF_BAG, y, 5, outOfBag=True), EVALUATION_OUT_OF_BAG)
+        self.assertEqual(resolveEvaluationMode(EVALUATION_CROSS_VALIDATION, np.array([0, 0, 1]), 5), EVALUATION_HOLDOUT)
+
+    def test_cross_validation_serves_a_model_fit_on_every_row(self):
+        matrix = makeMatrix(makeObservations(300, withGaps=False))
+        for classifier in (RandomForest({"n_estimators": 10}, evaluationMode=EVALUATION_CROSS_VALIDATION, cvFolds=4, nJobs=1),
+                           KNNClassifier(evaluationMode=EVALUATION_CROSS_VALIDATION, cvFolds=4, nJobs=1)):
+            classifier.populateDataframe(matrix)
+            report = classifier.getEvaluationReport()
+            self.assertEqual((report.method, report.folds), (EVALUATION_CROSS_VALIDATION, 4))
+            self.assertEqual((report.trainRows, report.testRows), (300, 300))
+            self.assertIsNotNone(report.accuracyStd)
+            self.assertEqual(sum(map(sum, report.confusionMatrix)), 300)
+
+    def test_out_of_bag_is_deterministic_for_a_seeded_forest(self):
+        matrix = makeMatrix(makeObservations(300))
+        reports = []
+        for _ in range(2):
+            classifier = RandomForest({"n_estimators": 30, "random_state": 1}, evaluationMode=EVALUATION_OUT_OF_BAG)
+            classifier.populateDataframe(matrix)
+            reports.append(classifier.getEvaluationReport())
+        self.assertEqual(reports[0].method, EVALUATION_OUT_OF_BAG)
+        self.assertEqual(reports[0].trainRows, 300)
+        self.assertEqual(reports[0].accuracy, reports[1].accuracy)
+
+    def test_holdout_is_the_default(self):
+        classifier = KNNClassifier()
+        classifier.populateDataframe(makeMatrix(makeObservations(100, withGaps=False)))
+        self.assertEqual(classifier.getEvaluationReport().method, EVALUATION_HOLDOUT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import math
+import numpy as np
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import LabelEncoder
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class FastPredictor:
+    """
+    Single-row inference path frozen from a fitted preprocessor/classifier pipeline.
+
+    The ColumnTransformer is replaced by a precomputed column order and dict-based ordinal
+    lookups, so a prediction is one NumPy row and one predict_proba call. Results match
+    Pipeline.predict / predict_proba on a one-row DataFrame reindexed to the training columns.
+    """
+
+    def __init__(self, pipeline: Pipeline, labelEncoder: LabelEncoder):
+        preprocessor = pipeline.named_steps["preprocessor"]
+        self._estimator = pipeline.named_steps["classifier"]
+
+        # (column, lookup) in the order the ColumnTransformer emits them. A lookup of None
+        # marks a passthrough column.
+        self._columns: List[Tuple[str, Optional[Dict[Any, int]]]] = []
+        for name, transformer, columns in preprocessor.transformers_:
+            if name == "remainder" or len(columns) == 0:
+                continue
+            if name == "cat":
+                for column, categories in zip(columns, transformer.categories_):
+                    lookup = {category: code for code, category in enumerate(categories) if not _isMissing(category)}
+                    self._columns.append((column, lookup))
+            else:
+                for column in columns:
+                    self._columns.append((column, None))
+
+        self._unknownValue = float(getattr(preprocessor.named_transformers_.get("cat"), "unknown_value", -1))
+        self._labels = labelEncoder.classes_[self._estimator.classes_]
+
+    @property
+    def featureNames(self) -> List[str]:
+        """Feature names in the order the classifier sees them."""
+        return [column for column, _ in self._columns]
+
+    def encode(self, sensorValues: Dict[str, Any]) -> np.ndarray:
+        row = np.empty(len(self._columns), dtype=np.float64)
+        for i, (column, lookup) in enumerate(self._columns):
+            value = sensorValues.get(column)
+            if _isMissing(value):
+                row[i] = np.nan
+            elif lookup is None:
+                row[i] = float(value)
+            else:
+                row[i] = lookup.get(value, self._unknownValue)
+        return row
+
+    def predict(self, sensorValues: Dict[str, Any]) -> Tuple[Any, float]:
+        probabilities = self._estimator.predict_proba(self.encode(sensorValues)[np.newaxis, :])[0]
+        index = int(np.argmax(probabilities))
+        return self._labels[index], probabilities[index]
+
+    def predictMany(self, rows: List[Dict[str, Any]]) -> List[Tuple[Any, float]]:
+        """predict() for several rows at the price of one predict_proba call."""
+        if not rows:
+            return []
+        probabilities = self._estimator.predict_proba(np.vstack([self.encode(row) for row in rows]))
+        indices = np.argmax(probabilities, axis=1)
+        return [(self._labels[index], probabilities[i, index]) for i, index in enumerate(indices)]
+
+
+def _isMissing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
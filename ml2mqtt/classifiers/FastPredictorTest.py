@@ -0,0 +1,73 @@
+import os
+import random
+import tempfile
+import unittest
+import pandas as pd
+from ModelStore import ModelObservation, ModelStore
+from classifiers.RandomForest import RandomForest
+from classifiers.KNNClassifier import KNNClassifier
+
+
+def makeObservations(count, seed=0, withGaps=True):
+    rng = random.Random(seed)
+    observations = []
+    for i in range(count):
+        label = rng.choice(["kitchen", "lounge", "bedroom"])
+        offset = {"kitchen": 0, "lounge": 20, "bedroom": 40}[label]
+        sensors = {
+            "rssi_a": -60 - offset + rng.gauss(0, 8),
+            "rssi_b": -80 + offset + rng.gauss(0, 8),
+            "media": rng.choice(["tv", "radio", "off"]),
+        }
+        # With gaps, the power sensor only appears part way through, like a sensor added later.
+        if not withGaps or i >= count // 3:
+            sensors["power"] = rng.uniform(0, 200)
+        observations.append(ModelObservation(i, label, sensors))
+    return observations
+
+
+def makeMatrix(observations):
+    store = ModelStore(os.path.join(tempfile.mkdtemp(), "test.db"))
+    for observation in observations:
+        store.addObservation(observation.label, observation.sensorValues, observation.time)
+    matrix = store.getObservationMatrix()
+    store.close()
+    return matrix
+
+
+def pipelinePrediction(classifier, sensorValues):
+    X = pd.DataFrame([sensorValues]).reindex(columns=classifier._X_test.columns, fill_value=None)
+    label = classifier.labelEncoder.inverse_transform(classifier._pipeline.predict(X))[0]
+    return label, max(classifier._pipeline.predict_proba(X)[0])
+
+
+class TestFastPredictor(unittest.TestCase):
+    def assertMatchesPipeline(self, classifier, withGaps):
+        classifier.populateDataframe(makeMatrix(makeObservations(300, withGaps=withGaps)))
+        queries = [observation.sensorValues for observation in makeObservations(200, seed=1, withGaps=withGaps)]
+        queries.append({"rssi_a": -70.0, "rssi_b": -75.0, "power": 3.0, "media": "podcast"})
+        for query in queries:
+            label, confidence = classifier.predictLabel(query)
+            expectedLabel, expectedConfidence = pipelinePrediction(classifier, query)
+            self.assertEqual(label, expectedLabel)
+            self.assertAlmostEqual(confidence, expectedConfidence)
+
+    def test_random_forest_matches_pipeline(self):
+        self.assertMatchesPipeline(RandomForest(), withGaps=True)
+
+    def test_knn_matches_pipeline(self):
+        self.assertMatchesPipeline(KNNClassifier({"n_neighbors": 5, "weights": "distance", "p": 2}), withGaps=False)
+
+    def test_missing_categorical_value(self):
+        classifier = RandomForest()
+        classifier.populateDataframe(makeMatrix(makeObservations(300)))
+        label, confidence = classifier.predictLabel({"rssi_a": -60.0, "rssi_b": -80.0, "power": 12.5})
+        self.assertIn(label, ["kitchen", "lounge", "bedroom"])
+        self.assertGreater(confidence, 0)
+
+    def test_untrained_model(self):
+        self.assertEqual(RandomForest().predictLabel({"rssi_a": 1.0}), (None, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
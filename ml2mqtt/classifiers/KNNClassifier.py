@@ -2,13 +2,17 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import LabelEncoder, OrdinalEncoder
 from sklearn.neighbors import KNeighborsClassifier
-from sklearn.model_selection import train_test_split, GridSearchCV, RandomizedSearchCV
-from sklearn.metrics import accuracy_score, classification_report
+from sklearn.model_selection import train_test_split, ParameterSampler
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 import logging
 from typing import TypedDict, Optional, List, Dict, Any, Union
-from ModelStore import ModelObservation
+from ModelStore import ObservationMatrix
+from classifiers.EvaluationReport import (EvaluationReport, resolveEvaluationMode, crossValidatedPredictions,
+                                          EVALUATION_HOLDOUT, EVALUATION_CROSS_VALIDATION, DEFAULT_CV_FOLDS)
+from classifiers.FastPredictor import FastPredictor
+from classifiers.KNNIndex import KNNIndex
+from classifiers.ParameterSearch import ParameterSearch, ProgressCallback, SEARCH_HALVING, SEARCH_TWO_STAGE
 
 
 class KNNParams(TypedDict):
@@ -25,8 +29,13 @@ DEFAULT_KNN_PARAMS: KNNParams = {
 
 
 class KNNClassifier:
-    def __init__(self, params: Optional[KNNParams] = None):
+    def __init__(self, params: Optional[KNNParams] = None, evaluationMode: str = EVALUATION_HOLDOUT,
+                 cvFolds: int = DEFAULT_CV_FOLDS, nJobs: Optional[int] = -1):
         self.params: KNNParams = {**DEFAULT_KNN_PARAMS, **(params or {})}
+        # KNN has no out-of-bag estimate, so that mode falls back to cross-validation.
+        self._evaluationMode = evaluationMode
+        self._cvFolds = cvFolds
+        self._nJobs = nJobs
 
         self.logger: logging.Logger = logging.getLogger(__name__)
         self.logger.info(f"KNNClassifier initialized with params: {self.params}")
@@ -36,24 +45,23 @@ class KNNClassifier:
         self.labelEncoder: LabelEncoder = LabelEncoder()
         self._modelTrained: bool = False
         self._categoricalCols: List[str] = []
+        self._columns: List[str] = []
+        self._fastPredictor: Optional[FastPredictor] = None
+        # Serves predictions; unlike the pipeline it takes new and deleted rows in place.
+        self._index: Optional[KNNIndex] = None
+        self._report: Optional[EvaluationReport] = None
         self._ordinalEncoder = OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1);
 
-    def populateDataframe(self, observations: List[ModelObservation]) -> None:
-        data: List[Dict[str, Any]] = []
-        labels: List[str] = []
-
-        for observation in observations:
-            data.append(observation.sensorValues)
-            labels.append(observation.label)
-
-        if not data or not labels:
+    def populateDataframe(self, observations: ObservationMatrix) -> None:
+        if len(observations) == 0:
             self.logger.warning("No data available for training.")
             self._modelTrained = False
             return
 
-        X = pd.DataFrame.from_records(data)
-        y = self.labelEncoder.fit_transform(labels)
+        X = observations.toDataFrame()
+        y = self.labelEncoder.fit_transform(observations.labels)
 
+        self._columns = X.columns.tolist()
         self._categoricalCols = X.select_dtypes(include=["object", "category"]).columns.tolist()
         numericalCols = X.select_dtypes(include=[np.number]).columns.tolist()
 
@@ -67,95 +75,143 @@ class KNNClassifier:
             ('classifier', KNeighborsClassifier(**self.params))
         ])
 
+        mode = resolveEvaluationMode(self._evaluationMode, y, self._cvFolds)
         try:
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3)
+            if mode == EVALUATION_CROSS_VALIDATION:
+                # The served model learns from every row; the report comes from out-of-fold predictions.
+                X_train, X_test, y_train, y_test, times_train = X, X.iloc[:0], y, y[:0], observations.times
+            else:
+                X_train, X_test, y_train, y_test, times_train, _ = train_test_split(X, y, observations.times, test_size=0.3)
             self._pipeline.fit(X_train, y_train)
+            self._fastPredictor = FastPredictor(self._pipeline, self.labelEncoder)
+            self._buildIndex(X_train, y_train, times_train)
             self._X_test = X_test
             self._y_test = y_test
+            if mode == EVALUATION_CROSS_VALIDATION:
+                yPred, foldAccuracies = crossValidatedPredictions(self._pipeline, X, y, self._cvFolds, self._nJobs)
+                self._report = self._evaluate(y, yPred, len(X_train), mode, foldAccuracies)
+            else:
+                self._report = self._evaluate(y_test, self._pipeline.predict(X_test), len(X_train))
             self._modelTrained = True
         except ValueError as e:
             self.logger.info(f"Not enough data to train the model: {e}")
             self._modelTrained = False
 
+    def getArtifact(self) -> Optional[Dict[str, Any]]:
+        """The fitted state needed to serve this model again without retraining."""
+        if not self._modelTrained or self._pipeline is None:
+            return None
+        return {
+            "pipeline": self._pipeline,
+            "label_encoder": self.labelEncoder,
+            "columns": self._columns,
+            "categorical_columns": self._categoricalCols,
+            "index": self._index,
+            "report": self._report,
+        }
+
+    def loadArtifact(self, artifact: Dict[str, Any]) -> None:
+        self._pipeline = artifact["pipeline"]
+        self.labelEncoder = artifact["label_encoder"]
+        self._categoricalCols = artifact["categorical_columns"]
+        self._columns = artifact["columns"]
+        # The held-out rows are not persisted; the report already summarises them.
+        self._X_test = None
+        self._y_test = None
+        self._fastPredictor = FastPredictor(self._pipeline, self.labelEncoder)
+        self._index = artifact["index"]
+        self._report = artifact["report"]
+        self._modelTrained = True
+
+    def _buildIndex(self, X_train: pd.DataFrame, y_train: np.ndarray, times_train: np.ndarray) -> None:
+        p = {"euclidean": 2, "manhattan": 1}.get(self.params.get("metric", "minkowski"), self.params.get("p", 2))
+        index = KNNIndex(self.params.get("n_neighbors", 5), self.params.get("weights", "uniform"), p,
+                         self.params.get("algorithm", "auto"))
+        vectors = np.asarray(self._pipeline.named_steps["preprocessor"].transform(X_train), dtype=np.float64)
+        index.build(vectors, self.labelEncoder.classes_[y_train].tolist(), np.asarray(times_train, dtype=np.float64),
+                    self.labelEncoder.classes_.tolist())
+        self._index = index
+
+    def _encode(self, sensorValues: Dict[str, Any]) -> Optional[np.ndarray]:
+        vector = self._fastPredictor.encode(sensorValues)
+        # The neighbour search, like sklearn's, has no notion of a missing value.
+        return None if np.isnan(vector).any() else vector
+
     def predictLabel(self, sensorValues: Dict[str, Any]) -> tuple[Optional[str], int]:
-        if not self._pipeline or not self._modelTrained:
+        if not self._pipeline or not self._modelTrained or self._fastPredictor is None or self._index is None:
             return None, 0
 
-        X = pd.DataFrame([sensorValues])
-        X = X.reindex(columns=self._X_test.columns, fill_value=None)
-
         try:
-            y_pred = self._pipeline.predict(X)
-            y_prob = self._pipeline.predict_proba(X)
-
-            label = self.labelEncoder.inverse_transform(y_pred)[0]
-            confidence = max(y_prob[0])  # Confidence level as the probability of the predicted label
-
-            return label, confidence
+            vector = self._encode(sensorValues)
+            if vector is None:
+                self.logger.error("Prediction failed: observation has missing sensor values")
+                return None, 0
+            return self._index.predict(vector)
         except Exception as e:
             self.logger.error(f"Prediction failed: {e}")
             return None, 0
 
+    def predictLabels(self, rows: List[Dict[str, Any]]) -> List[tuple[Optional[str], int]]:
+        return [self.predictLabel(row) for row in rows]
+
+    learnsOnline = True
+
+    def learnOne(self, label: str, sensorValues: Dict[str, Any], observationTime: float) -> bool:
+        """Append a training observation to the neighbour index. False if a full fit is needed instead."""
+        if not self._modelTrained or self._index is None or self._fastPredictor is None:
+            return False
+        if not set(sensorValues).issubset(self._columns):
+            # A sensor first seen after the last fit would be dropped by the encoder.
+            return False
+        vector = self._encode(sensorValues)
+        if vector is None:
+            # Not something the index can hold, so it is only learnt by the next full fit.
+            return False
+        self._index.append(vector, label, observationTime)
+        return True
+
+    def forgetObservations(self, predicate) -> bool:
+        """Drop indexed rows for which predicate(times, labels) holds. False if a full fit is needed instead."""
+        if not self._modelTrained or self._index is None:
+            return False
+        self._index.remove(predicate)
+        return len(self._index) > 0
+
     def getFeatureImportance(self) -> Optional[Dict[str, float]]:
         self.logger.info("KNN does not provide feature importances.")
         return None
 
+    def _evaluate(self, yTrue: np.ndarray, yPred: np.ndarray, trainRows: int, method: str = EVALUATION_HOLDOUT,
+                  foldAccuracies: Optional[List[float]] = None) -> EvaluationReport:
+        """Build the report for this fit. Rows learned online since are not reflected."""
+        return EvaluationReport.fromPredictions(yTrue, yPred, self.labelEncoder.classes_, trainRows=trainRows,
+                                                method=method, foldAccuracies=foldAccuracies)
+
+    def getEvaluationReport(self) -> Optional[EvaluationReport]:
+        return self._report if self._modelTrained else None
+
     def getAccuracy(self) -> Optional[float]:
-        if not self._modelTrained or self._pipeline is None:
+        if not self._modelTrained or self._report is None:
             self.logger.warning("Model is not trained. Accuracy unavailable.")
             return None
-
-        try:
-            y_pred = self._pipeline.predict(self._X_test)
-            return accuracy_score(self._y_test, y_pred)
-        except Exception as e:
-            self.logger.error(f"Accuracy calculation failed: {e}")
-            return None
+        return self._report.accuracy
 
     def getLabelStats(self) -> Optional[Dict[str, Any]]:
-        if not self._modelTrained or self._pipeline is None:
+        if not self._modelTrained or self._report is None:
             return None
+        return self._report.getLabelStats()
 
-        try:
-            y_pred = self._pipeline.predict(self._X_test)
-            report = classification_report(
-                self._y_test,
-                y_pred,
-                labels=np.arange(len(self.labelEncoder.classes_)),
-                target_names=self.labelEncoder.classes_,
-                output_dict=True,
-                zero_division=0
-            )
-
-            return {
-                label: {
-                    "support": int(stats["support"]),
-                    "precision": round(stats["precision"], 3),
-                    "recall": round(stats["recall"], 3),
-                    "f1": round(stats["f1-score"], 3),
-                }
-                for label, stats in report.items()
-                if label in self.labelEncoder.classes_
-            }
-        except Exception as e:
-            self.logger.error(f"Label stats generation failed: {e}")
-            return None
-
-    def optimizeParameters(self, observations: List[ModelObservation]) -> Dict[str, Any]:
-        data: List[Dict[str, Any]] = []
-        labels: List[str] = []
-
-        for observation in observations:
-            data.append(observation.sensorValues)
-            labels.append(observation.label)
-
-        if not data or not labels:
+    def optimizeParameters(self, observations: ObservationMatrix, nJobs: Optional[int] = -1,
+                           progress: Optional[ProgressCallback] = None,
+                           strategy: str = SEARCH_TWO_STAGE) -> Dict[str, Any]:
+        if len(observations) == 0:
             self.logger.warning("No data available for optimization.")
             return {}
 
-        X = pd.DataFrame.from_records(data)
-        y = self.labelEncoder.fit_transform(labels)
+        X = observations.toDataFrame()
+        y = self.labelEncoder.fit_transform(observations.labels)
 
+        self._columns = X.columns.tolist()
         self._categoricalCols = X.select_dtypes(include=["object", "category"]).columns.tolist()
         numericalCols = X.select_dtypes(include=[np.number]).columns.tolist()
 
@@ -164,7 +220,8 @@ class KNNClassifier:
             ('num', 'passthrough', numericalCols)
         ])
 
-        X_trainval, X_test_final, y_trainval, y_test_final = train_test_split(X, y, test_size=0.3, random_state=42)
+        X_trainval, X_test_final, y_trainval, y_test_final, times_trainval, _ = train_test_split(
+            X, y, observations.times, test_size=0.3, random_state=42)
 
         paramGrid = {
             "classifier__n_neighbors": list(range(1, 31)),
@@ -178,20 +235,15 @@ class KNNClassifier:
                 ('classifier', KNeighborsClassifier())
             ])
 
-            search = RandomizedSearchCV(
-                estimator=pipeline,
-                param_distributions=paramGrid,
-                n_iter=20,
-                scoring='accuracy',
-                cv=3,
-                n_jobs=-1,
-                random_state=42,
-                verbose=1,
-                refit=True
-            )
-
-            search.fit(X_trainval, y_trainval)
-            bestParamsFull = search.best_params_
+            search = ParameterSearch(pipeline, X_trainval, y_trainval, nJobs=nJobs, progress=progress)
+            if strategy == SEARCH_HALVING:
+                candidates = list(ParameterSampler(paramGrid, n_iter=60, random_state=42))
+                # Every training fold needs at least n_neighbors rows, or large-k candidates would
+                # fail on the small early subsamples and be pruned unfairly.
+                minResources = max(paramGrid["classifier__n_neighbors"]) * 3 // 2 + len(self.labelEncoder.classes_)
+                bestParamsFull, _ = search.halvingSearch(candidates, cv=3, minResources=minResources)
+            else:
+                bestParamsFull, _ = search.randomSearch(paramGrid, nIter=20, cv=3, randomState=42)
             bestParams = {
                 k.replace('classifier__', ''): v
                 for k, v in bestParamsFull.items()
@@ -200,13 +252,14 @@ class KNNClassifier:
             self.logger.info(f"Best KNN parameters: {bestParams}")
             self.params = bestParams
 
-            finalAccuracy = accuracy_score(y_test_final, search.best_estimator_.predict(X_test_final))
-            self.logger.info(f"Final accuracy on held-out test set: {round(finalAccuracy, 4)}")
-
-            self._pipeline = search.best_estimator_
+            self._pipeline = search.fit(bestParamsFull)
+            self._fastPredictor = FastPredictor(self._pipeline, self.labelEncoder)
+            self._buildIndex(X_trainval, y_trainval, times_trainval)
             self._X_test = X_test_final
             self._y_test = y_test_final
+            self._report = self._evaluate(y_test_final, self._pipeline.predict(X_test_final), len(X_trainval))
             self._modelTrained = True
+            self.logger.info(f"Final accuracy on held-out test set: {round(self._report.accuracy, 4)}")
 
             return bestParams
 
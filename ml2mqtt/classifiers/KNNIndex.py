@@ -0,0 +1,210 @@
+import threading
+import numpy as np
+from sklearn.neighbors import BallTree, KDTree
+from typing import Any, Callable, List, Optional, Tuple
+
+DEFAULT_REBUILD_THRESHOLD = 0.25
+DEFAULT_MIN_TREE_SIZE = 512
+
+
+class KNNIndex:
+    """
+    Append-friendly neighbour index for KNNClassifier.
+
+    Encoded feature vectors live in preallocated NumPy storage that doubles when full, next
+    to their label codes and observation times. New rows are appended in place and deleted
+    rows are tombstoned, so neither needs a refit.
+
+    Once there are at least `minTreeSize` rows a KD-tree (or ball tree) covers the rows that
+    existed at the last rebuild; rows appended since are scanned by brute force and
+    tombstoned rows are filtered from tree results. The tree is rebuilt, compacting the
+    storage, only when appended plus deleted rows exceed `rebuildThreshold` of the tree.
+    """
+
+    def __init__(self, nNeighbors: int = 5, weights: str = "uniform", p: float = 2,
+                 algorithm: str = "auto", rebuildThreshold: float = DEFAULT_REBUILD_THRESHOLD,
+                 minTreeSize: int = DEFAULT_MIN_TREE_SIZE):
+        self.nNeighbors = max(1, int(nNeighbors))
+        self.weights = weights
+        self.p = float(p)
+        self.algorithm = algorithm
+        self.rebuildThreshold = rebuildThreshold
+        self.minTreeSize = minTreeSize
+        self.classes: List[str] = []
+        self.rebuilds = 0
+
+        self._lock = threading.RLock()
+        self._vectors = np.empty((0, 0), dtype=np.float64)
+        self._labels = np.empty(0, dtype=np.int32)
+        self._times = np.empty(0, dtype=np.float64)
+        self._alive = np.empty(0, dtype=bool)
+        self._size = 0
+        self._deleted = 0
+        self._tree: Optional[Any] = None
+        self._treeSize = 0
+        self._deletedInTree = 0
+
+    def build(self, vectors: np.ndarray, labels: List[str], times: np.ndarray, classes: List[str]) -> None:
+        with self._lock:
+            self.classes = list(classes)
+            codes = {label: code for code, label in enumerate(self.classes)}
+            count, width = vectors.shape
+            capacity = max(16, count * 2)
+            self._vectors = np.empty((capacity, width), dtype=np.float64)
+            self._labels = np.empty(capacity, dtype=np.int32)
+            self._times = np.empty(capacity, dtype=np.float64)
+            self._alive = np.zeros(capacity, dtype=bool)
+            self._vectors[:count] = vectors
+            self._labels[:count] = [codes[label] for label in labels]
+            self._times[:count] = times
+            self._alive[:count] = True
+            self._size = count
+            self._deleted = 0
+            self._rebuildTree()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._size - self._deleted
+
+    def append(self, vector: np.ndarray, label: str, time: float) -> None:
+        with self._lock:
+            if label not in self.classes:
+                self.classes.append(label)
+            if self._size == len(self._labels):
+                self._grow()
+            self._vectors[self._size] = vector
+            self._labels[self._size] = self.classes.index(label)
+            self._times[self._size] = time
+            self._alive[self._size] = True
+            self._size += 1
+            self._maybeRebuild()
+
+    def remove(self, predicate: Callable[[np.ndarray, np.ndarray], np.ndarray]) -> int:
+        """Tombstone the rows for which predicate(times, labels) is true. Returns how many."""
+        with self._lock:
+            labels = np.asarray(self.classes, dtype=object)[self._labels[:self._size]] if self.classes else np.empty(0, dtype=object)
+            matches = np.asarray(predicate(self._times[:self._size], labels), dtype=bool) & self._alive[:self._size]
+            removed = int(matches.sum())
+            if removed:
+                self._alive[:self._size][matches] = False
+                self._deleted += removed
+                self._deletedInTree += int(matches[:self._treeSize].sum())
+                self._maybeRebuild()
+            return removed
+
+    def predictProba(self, vector: np.ndarray) -> Optional[np.ndarray]:
+        """Class probabilities over `classes`, or None if the index is empty."""
+        with self._lock:
+            if len(self) == 0:
+                return None
+            distances, indices = self._kNearest(vector)
+            probabilities = np.zeros(len(self.classes), dtype=np.float64)
+            labels = self._labels[indices]
+            if self.weights == "distance":
+                exact = distances == 0
+                # Like sklearn, exact matches outvote everything else.
+                weights = exact.astype(np.float64) if exact.any() else 1.0 / distances
+            else:
+                weights = np.ones(len(indices), dtype=np.float64)
+            np.add.at(probabilities, labels, weights)
+            return probabilities / probabilities.sum()
+
+    def predict(self, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        probabilities = self.predictProba(vector)
+        if probabilities is None:
+            return None, 0
+        index = int(np.argmax(probabilities))
+        return self.classes[index], probabilities[index]
+
+    def getStats(self) -> dict:
+        with self._lock:
+            return {
+                "rows": len(self),
+                "capacity": len(self._labels),
+                "tree_rows": self._treeSize,
+                "appended_since_rebuild": self._size - self._treeSize,
+                "deleted_since_rebuild": self._deleted,
+                "rebuilds": self.rebuilds,
+            }
+
+    def _grow(self) -> None:
+        capacity = max(16, len(self._labels) * 2)
+        width = self._vectors.shape[1]
+        for name, shape, dtype in [("_vectors", (capacity, width), np.float64), ("_labels", capacity, np.int32),
+                                   ("_times", capacity, np.float64), ("_alive", capacity, bool)]:
+            grown = np.zeros(shape, dtype=dtype)
+            grown[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, grown)
+
+    def _imbalance(self) -> float:
+        return (self._size - self._treeSize + self._deleted) / max(1, self._treeSize)
+
+    def _maybeRebuild(self) -> None:
+        if self._tree is None and len(self) < self.minTreeSize:
+            # Small indexes stay brute force; only compact once tombstones pile up.
+            if self._deleted > max(16, self._size * self.rebuildThreshold):
+                self._rebuildTree()
+            return
+        if self._imbalance() > self.rebuildThreshold:
+            self._rebuildTree()
+
+    def _rebuildTree(self) -> None:
+        live = self._alive[:self._size]
+        count = int(live.sum())
+        self._vectors[:count] = self._vectors[:self._size][live]
+        self._labels[:count] = self._labels[:self._size][live]
+        self._times[:count] = self._times[:self._size][live]
+        self._alive[:count] = True
+        self._alive[count:self._size] = False
+        self._size = count
+        self._deleted = 0
+        self._deletedInTree = 0
+
+        if self.algorithm == "brute" or count < self.minTreeSize:
+            self._tree = None
+            self._treeSize = 0
+        else:
+            treeType = BallTree if self.algorithm == "ball_tree" else KDTree
+            self._tree = treeType(self._vectors[:count].copy(), metric="minkowski", p=self.p)
+            self._treeSize = count
+        self.rebuilds += 1
+
+    def _kNearest(self, vector: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(self.nNeighbors, len(self))
+        distances: List[np.ndarray] = []
+        indices: List[np.ndarray] = []
+
+        if self._tree is not None:
+            # Ask for enough extra neighbours to cover any tombstoned ones.
+            treeK = min(self._treeSize, k + self._deletedInTree)
+            treeDistances, treeIndices = self._tree.query(vector[np.newaxis, :], k=treeK)
+            alive = self._alive[treeIndices[0]]
+            distances.append(treeDistances[0][alive])
+            indices.append(treeIndices[0][alive])
+
+        start = self._treeSize
+        if self._size > start:
+            tail = np.flatnonzero(self._alive[start:self._size]) + start
+            difference = np.abs(self._vectors[tail] - vector)
+            if self.p == 2:
+                tailDistances = np.sqrt(np.einsum("ij,ij->i", difference, difference))
+            elif self.p == 1:
+                tailDistances = difference.sum(axis=1)
+            else:
+                tailDistances = (difference ** self.p).sum(axis=1) ** (1 / self.p)
+            distances.append(tailDistances)
+            indices.append(tail)
+
+        allDistances = np.concatenate(distances)
+        allIndices = np.concatenate(indices)
+        # Stable sort keeps the lower row first on ties, like sklearn's brute force search.
+        order = np.lexsort((allIndices, allDistances))[:k]
+        return allDistances[order], allIndices[order]
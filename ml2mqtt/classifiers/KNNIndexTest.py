@@ -0,0 +1,119 @@
+import pickle
+import unittest
+import numpy as np
+from sklearn.neighbors import KNeighborsClassifier
+from classifiers.FastPredictorTest import makeMatrix, makeObservations
+from classifiers.KNNClassifier import KNNClassifier
+from classifiers.KNNIndex import KNNIndex
+
+
+def sklearnPredictions(vectors, labels, queries, **params):
+    classifier = KNeighborsClassifier(**params).fit(vectors, labels)
+    probabilities = classifier.predict_proba(queries)
+    return [(classifier.classes_[row.argmax()], row.max()) for row in probabilities]
+
+
+class TestKNNIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(600, 4))
+        self.labels = np.array(["a", "b", "c"])[rng.integers(0, 3, 600)]
+        self.vectors[self.labels == "b"] += 1.5
+        self.times = np.arange(600, dtype=np.float64)
+        self.queries = rng.normal(size=(40, 4))
+
+    def makeIndex(self, count, **options):
+        index = KNNIndex(**options)
+        index.build(self.vectors[:count], self.labels[:count].tolist(), self.times[:count], ["a", "b", "c"])
+        return index
+
+    def assertMatchesSklearn(self, index, vectors, labels, weights="uniform", p=2):
+        expected = sklearnPredictions(vectors, labels, self.queries, n_neighbors=index.nNeighbors, weights=weights, p=p)
+        for query, (label, confidence) in zip(self.queries, expected):
+            predicted, predictedConfidence = index.predict(query)
+            self.assertEqual(predicted, label)
+            self.assertAlmostEqual(predictedConfidence, confidence)
+
+    def test_matches_sklearn(self):
+        for minTreeSize in [10000, 100]:
+            for weights in ["uniform", "distance"]:
+                for p in [1, 2, 3]:
+                    index = self.makeIndex(600, nNeighbors=7, weights=weights, p=p, minTreeSize=minTreeSize)
+                    self.assertMatchesSklearn(index, self.vectors, self.labels, weights, p)
+
+    def test_append_without_rebuild(self):
+        index = self.makeIndex(400, minTreeSize=100, rebuildThreshold=0.5)
+        rebuilds = index.rebuilds
+        for i in range(400, 550):
+            index.append(self.vectors[i], self.labels[i], self.times[i])
+
+        self.assertEqual(index.rebuilds, rebuilds)
+        self.assertEqual(index.getStats()["appended_since_rebuild"], 150)
+        self.assertMatchesSklearn(index, self.vectors[:550], self.labels[:550])
+
+    def test_rebuild_after_threshold(self):
+        index = self.makeIndex(400, minTreeSize=100, rebuildThreshold=0.25)
+        rebuilds = index.rebuilds
+        for i in range(400, 600):
+            index.append(self.vectors[i], self.labels[i], self.times[i])
+
+        self.assertGreater(index.rebuilds, rebuilds)
+        self.assertMatchesSklearn(index, self.vectors, self.labels)
+
+    def test_remove(self):
+        index = self.makeIndex(600, minTreeSize=100, rebuildThreshold=0.5)
+        keep = ~((self.times % 10 == 0) | (self.labels == "c") & (self.times > 500))
+        self.assertEqual(index.remove(lambda times, labels: (times % 10 == 0) | (labels == "c") & (times > 500)), (~keep).sum())
+        self.assertEqual(len(index), keep.sum())
+        self.assertMatchesSklearn(index, self.vectors[keep], self.labels[keep])
+
+    def test_new_label(self):
+        index = self.makeIndex(300)
+        for _ in range(5):
+            index.append(np.full(4, 50.0), "d", 1000.0)
+        self.assertEqual(index.predict(np.full(4, 49.0))[0], "d")
+
+    def test_pickle(self):
+        index = pickle.loads(pickle.dumps(self.makeIndex(600, minTreeSize=100)))
+        index.append(self.vectors[0], "a", 1000.0)
+        self.assertEqual(len(index), 601)
+
+
+class TestKNNClassifierIndex(unittest.TestCase):
+    def test_learn_and_forget_in_place(self):
+        classifier = KNNClassifier({"n_neighbors": 5, "weights": "uniform", "p": 2})
+        classifier.populateDataframe(makeMatrix(makeObservations(300, withGaps=False)))
+        rows = len(classifier._index)
+
+        extra = makeObservations(40, seed=2, withGaps=False)
+        for i, observation in enumerate(extra):
+            self.assertTrue(classifier.learnOne(observation.label, observation.sensorValues, 10000.0 + i))
+        self.assertEqual(len(classifier._index), rows + 40)
+
+        self.assertTrue(classifier.forgetObservations(lambda times, labels: times >= 10000.0))
+        self.assertEqual(len(classifier._index), rows)
+
+        query = makeObservations(1, seed=3, withGaps=False)[0].sensorValues
+        self.assertEqual(classifier.predictLabel(query), classifier._fastPredictor.predict(query))
+
+    def test_missing_values_need_full_fit(self):
+        classifier = KNNClassifier({"n_neighbors": 5, "weights": "uniform", "p": 2})
+        classifier.populateDataframe(makeMatrix(makeObservations(300, withGaps=False)))
+        rows = len(classifier._index)
+        self.assertFalse(classifier.learnOne("a", {}, 10000.0))
+        self.assertEqual(len(classifier._index), rows)
+
+    def test_new_sensor_needs_full_fit(self):
+        classifier = KNNClassifier({"n_neighbors": 5, "weights": "uniform", "p": 2})
+        classifier.populateDataframe(makeMatrix(makeObservations(300, withGaps=False)))
+        rows = len(classifier._index)
+        sensorValues = dict(makeObservations(1, seed=4, withGaps=False)[0].sensorValues, door=1.0)
+        self.assertFalse(classifier.learnOne("a", sensorValues, 10000.0))
+        self.assertEqual(len(classifier._index), rows)
+
+    def test_untrained_model_needs_full_fit(self):
+        self.assertFalse(KNNClassifier().learnOne("a", {"rssi_a": 1.0}, 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
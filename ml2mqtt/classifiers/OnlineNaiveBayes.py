@@ -0,0 +1,282 @@
+import math
+import threading
+import logging
+from collections import deque
+from typing import TypedDict, Optional, List, Dict, Any, Deque, Tuple
+from sklearn.model_selection import ParameterGrid
+from ModelStore import ObservationMatrix
+from classifiers.ParameterSearch import ProgressCallback, SEARCH_TWO_STAGE
+
+
+class OnlineNaiveBayesParams(TypedDict):
+    var_smoothing: float  # fraction of a sensor's overall variance added to every class variance
+    alpha: float          # additive smoothing for labels and string sensor values
+
+
+DEFAULT_ONLINE_NAIVE_BAYES_PARAMS: OnlineNaiveBayesParams = {
+    "var_smoothing": 1e-3,
+    "alpha": 1.0,
+}
+
+# Prequential (predict, then learn) results kept for accuracy and label statistics.
+EVALUATION_WINDOW = 1000
+
+
+def _isMissing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _numericValue(value: Any) -> Optional[float]:
+    """The value as a float, or None if it is a string sensor value. As in ModelStore, numeric strings are floats."""
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return float(value)
+
+
+class RunningStats:
+    """Welford mean and variance, updated one value at a time."""
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count else 0.0
+
+
+class OnlineNaiveBayes:
+    """
+    Naive Bayes that learns one observation at a time.
+
+    Float sensors are modelled as a Gaussian per label, string sensors as smoothed value
+    counts per label. learnOne() updates the running statistics in O(sensors), so EAGER
+    learning never refits. New labels and new sensors are picked up as they appear, and a
+    sensor missing from an observation is simply left out of its likelihood.
+
+    Accuracy and label statistics are prequential: each observation is predicted before it
+    is learned, over the last EVALUATION_WINDOW observations.
+    """
+
+    learnsOnline = True
+
+    def __init__(self, params: Optional[OnlineNaiveBayesParams] = None):
+        self.params: OnlineNaiveBayesParams = {**DEFAULT_ONLINE_NAIVE_BAYES_PARAMS, **(params or {})}
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.logger.info(f"OnlineNaiveBayes initialized with params: {self.params}")
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._labelCounts: Dict[str, int] = {}
+        self._total = 0
+        self._numeric: Dict[str, Dict[str, RunningStats]] = {}
+        self._numericOverall: Dict[str, RunningStats] = {}
+        self._categorical: Dict[str, Dict[str, Dict[Any, int]]] = {}
+        self._categoricalTotals: Dict[str, Dict[str, int]] = {}
+        self._categoryValues: Dict[str, set] = {}
+        self._evaluations: Deque[Tuple[str, Optional[str]]] = deque(maxlen=EVALUATION_WINDOW)
+
+    def populateDataframe(self, observations: ObservationMatrix) -> None:
+        with self._lock:
+            self._reset()
+            if len(observations) == 0:
+                self.logger.warning("No data available for training.")
+                return
+            for label, sensorValues in zip(observations.labels, self._rows(observations)):
+                self._evaluateAndLearn(label, sensorValues)
+
+    @staticmethod
+    def _rows(observations: ObservationMatrix):
+        X = observations.toDataFrame()
+        columns = X.columns.tolist()
+        for values in X.itertuples(index=False, name=None):
+            yield {column: value for column, value in zip(columns, values) if not _isMissing(value)}
+
+    def learnOne(self, label: str, sensorValues: Dict[str, Any], observationTime: Optional[float] = None) -> bool:
+        with self._lock:
+            self._evaluateAndLearn(label, sensorValues)
+        return True
+
+    def _evaluateAndLearn(self, label: str, sensorValues: Dict[str, Any]) -> None:
+        if self._total:
+            self._evaluations.append((str(label), self._predict(sensorValues)[0]))
+        self._learn(label, sensorValues)
+
+    def _learn(self, label: str, sensorValues: Dict[str, Any]) -> None:
+        label = str(label)
+        self._labelCounts[label] = self._labelCounts.get(label, 0) + 1
+        self._total += 1
+        for name, value in sensorValues.items():
+            if _isMissing(value):
+                continue
+            number = _numericValue(value)
+            if number is None:
+                counts = self._categorical.setdefault(name, {}).setdefault(label, {})
+                counts[value] = counts.get(value, 0) + 1
+                totals = self._categoricalTotals.setdefault(name, {})
+                totals[label] = totals.get(label, 0) + 1
+                self._categoryValues.setdefault(name, set()).add(value)
+            elif not math.isnan(number):
+                self._numeric.setdefault(name, {}).setdefault(label, RunningStats()).add(number)
+                self._numericOverall.setdefault(name, RunningStats()).add(number)
+
+    def _logLikelihoods(self, sensorValues: Dict[str, Any]) -> Dict[str, float]:
+        alpha = self.params["alpha"]
+        labels = list(self._labelCounts)
+        prior = math.log(self._total + alpha * len(labels))
+        scores = {label: math.log(self._labelCounts[label] + alpha) - prior for label in labels}
+
+        for name, value in sensorValues.items():
+            if _isMissing(value):
+                continue
+            number = _numericValue(value)
+            if number is None:
+                if name not in self._categorical:
+                    continue
+                counts = self._categorical[name]
+                totals = self._categoricalTotals[name]
+                # One extra slot so values never seen before still get some probability.
+                slots = alpha * (len(self._categoryValues[name]) + 1)
+                for label in labels:
+                    count = counts.get(label, {}).get(value, 0)
+                    scores[label] += math.log((count + alpha) / (totals.get(label, 0) + slots))
+            elif not math.isnan(number):
+                if name not in self._numeric:
+                    continue
+                overall = self._numericOverall[name]
+                epsilon = self.params["var_smoothing"] * overall.variance + 1e-9
+                for label in labels:
+                    # Labels that never saw this sensor fall back to its overall distribution.
+                    stats = self._numeric[name].get(label) or overall
+                    variance = stats.variance + epsilon
+                    scores[label] -= 0.5 * (math.log(2 * math.pi * variance) + (number - stats.mean) ** 2 / variance)
+        return scores
+
+    def _predict(self, sensorValues: Dict[str, Any]) -> Tuple[Optional[str], float]:
+        if not self._total:
+            return None, 0
+        scores = self._logLikelihoods(sensorValues)
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        normaliser = sum(math.exp(score - top) for score in scores.values())
+        return best, 1.0 / normaliser
+
+    def predictLabel(self, sensorValues: Dict[str, Any]) -> tuple[Optional[str], int]:
+        with self._lock:
+            try:
+                return self._predict(sensorValues)
+            except Exception as e:
+                self.logger.error(f"Prediction failed: {e}")
+                return None, 0
+
+    def predictLabels(self, rows: List[Dict[str, Any]]) -> List[tuple[Optional[str], int]]:
+        return [self.predictLabel(row) for row in rows]
+
+    def getFeatureImportance(self) -> Optional[Dict[str, float]]:
+        self.logger.info("Naive Bayes does not provide feature importances.")
+        return None
+
+    def getAccuracy(self) -> Optional[float]:
+        with self._lock:
+            if not self._evaluations:
+                self.logger.warning("Model is not trained. Accuracy unavailable.")
+                return None
+            return sum(label == predicted for label, predicted in self._evaluations) / len(self._evaluations)
+
+    def getLabelStats(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if not self._evaluations:
+                return None
+            evaluations = list(self._evaluations)
+            labels = list(self._labelCounts)
+
+        stats = {}
+        for label in labels:
+            truePositives = sum(1 for actual, predicted in evaluations if actual == label and predicted == label)
+            support = sum(1 for actual, _ in evaluations if actual == label)
+            predictedCount = sum(1 for _, predicted in evaluations if predicted == label)
+            precision = truePositives / predictedCount if predictedCount else 0.0
+            recall = truePositives / support if support else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+            stats[label] = {
+                "support": support,
+                "precision": round(precision, 3),
+                "recall": round(recall, 3),
+                "f1": round(f1, 3),
+            }
+        return stats
+
+    def optimizeParameters(self, observations: ObservationMatrix, nJobs: Optional[int] = -1,
+                           progress: Optional[ProgressCallback] = None,
+                           strategy: str = SEARCH_TWO_STAGE) -> Dict[str, Any]:
+        """Pick the smoothing with the best prequential accuracy. The grid is small, so every strategy is exhaustive."""
+        if len(observations) == 0:
+            self.logger.warning("No data available for optimization.")
+            return {}
+
+        rows = list(zip(observations.labels, self._rows(observations)))
+        candidates = list(ParameterGrid({
+            "var_smoothing": [1e-9, 1e-6, 1e-3, 1e-2, 1e-1],
+            "alpha": [0.1, 0.5, 1.0],
+        }))
+
+        bestParams: Dict[str, Any] = {}
+        bestAccuracy = -1.0
+        for i, candidate in enumerate(candidates):
+            model = OnlineNaiveBayes(candidate)
+            for label, sensorValues in rows:
+                model._evaluateAndLearn(label, sensorValues)
+            accuracy = model.getAccuracy() or 0.0
+            if accuracy > bestAccuracy:
+                bestParams, bestAccuracy = candidate, accuracy
+            if progress is not None:
+                progress(i + 1, len(candidates))
+
+        self.logger.info(f"Best OnlineNaiveBayes parameters: {bestParams} (prequential accuracy {round(bestAccuracy, 4)})")
+        self.params = {**self.params, **bestParams}
+        with self._lock:
+            self._reset()
+            for label, sensorValues in rows:
+                self._evaluateAndLearn(label, sensorValues)
+        return dict(self.params)
+
+    def getModelParameters(self) -> OnlineNaiveBayesParams:
+        return self.params
+
+    def getArtifact(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if not self._total:
+                return None
+            return {
+                "label_counts": dict(self._labelCounts),
+                "total": self._total,
+                "numeric": self._numeric,
+                "numeric_overall": self._numericOverall,
+                "categorical": self._categorical,
+                "categorical_totals": self._categoricalTotals,
+                "category_values": self._categoryValues,
+                "evaluations": list(self._evaluations),
+            }
+
+    def loadArtifact(self, artifact: Dict[str, Any]) -> None:
+        with self._lock:
+            self._labelCounts = artifact["label_counts"]
+            self._total = artifact["total"]
+            self._numeric = artifact["numeric"]
+            self._numericOverall = artifact["numeric_overall"]
+            self._categorical = artifact["categorical"]
+            self._categoricalTotals = artifact["categorical_totals"]
+            self._categoryValues = artifact["category_values"]
+            self._evaluations = deque(artifact["evaluations"], maxlen=EVALUATION_WINDOW)
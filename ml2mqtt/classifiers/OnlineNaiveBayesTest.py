@@ -0,0 +1,73 @@
+import pickle
+import unittest
+from classifiers.FastPredictorTest import makeMatrix, makeObservations
+from classifiers.OnlineNaiveBayes import OnlineNaiveBayes
+
+
+class TestOnlineNaiveBayes(unittest.TestCase):
+    def test_learns_from_matrix(self):
+        classifier = OnlineNaiveBayes()
+        classifier.populateDataframe(makeMatrix(makeObservations(400)))
+        self.assertGreater(classifier.getAccuracy(), 0.8)
+
+        label, confidence = classifier.predictLabel({"rssi_a": -100.0, "rssi_b": -40.0, "media": "tv"})
+        self.assertEqual(label, "bedroom")
+        self.assertGreater(confidence, 0.5)
+
+    def test_learn_one_matches_batch_fit(self):
+        observations = makeObservations(300)
+        batch = OnlineNaiveBayes()
+        batch.populateDataframe(makeMatrix(observations))
+
+        online = OnlineNaiveBayes()
+        for observation in observations:
+            online.learnOne(observation.label, observation.sensorValues)
+
+        queries = [observation.sensorValues for observation in makeObservations(50, seed=1)]
+        for query in queries:
+            self.assertEqual(online.predictLabel(query)[0], batch.predictLabel(query)[0])
+            self.assertAlmostEqual(online.predictLabel(query)[1], batch.predictLabel(query)[1])
+        self.assertEqual(online.getAccuracy(), batch.getAccuracy())
+
+    def test_new_labels_and_sensors(self):
+        classifier = OnlineNaiveBayes()
+        classifier.populateDataframe(makeMatrix(makeObservations(100)))
+        for i in range(20):
+            classifier.learnOne("garage", {"rssi_a": -30.0 + i % 3, "door": "open"})
+
+        self.assertEqual(classifier.predictLabel({"rssi_a": -30.0, "door": "open"})[0], "garage")
+        self.assertIn("garage", classifier.getLabelStats())
+
+    def test_numeric_strings_are_floats(self):
+        observations = makeObservations(200)
+        fromFloats = OnlineNaiveBayes()
+        fromStrings = OnlineNaiveBayes()
+        for observation in observations:
+            fromFloats.learnOne(observation.label, observation.sensorValues)
+            # Raw MQTT states arrive as strings; the store keeps numeric ones as floats.
+            fromStrings.learnOne(observation.label, {name: str(value) for name, value in observation.sensorValues.items()})
+
+        self.assertEqual(set(fromStrings._numeric), set(fromFloats._numeric))
+        query = {"rssi_a": -70.0, "rssi_b": -70.0, "media": "radio", "power": 10.0}
+        self.assertEqual(fromStrings.predictLabel({name: str(value) for name, value in query.items()}),
+                         fromFloats.predictLabel(query))
+
+    def test_artifact_round_trip(self):
+        classifier = OnlineNaiveBayes()
+        classifier.populateDataframe(makeMatrix(makeObservations(200)))
+        restored = OnlineNaiveBayes()
+        restored.loadArtifact(pickle.loads(pickle.dumps(classifier.getArtifact())))
+
+        query = {"rssi_a": -70.0, "rssi_b": -70.0, "media": "radio", "power": 10.0}
+        self.assertEqual(restored.predictLabel(query), classifier.predictLabel(query))
+        self.assertEqual(restored.getAccuracy(), classifier.getAccuracy())
+
+    def test_untrained_model(self):
+        classifier = OnlineNaiveBayes()
+        self.assertEqual(classifier.predictLabel({"rssi_a": 1.0}), (None, 0))
+        self.assertIsNone(classifier.getAccuracy())
+        self.assertIsNone(classifier.getArtifact())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import logging
+import math
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import ParameterGrid, ParameterSampler, check_cv
+from sklearn.pipeline import Pipeline
+from sklearn.utils import resample
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ProgressCallback = Callable[[int, int], None]
+
+SEARCH_TWO_STAGE = "two_stage"
+SEARCH_HALVING = "halving"
+SEARCH_STRATEGIES = [SEARCH_TWO_STAGE, SEARCH_HALVING]
+
+
+def _fitAndScore(pipeline: Pipeline, params: Dict[str, Any], X: pd.DataFrame, y: np.ndarray,
+                 train: np.ndarray, test: np.ndarray) -> float:
+    try:
+        estimator = clone(pipeline).set_params(**params)
+        estimator.fit(X.iloc[train], y[train])
+        return accuracy_score(y[test], estimator.predict(X.iloc[test]))
+    except ValueError:
+        return np.nan
+
+
+class ParameterSearch:
+    """
+    Cross-validated hyperparameter search over a pipeline.
+
+    Candidates are scored like RandomizedSearchCV / GridSearchCV (mean accuracy over stratified
+    folds, first best candidate wins) but every completed fit is reported to `progress` as
+    (completedFits, plannedFits), so long searches can show progress and an ETA.
+    """
+
+    def __init__(self, pipeline: Pipeline, X: pd.DataFrame, y: np.ndarray,
+                 nJobs: Optional[int] = -1, progress: Optional[ProgressCallback] = None):
+        self._pipeline = pipeline
+        self._X = X
+        self._y = y
+        self._nJobs = nJobs
+        self._progress = progress
+        self._logger = logging.getLogger(__name__)
+        self.completedFits = 0
+        self.plannedFits = 0
+
+    def planFits(self, count: int) -> None:
+        """Set the total number of fits expected across all searches, for progress reporting."""
+        self.plannedFits = max(count, self.completedFits)
+        self._report()
+
+    def randomSearch(self, distributions: Dict[str, List[Any]], nIter: int, cv: int,
+                     randomState: Optional[int] = None) -> Tuple[Dict[str, Any], float]:
+        candidates = list(ParameterSampler(distributions, n_iter=nIter, random_state=randomState))
+        return self.evaluate(candidates, cv)
+
+    def gridSearch(self, grid: Dict[str, List[Any]], cv: int) -> Tuple[Dict[str, Any], float]:
+        return self.evaluate(list(ParameterGrid(grid)), cv)
+
+    def halvingSearch(self, candidates: List[Dict[str, Any]], cv: int, factor: int = 3,
+                      resource: str = "n_samples", minResources: Optional[int] = None,
+                      maxResources: Optional[int] = None) -> Tuple[Dict[str, Any], float]:
+        """
+        Successive halving: score every candidate on a small budget, keep the best 1/`factor`,
+        and repeat with `factor` times the budget until the last round runs at full budget.
+
+        The budget is either the number of training samples ("n_samples", a stratified
+        subsample per round) or an integer parameter such as "classifier__n_estimators", which
+        is capped at the round's budget until the last round uses each candidate's own value.
+        """
+        if resource == "n_samples":
+            maxResources = len(self._y)
+            if minResources is None:
+                minResources = 2 * cv * len(np.unique(self._y))
+            minResources = max(minResources, cv)
+        elif maxResources is None or minResources is None:
+            raise ValueError(f"minResources and maxResources are required for resource '{resource}'")
+        minResources = min(minResources, maxResources)
+
+        rounds = 1 + int(math.floor(math.log(maxResources / minResources, factor)))
+        rounds = min(rounds, 1 + int(math.ceil(math.log(max(len(candidates), 1), factor))))
+        schedule = [(math.ceil(len(candidates) / factor ** i), maxResources // factor ** (rounds - 1 - i))
+                    for i in range(rounds)]
+        self.planFits(self.completedFits + sum(count for count, _ in schedule) * cv)
+
+        rng = np.random.RandomState(0)
+        scores = np.array([])
+        for i, (count, budget) in enumerate(schedule):
+            candidates = candidates[:count]
+            X, y, roundCandidates = self._X, self._y, candidates
+            if resource == "n_samples" and budget < maxResources:
+                X, y = resample(self._X, self._y, replace=False, n_samples=budget,
+                                stratify=self._y, random_state=rng)
+            elif resource != "n_samples":
+                roundCandidates = [{**params, resource: min(params.get(resource, maxResources), budget)}
+                                   for params in candidates]
+            self._logger.info(f"Halving round {i + 1}/{rounds}: {len(candidates)} candidates, {resource} <= {budget}")
+
+            # Best first; the stable sort keeps the earlier candidate ahead on ties, like evaluate().
+            scores = self.scoreCandidates(roundCandidates, cv, X, y)
+            order = np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind="stable")
+            candidates = [candidates[j] for j in order]
+            scores = scores[order]
+
+        if np.all(np.isnan(scores)):
+            raise ValueError("Every candidate failed to fit")
+        return candidates[0], float(scores[0])
+
+    def evaluate(self, candidates: List[Dict[str, Any]], cv: int,
+                 X: Optional[pd.DataFrame] = None, y: Optional[np.ndarray] = None) -> Tuple[Dict[str, Any], float]:
+        """Score each candidate with `cv`-fold cross-validation and return the best one and its score."""
+        scores = self.scoreCandidates(candidates, cv, X, y)
+        if np.all(np.isnan(scores)):
+            raise ValueError("Every candidate failed to fit")
+        best = int(np.nanargmax(scores))
+        return candidates[best], float(scores[best])
+
+    def scoreCandidates(self, candidates: List[Dict[str, Any]], cv: int,
+                        X: Optional[pd.DataFrame] = None, y: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return the mean cross-validated accuracy of each candidate, NaN where every fold failed."""
+        X = self._X if X is None else X
+        y = self._y if y is None else y
+        splits = list(check_cv(cv, y, classifier=True).split(X, y))
+        if self.completedFits + len(candidates) * len(splits) > self.plannedFits:
+            self.plannedFits = self.completedFits + len(candidates) * len(splits)
+
+        tasks = (
+            delayed(_fitAndScore)(self._pipeline, params, X, y, train, test)
+            for params in candidates
+            for train, test in splits
+        )
+        foldScores: List[float] = []
+        for score in Parallel(n_jobs=self._nJobs, return_as="generator")(tasks):
+            foldScores.append(score)
+            self.completedFits += 1
+            self._report()
+
+        perCandidate = np.array(foldScores, dtype=np.float64).reshape(len(candidates), len(splits))
+        scored = (~np.isnan(perCandidate)).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(scored > 0, np.nansum(perCandidate, axis=1) / scored, np.nan)
+
+    def fit(self, params: Dict[str, Any]) -> Pipeline:
+        """Fit a fresh copy of the pipeline with `params` on all of the search data."""
+        estimator = clone(self._pipeline).set_params(**params)
+        estimator.fit(self._X, self._y)
+        return estimator
+
+    def _report(self) -> None:
+        if self._progress is not None:
+            self._progress(self.completedFits, self.plannedFits)
@@ -0,0 +1,82 @@
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from classifiers.ParameterSearch import ParameterSearch
+
+
+def makeSearch(rows=270, progress=None):
+    rng = np.random.default_rng(0)
+    y = np.arange(rows) % 3
+    X = pd.DataFrame({"a": y * 10 + rng.normal(size=rows), "b": rng.normal(size=rows)})
+    pipeline = Pipeline([("classifier", RandomForestClassifier(random_state=0))])
+    return ParameterSearch(pipeline, X, y, nJobs=1, progress=progress)
+
+
+class TestHalvingSearch(unittest.TestCase):
+    def recordRounds(self, search):
+        """Replace the fits with a score of each candidate's "quality", recording every round."""
+        rounds = []
+
+        def scoreCandidates(candidates, cv, X=None, y=None):
+            rounds.append((candidates, len(search._y if X is None else X)))
+            search.completedFits += len(candidates) * cv
+            return np.array([params["quality"] for params in candidates], dtype=np.float64)
+
+        search.scoreCandidates = scoreCandidates
+        return rounds
+
+    def test_budget_schedule_for_a_parameter(self):
+        progress = mock.Mock()
+        search = makeSearch(progress=progress)
+        rounds = self.recordRounds(search)
+        candidates = [{"quality": q % 7, "classifier__n_estimators": 100 + q} for q in range(27)]
+
+        best, score = search.halvingSearch(candidates, cv=3, resource="classifier__n_estimators",
+                                           minResources=10, maxResources=270)
+
+        self.assertEqual([len(candidates) for candidates, _ in rounds], [27, 9, 3, 1])
+        # Early rounds cap the parameter at the round's budget; the last uses each candidate's own.
+        self.assertEqual([max(params["classifier__n_estimators"] for params in candidates) for candidates, _ in rounds],
+                         [10, 30, 90, 106])
+        # Ties keep the earlier candidate, so the first with quality 6 wins.
+        self.assertEqual((best, score), ({"quality": 6, "classifier__n_estimators": 106}, 6.0))
+        progress.assert_any_call(0, (27 + 9 + 3 + 1) * 3)
+
+    def test_budget_schedule_for_samples(self):
+        search = makeSearch(rows=270)
+        rounds = self.recordRounds(search)
+        candidates = [{"quality": q} for q in range(9)]
+
+        search.halvingSearch(candidates, cv=3, minResources=30)
+        self.assertEqual([(len(candidates), rows) for candidates, rows in rounds], [(9, 30), (3, 90), (1, 270)])
+        # Only the best third goes through to each round.
+        self.assertEqual([params["quality"] for params in rounds[1][0]], [8, 7, 6])
+
+    def test_rounds_stop_when_one_candidate_is_left(self):
+        search = makeSearch()
+        rounds = self.recordRounds(search)
+        search.halvingSearch([{"quality": q} for q in range(3)], cv=3, resource="classifier__n_estimators",
+                             minResources=1, maxResources=1000)
+        self.assertEqual([len(candidates) for candidates, _ in rounds], [3, 1])
+
+    def test_requires_bounds_for_a_parameter(self):
+        with self.assertRaises(ValueError):
+            makeSearch().halvingSearch([{}], cv=3, resource="classifier__n_estimators")
+
+    def test_real_fits_match_the_plan(self):
+        reports = []
+        search = makeSearch(rows=120, progress=lambda done, total: reports.append((done, total)))
+        candidates = [{"classifier__n_estimators": n, "classifier__max_depth": d} for n in (20, 40) for d in (1, 3, None)]
+        best, score = search.halvingSearch(candidates, cv=3, resource="classifier__n_estimators",
+                                           minResources=5, maxResources=40)
+        self.assertIn(best, candidates)
+        self.assertGreater(score, 0.9)
+        self.assertEqual(search.completedFits, search.plannedFits)
+        self.assertEqual(reports[-1], (search.plannedFits, search.plannedFits))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,13 +2,18 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import LabelEncoder, OrdinalEncoder
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split, GridSearchCV, RandomizedSearchCV
-from sklearn.metrics import accuracy_score, classification_report
+from sklearn.model_selection import train_test_split, ParameterGrid, ParameterSampler
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from typing import TypedDict, Optional, List, Dict, Any, Union
 import logging
-from ModelStore import ModelObservation
+from ModelStore import ObservationMatrix
+from classifiers.CompactForest import CompactForest
+from classifiers.EvaluationReport import (EvaluationReport, transformedFeatureNames, resolveEvaluationMode,
+                                          crossValidatedPredictions, outOfBagPredictions, EVALUATION_HOLDOUT,
+                                          EVALUATION_CROSS_VALIDATION, EVALUATION_OUT_OF_BAG, DEFAULT_CV_FOLDS)
+from classifiers.FastPredictor import FastPredictor
+from classifiers.ParameterSearch import ParameterSearch, ProgressCallback, SEARCH_HALVING, SEARCH_TWO_STAGE
 
 
 class RandomForestParams(TypedDict):
@@ -34,9 +39,19 @@ DEFAULT_RANDOM_FOREST_PARAMS: RandomForestParams = {
 }
 
 
+def _prefixed(grid: Dict[str, Any]) -> Dict[str, Any]:
+    return {'classifier__' + k: v for k, v in grid.items()}
+
+
 class RandomForest:
-    def __init__(self, params: Optional[RandomForestParams] = None):
+    def __init__(self, params: Optional[RandomForestParams] = None, compact: bool = False,
+                 evaluationMode: str = EVALUATION_HOLDOUT, cvFolds: int = DEFAULT_CV_FOLDS, nJobs: Optional[int] = -1):
         self.params: RandomForestParams = {**DEFAULT_RANDOM_FOREST_PARAMS, **(params or {})}
+        # Serve predictions from a CompactForest export instead of the sklearn estimator.
+        self._compact = compact
+        self._evaluationMode = evaluationMode
+        self._cvFolds = cvFolds
+        self._nJobs = nJobs
         self.logger: logging.Logger = logging.getLogger(__name__)
         self.logger.info(f"RandomForest initialized with params: {self.params}")
 
@@ -46,24 +61,21 @@ class RandomForest:
         self._y_test: Optional[np.ndarray] = None
         self._modelTrained: bool = False
         self._categoricalCols: List[str] = []
+        self._columns: List[str] = []
+        self._fastPredictor: Optional[FastPredictor] = None
+        self._report: Optional[EvaluationReport] = None
         self._ordinalEncoder = OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1)
 
-    def populateDataframe(self, observations: List[ModelObservation]) -> None:
-        data: List[Dict[str, Any]] = []
-        labels: List[str] = []
-
-        for obs in observations:
-            data.append(obs.sensorValues)
-            labels.append(obs.label)
-
-        if not data or not labels:
+    def populateDataframe(self, observations: ObservationMatrix) -> None:
+        if len(observations) == 0:
             self.logger.warning("No data available for training.")
             self._modelTrained = False
             return
 
-        X = pd.DataFrame(data)
-        y = self.labelEncoder.fit_transform(labels)
+        X = observations.toDataFrame()
+        y = self.labelEncoder.fit_transform(observations.labels)
 
+        self._columns = X.columns.tolist()
         self._categoricalCols = X.select_dtypes(include=["object", "category"]).columns.tolist()
         numericalCols = X.select_dtypes(include=[np.number]).columns.tolist()
 
@@ -74,16 +86,31 @@ class RandomForest:
             ]
         )
 
+        mode = resolveEvaluationMode(self._evaluationMode, y, self._cvFolds, bool(self.params.get("bootstrap", True)))
+        forestParams = {**self.params, "oob_score": True} if mode == EVALUATION_OUT_OF_BAG else self.params
         self._pipeline = Pipeline(steps=[
             ('preprocessor', preprocessor),
-            ('classifier', RandomForestClassifier(**self.params))
+            ('classifier', RandomForestClassifier(**forestParams))
         ])
 
         try:
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3)
+            if mode == EVALUATION_HOLDOUT:
+                X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3)
+            else:
+                # The served model learns from every row; the report comes from out-of-fold or out-of-bag predictions.
+                X_train, X_test, y_train, y_test = X, X.iloc[:0], y, y[:0]
             self._pipeline.fit(X_train, y_train)
             self._X_test = X_test
             self._y_test = y_test
+            if mode == EVALUATION_CROSS_VALIDATION:
+                yPred, foldAccuracies = crossValidatedPredictions(self._pipeline, X, y, self._cvFolds, self._nJobs)
+                self._report = self._evaluate(y, yPred, len(X_train), mode, foldAccuracies)
+            elif mode == EVALUATION_OUT_OF_BAG:
+                yTrue, yPred = outOfBagPredictions(self._pipeline.named_steps["classifier"], y)
+                self._report = self._evaluate(yTrue, yPred, len(X_train), mode)
+            else:
+                self._report = self._evaluate(y_test, self._pipeline.predict(X_test), len(X_train))
+            self._usePipeline(self._pipeline)
             self._modelTrained = True
         except ValueError as e:
             self.logger.info(f"Not enough data to train the model: {e}")
@@ -91,91 +118,95 @@ class RandomForest:
             self.logger.error(f"Columns with NaNs: {nan_columns}")
             self._modelTrained = False
 
+    def _usePipeline(self, pipeline: Pipeline) -> None:
+        """Serve predictions from a fitted pipeline, swapping in a CompactForest export if compaction is on."""
+        if self._compact and isinstance(pipeline.named_steps["classifier"], RandomForestClassifier):
+            pipeline.steps[-1] = ('classifier', CompactForest.fromEstimator(pipeline.named_steps["classifier"]))
+        self._pipeline = pipeline
+        self._fastPredictor = FastPredictor(pipeline, self.labelEncoder)
+
+    def getArtifact(self) -> Optional[Dict[str, Any]]:
+        """The fitted state needed to serve this model again without retraining."""
+        if not self._modelTrained or self._pipeline is None:
+            return None
+        return {
+            "pipeline": self._pipeline,
+            "label_encoder": self.labelEncoder,
+            "columns": self._columns,
+            "categorical_columns": self._categoricalCols,
+            "report": self._report,
+        }
+
+    def loadArtifact(self, artifact: Dict[str, Any]) -> None:
+        self.labelEncoder = artifact["label_encoder"]
+        self._categoricalCols = artifact["categorical_columns"]
+        self._columns = artifact["columns"]
+        # The held-out rows are not persisted; the report already summarises them.
+        self._X_test = None
+        self._y_test = None
+        self._report = artifact["report"]
+        self._usePipeline(artifact["pipeline"])
+        self._modelTrained = True
+
     def predictLabel(self, sensorValues: Dict[str, Any]) -> tuple[Optional[str], int]:
-        if not self._pipeline or not self._modelTrained:
+        if not self._pipeline or not self._modelTrained or self._fastPredictor is None:
             return None, 0
 
-        X = pd.DataFrame([sensorValues])
-        X = X.reindex(columns=self._X_test.columns, fill_value=None)
-
         try:
-            y_pred = self._pipeline.predict(X)
-            y_prob = self._pipeline.predict_proba(X)
-            label = self.labelEncoder.inverse_transform(y_pred)[0]
-            confidence = max(y_prob[0])  # Confidence level as the probability of the predicted label
-            return label, confidence
+            return self._fastPredictor.predict(sensorValues)
         except Exception as e:
             self.logger.error(f"Prediction failed: {e}")
             return None, 0
 
-    def getFeatureImportance(self) -> Optional[Dict[str, float]]:
-        if not self._modelTrained or self._pipeline is None:
-            return None
+    def predictLabels(self, rows: List[Dict[str, Any]]) -> List[tuple[Optional[str], int]]:
+        if not self._pipeline or not self._modelTrained or self._fastPredictor is None:
+            return [(None, 0)] * len(rows)
 
         try:
-            clf = self._pipeline.named_steps["classifier"]
-            featureNames = self._X_test.columns
-            importances = clf.feature_importances_
-            return dict(zip(featureNames, importances))
+            return self._fastPredictor.predictMany(rows)
         except Exception as e:
-            self.logger.error(f"Feature importances retrieval failed: {e}")
-            return None
+            self.logger.error(f"Batch prediction failed: {e}")
+            return [(None, 0)] * len(rows)
+
+    def _evaluate(self, yTrue: np.ndarray, yPred: np.ndarray, trainRows: int, method: str = EVALUATION_HOLDOUT,
+                  foldAccuracies: Optional[List[float]] = None) -> EvaluationReport:
+        """Build the report for this fit from predictions of rows the scoring model did not learn from."""
+        clf = self._pipeline.named_steps["classifier"]
+        # Importances follow the preprocessor's output order (categorical columns first), not X's.
+        featureNames = transformedFeatureNames(self._pipeline.named_steps["preprocessor"])
+        featureImportance = {name: float(importance) for name, importance in zip(featureNames, clf.feature_importances_)}
+        return EvaluationReport.fromPredictions(yTrue, yPred, self.labelEncoder.classes_, featureImportance,
+                                                trainRows, method, foldAccuracies)
+
+    def getEvaluationReport(self) -> Optional[EvaluationReport]:
+        return self._report if self._modelTrained else None
 
-    def getAccuracy(self) -> Optional[float]:
-        if not self._modelTrained or self._pipeline is None:
+    def getFeatureImportance(self) -> Optional[Dict[str, float]]:
+        if not self._modelTrained or self._report is None:
             return None
+        return dict(self._report.featureImportance or {})
 
-        try:
-            y_pred = self._pipeline.predict(self._X_test)
-            return accuracy_score(self._y_test, y_pred)
-        except Exception as e:
-            self.logger.error(f"Accuracy calculation failed: {e}")
+    def getAccuracy(self) -> Optional[float]:
+        if not self._modelTrained or self._report is None:
             return None
+        return self._report.accuracy
 
     def getLabelStats(self) -> Optional[Dict[str, Any]]:
-        if not self._modelTrained or self._pipeline is None:
+        if not self._modelTrained or self._report is None:
             return None
+        return self._report.getLabelStats()
 
-        try:
-            y_pred = self._pipeline.predict(self._X_test)
-            report = classification_report(
-                self._y_test,
-                y_pred,
-                labels=np.arange(len(self.labelEncoder.classes_)),
-                target_names=self.labelEncoder.classes_,
-                output_dict=True,
-                zero_division=0
-            )
-
-            return {
-                label: {
-                    "support": int(stats["support"]),
-                    "precision": round(stats["precision"], 3),
-                    "recall": round(stats["recall"], 3),
-                    "f1": round(stats["f1-score"], 3),
-                }
-                for label, stats in report.items()
-                if label in self.labelEncoder.classes_
-            }
-        except Exception as e:
-            self.logger.error(f"Label stats generation failed: {e}")
-            return None
-
-    def optimizeParameters(self, observations: List[ModelObservation]) -> Dict[str, Any]:
-        data: List[Dict[str, Any]] = []
-        labels: List[str] = []
-
-        for obs in observations:
-            data.append(obs.sensorValues)
-            labels.append(obs.label)
-
-        if not data or not labels:
+    def optimizeParameters(self, observations: ObservationMatrix, nJobs: Optional[int] = -1,
+                           progress: Optional[ProgressCallback] = None,
+                           strategy: str = SEARCH_TWO_STAGE) -> Dict[str, Any]:
+        if len(observations) == 0:
             self.logger.warning("No data available for optimization.")
             return {}
 
-        X = pd.DataFrame(data)
-        y = self.labelEncoder.fit_transform(labels)
+        X = observations.toDataFrame()
+        y = self.labelEncoder.fit_transform(observations.labels)
 
+        self._columns = X.columns.tolist()
         self._categoricalCols = X.select_dtypes(include=["object", "category"]).columns.tolist()
         numericalCols = X.select_dtypes(include=[np.number]).columns.tolist()
 
@@ -200,31 +231,51 @@ class RandomForest:
         bootstrapGrid = {**baseGrid, 'bootstrap': [True], 'oob_score': [True, False]}
         noBootstrapGrid = {**baseGrid, 'bootstrap': [False]}
 
-        def runSearch(param_grid):
-            pipeline = Pipeline([
-                ('preprocessor', preprocessor),
-                ('classifier', RandomForestClassifier())
-            ])
-            search = RandomizedSearchCV(
-                estimator=pipeline,
-                param_distributions={'classifier__' + k: v for k, v in param_grid.items()},
-                n_iter=30,
-                scoring='accuracy',
-                cv=3,
-                random_state=42,
-                n_jobs=-1,
-                verbose=1,
-                refit=True
-            )
-            search.fit(X_trainval, y_trainval)
-            return search
-
-        search1 = runSearch(bootstrapGrid)
-        search2 = runSearch(noBootstrapGrid)
-        bestSearch = search1 if search1.best_score_ >= search2.best_score_ else search2
+        pipeline = Pipeline([
+            ('preprocessor', preprocessor),
+            ('classifier', RandomForestClassifier())
+        ])
+        search = ParameterSearch(pipeline, X_trainval, y_trainval, nJobs=nJobs, progress=progress)
+
+        if strategy == SEARCH_HALVING:
+            candidates = (list(ParameterSampler(_prefixed(bootstrapGrid), n_iter=40, random_state=42))
+                          + list(ParameterSampler(_prefixed(noBootstrapGrid), n_iter=41, random_state=42)))
+            # Forest size dominates fit time, so it is the budget: early rounds compare truncated
+            # forests and only the final round fits each survivor at its own n_estimators.
+            bestSearchParams, _ = search.halvingSearch(candidates, cv=3, resource='classifier__n_estimators',
+                                                       minResources=10, maxResources=max(baseGrid['n_estimators']))
+        else:
+            bestSearchParams = self._twoStageSearch(search, bootstrapGrid, noBootstrapGrid)
+
+        bestParams = {
+            k.replace('classifier__', ''): v
+            for k, v in bestSearchParams.items()
+        }
+
+        self.logger.info(f"Best parameters: {bestParams}")
+        self.params = bestParams
+
+        self._pipeline = search.fit(bestSearchParams)
+        self._X_test = X_test_final
+        self._y_test = y_test_final
+        self._report = self._evaluate(y_test_final, self._pipeline.predict(X_test_final), len(X_trainval))
+        self._usePipeline(self._pipeline)
+        self._modelTrained = True
+
+        self.logger.info(f"Final accuracy on held-out test set: {round(self._report.accuracy, 4)}")
+
+        return bestParams
+
+    def _twoStageSearch(self, search: ParameterSearch, bootstrapGrid: Dict[str, List[Any]],
+                        noBootstrapGrid: Dict[str, List[Any]]) -> Dict[str, Any]:
+        # Two 30-candidate random searches over 3 folds, then a refined grid of at most 81 candidates over 5.
+        search.planFits(30 * 3 * 2 + 81 * 5)
+
+        params1, score1 = search.randomSearch(_prefixed(bootstrapGrid), nIter=30, cv=3, randomState=42)
+        params2, score2 = search.randomSearch(_prefixed(noBootstrapGrid), nIter=30, cv=3, randomState=42)
         bestRandomParams = {
             k.replace('classifier__', ''): v
-            for k, v in bestSearch.best_params_.items()
+            for k, v in (params1 if score1 >= score2 else params2).items()
         }
         self.logger.info(f"Stage 1 best parameters: {bestRandomParams}")
 
@@ -245,35 +296,9 @@ class RandomForest:
         if bestRandomParams['bootstrap']:
             refinedGrid['oob_score'] = [bestRandomParams.get('oob_score', False)]
 
-        gridSearch = GridSearchCV(
-            Pipeline([
-                ('preprocessor', preprocessor),
-                ('classifier', RandomForestClassifier())
-            ]),
-            param_grid={'classifier__' + k: v for k, v in refinedGrid.items()},
-            scoring='accuracy',
-            cv=5,
-            n_jobs=-1,
-            verbose=1
-        )
-        gridSearch.fit(X_trainval, y_trainval)
-        bestParams = {
-            k.replace('classifier__', ''): v
-            for k, v in gridSearch.best_params_.items()
-        }
-
-        self.logger.info(f"Stage 2 best parameters: {bestParams}")
-        self.params = bestParams
-
-        self._pipeline = gridSearch.best_estimator_
-        self._X_test = X_test_final
-        self._y_test = y_test_final
-        self._modelTrained = True
-
-        finalAccuracy = accuracy_score(y_test_final, self._pipeline.predict(X_test_final))
-        self.logger.info(f"Final accuracy on held-out test set: {round(finalAccuracy, 4)}")
-
-        return bestParams
+        search.planFits(search.completedFits + len(ParameterGrid(refinedGrid)) * 5)
+        bestGridParams, _ = search.gridSearch(_prefixed(refinedGrid), cv=5)
+        return bestGridParams
 
     def getModelParameters(self) -> RandomForestParams:
         return self.params
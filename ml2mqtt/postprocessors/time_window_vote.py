@@ -0,0 +1,107 @@
+import time
+from collections import deque
+from typing import Dict, Any, Optional, Tuple, ClassVar
+from .base import BasePostprocessor
+
+WEIGHT_BY_COUNT = "count"
+WEIGHT_BY_CONFIDENCE = "confidence"
+
+class TimeWindowVotePostprocessor(BasePostprocessor):
+    """Postprocessor that returns the label with the most votes over the last N seconds."""
+
+    type: ClassVar[str] = "time_window_vote"
+    description: ClassVar[str] = "Returns the label with the most votes, or the most confidence, over the last N seconds"
+
+    config_schema: ClassVar[Dict[str, Any]] = {
+        "type": "object",
+        "properties": {
+            "window_seconds": {
+                "type": "number",
+                "description": "Number of seconds of results to consider for voting",
+                "exclusiveMinimum": 0
+            },
+            "weighting": {
+                "type": "string",
+                "description": "Whether each result counts once or by its confidence",
+                "enum": [WEIGHT_BY_COUNT, WEIGHT_BY_CONFIDENCE]
+            }
+        },
+        "required": ["window_seconds"]
+    }
+
+    def __init__(self, window_seconds: float = 30, weighting: str = WEIGHT_BY_COUNT, **kwargs):
+        """
+        Initialize the time window vote postprocessor.
+
+        Args:
+            window_seconds: Number of seconds of results to consider for voting
+            weighting: "count" for one vote per result, "confidence" to weight votes by confidence
+            **kwargs: Additional configuration parameters
+        """
+        super().__init__(**kwargs)
+        self.window_seconds = float(window_seconds)
+        if self.window_seconds <= 0:
+            raise ValueError("Window must be greater than zero seconds")
+        if weighting not in (WEIGHT_BY_COUNT, WEIGHT_BY_CONFIDENCE):
+            raise ValueError(f"Unknown weighting: {weighting}")
+        self.weighting = weighting
+        # Results in arrival order, and the running vote for each label they hold. Results
+        # enter on the right and expire from the left, so each is added and removed once and
+        # the cost per result does not grow with the message rate.
+        self.window = deque()
+        self.votes: Dict[Any, list] = {}
+        self.started: Optional[float] = None
+
+    def process(self, observation: Dict[str, Any], label: Any, confidence: Any) -> Tuple[Dict[str, Any], Optional[Any]]:
+        """
+        Process the observation and label using voting over a time window.
+
+        Args:
+            observation: Dictionary of entity values
+            label: The predicted label
+            confidence: Confidence of the prediction
+
+        Returns:
+            Tuple of (observation, winning label or None until a whole window has passed)
+        """
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+
+        weight = float(confidence) if self.weighting == WEIGHT_BY_CONFIDENCE else 1.0
+        self.window.append((now, label, weight))
+        vote = self.votes.setdefault(label, [0.0, 0])
+        vote[0] += weight
+        vote[1] += 1
+
+        cutoff = now - self.window_seconds
+        while self.window[0][0] <= cutoff:
+            _, expired, expiredWeight = self.window.popleft()
+            vote = self.votes[expired]
+            vote[1] -= 1
+            if vote[1] == 0:
+                # Dropping the label rather than leaving a total of 0.0 plus rounding error.
+                del self.votes[expired]
+            else:
+                vote[0] -= expiredWeight
+
+        # Like majority voting, drop results until the window has filled once.
+        if now - self.started < self.window_seconds:
+            return observation, None
+
+        # One entry per label, so this does not depend on how many results are in the window.
+        winner = max(self.votes, key=lambda l: self.votes[l][0])
+        if self.votes[label][0] >= self.votes[winner][0]:
+            winner = label
+        return observation, winner
+
+    def configToString(self) -> str:
+        """
+        Returns a human-readable string describing the current configuration.
+
+        Returns:
+            A string describing the configuration
+        """
+        if self.weighting == WEIGHT_BY_CONFIDENCE:
+            return f"I will return the result with the highest total confidence over the last {self.window_seconds:g} seconds"
+        return f"I will return the most frequent result over the last {self.window_seconds:g} seconds"
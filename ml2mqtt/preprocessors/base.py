@@ -1,6 +1,70 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, ClassVar
+from typing import Dict, Any, Optional, ClassVar, List
 import logging
+import numpy as np
+import pandas as pd
+
+
+class ObservationFrame:
+    """
+    A batch of observations in arrival order, stored by column.
+
+    `values` has one object column per sensor. `present` marks the observations that carried
+    that sensor at all, since a sensor missing from a message and a sensor reported as None
+    are different things to a preprocessor. `times`, when known, holds each observation's
+    arrival time in seconds since the epoch, for preprocessors with time-based windows.
+    """
+
+    def __init__(self, values: pd.DataFrame, present: pd.DataFrame, times: Optional[np.ndarray] = None):
+        self.values = values
+        self.present = present
+        self.times = times
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @classmethod
+    def fromObservations(cls, observations: List[Dict[str, Any]], times: Optional[List[float]] = None) -> "ObservationFrame":
+        columns = list(dict.fromkeys(key for observation in observations for key in observation))
+        values = {}
+        present = {}
+        for column in columns:
+            values[column] = np.empty(len(observations), dtype=object)
+            values[column][:] = [observation.get(column) for observation in observations]
+            present[column] = np.fromiter((column in observation for observation in observations),
+                                          dtype=bool, count=len(observations))
+        return cls(pd.DataFrame(values, columns=columns, dtype=object), pd.DataFrame(present, columns=columns, dtype=bool),
+                   None if times is None else np.asarray(times, dtype=np.float64))
+
+    def toObservations(self) -> List[Dict[str, Any]]:
+        columns = list(self.values.columns)
+        values = self.values.to_numpy(dtype=object)
+        present = self.present.to_numpy(dtype=bool)
+        return [
+            {column: values[row, i] for i, column in enumerate(columns) if present[row, i]}
+            for row in range(len(values))
+        ]
+
+    def copy(self) -> "ObservationFrame":
+        return ObservationFrame(self.values.copy(), self.present.copy(), self.times)
+
+    def setValues(self, column: str, values: np.ndarray) -> None:
+        """Replace a column's values, keeping None as None rather than letting pandas infer a dtype."""
+        self.values[column] = pd.Series(values, index=self.values.index, dtype=object)
+
+    def setColumn(self, column: str, values: np.ndarray, present: np.ndarray) -> None:
+        """Write `values` where `present` holds. Elsewhere an existing column keeps its cells."""
+        if column in self.values.columns:
+            current = self.values[column].to_numpy(dtype=object).copy()
+            current[present] = values[present]
+            self.setValues(column, current)
+            self.present[column] = self.present[column].to_numpy(dtype=bool) | present
+        else:
+            columnValues = np.empty(len(values), dtype=object)
+            columnValues[:] = None
+            columnValues[present] = values[present]
+            self.setValues(column, columnValues)
+            self.present[column] = present
 
 class BasePreprocessor(ABC):
     """Base class for all preprocessors."""
@@ -41,6 +105,35 @@ class BasePreprocessor(ABC):
             Modified observation dictionary
         """
         pass
+
+    def processAt(self, observation: Dict[str, Any], state: Dict[str, Any], observationTime: float) -> Dict[str, Any]:
+        """
+        Process an observation that arrived at `observationTime`, in seconds since the epoch.
+
+        Preprocessors with time-based windows override this and have process() use the
+        current time; the rest have no use for the time.
+        """
+        return self.process(observation, state)
+
+    def process_frame(self, frame: ObservationFrame) -> ObservationFrame:
+        """
+        Process a whole batch of observations at once, starting from empty state.
+
+        The result matches calling processAt() on each observation in order, or process() when
+        the frame has no times. This fallback does exactly that; preprocessors override it with
+        a vectorised version.
+        """
+        state: Dict[str, Any] = {}
+        observations = frame.toObservations()
+        if frame.times is None:
+            processed = [self.process(observation, state) for observation in observations]
+        else:
+            processed = [self.processAt(observation, state, float(observationTime))
+                         for observation, observationTime in zip(observations, frame.times)]
+        return ObservationFrame.fromObservations(processed, frame.times)
+
+    def consumedColumns(self, frame: ObservationFrame) -> List[str]:
+        return [column for column in frame.values.columns if self.canConsume(column)]
     
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -0,0 +1,53 @@
+import time
+from typing import Dict, Any, ClassVar
+from .base import BasePreprocessor
+
+class ExponentialMovingAverage(BasePreprocessor):
+    """Calculates an exponentially weighted moving average of each entity, with weights that halve every half-life seconds."""
+
+    name: ClassVar[str] = "Exponential Moving Average"
+    type: ClassVar[str] = "exponential_average"
+    description = "Calculates an exponentially weighted moving average of each entity, with weights that halve every half-life seconds."
+
+    def __init__(self, dbId: int, **kwargs):
+        super().__init__(dbId, **kwargs)
+        self.halfLife = float(self.config['halfLife'])
+        if self.halfLife <= 0:
+            raise ValueError("Half-life must be greater than zero seconds")
+
+    def process(self, observation: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+        return self.processAt(observation, state, time.time())
+
+    def processAt(self, observation: Dict[str, Any], state: Dict[str, Any], observationTime: float) -> Dict[str, Any]:
+        result = observation.copy()
+
+        if "averages" not in state:
+            state["averages"] = {}
+        averages = state["averages"]
+
+        for entity, value in observation.items():
+            if not self.canConsume(entity):
+                continue
+
+            # A weighted sum and the total weight, both decayed by elapsed time rather than by
+            # message count, so a burst of messages does not shorten the memory of the average.
+            average = averages.get(entity)
+            if value is not None:
+                if average is None:
+                    average = averages[entity] = {"sum": 0.0, "weight": 0.0, "time": observationTime}
+                elapsed = max(0.0, observationTime - average["time"])
+                decay = 0.5 ** (elapsed / self.halfLife)
+                average["sum"] = average["sum"] * decay + float(value)
+                average["weight"] = average["weight"] * decay + 1.0
+                average["time"] = max(average["time"], observationTime)
+
+            # Decay scales the sum and the weight alike, so a null reading leaves the average as it was.
+            if average is None or average["weight"] == 0:
+                result[entity] = None
+            else:
+                result[entity] = round(average["sum"] / average["weight"], 4)
+
+        return result
+
+    def configToString(self) -> str:
+        return f"I will calculate an exponential moving average in which readings lose half their weight every {self.halfLife:g} seconds."
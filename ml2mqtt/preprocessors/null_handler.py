@@ -1,6 +1,6 @@
 from typing import Dict, Any, Optional, ClassVar
 from ModelStore import ModelStore
-from .base import BasePreprocessor
+from .base import BasePreprocessor, ObservationFrame
 
 class NullHandler(BasePreprocessor):
     """Replaces None values with default values from ModelStore."""
@@ -26,7 +26,17 @@ class NullHandler(BasePreprocessor):
                 else:
                     result[entity] = self.config['nullReplacement']
 
-        return result 
+        return result
+
+    def process_frame(self, frame: ObservationFrame) -> ObservationFrame:
+        result = frame.copy()
+        replacement = float(self.config['nullReplacement']) if self.config['replacementType'] == 'float' else self.config['nullReplacement']
+        for entity in self.consumedColumns(frame):
+            values = result.values[entity].to_numpy(dtype=object).copy()
+            # Only sensors the message carried; one it left out stays left out.
+            values[result.present[entity].to_numpy(dtype=bool) & (values == None)] = replacement  # noqa: E711
+            result.setValues(entity, values)
+        return result
     
     def configToString(self) -> str:
         if self.config['replacementType'] == 'float':
@@ -0,0 +1,125 @@
+import math
+import time
+from collections import deque
+from typing import Dict, Any, ClassVar, List, Optional
+import numpy as np
+from .base import BasePreprocessor, ObservationFrame
+
+
+class IntervalHistory:
+    """
+    The last value a sensor reported in each recent time interval, oldest first.
+
+    Intervals are numbered from the epoch and only move forward, so the deque stays ordered:
+    a value in the newest interval overwrites the newest entry and everything older than the
+    furthest interval still looked up is dropped from the left. It holds at most `steps` + 1
+    entries however many messages arrive, and an update is O(1) amortised.
+    """
+
+    __slots__ = ("entries",)
+
+    def __init__(self, entries: Optional[List[List[Any]]] = None):
+        self.entries = deque((int(bucket), value) for bucket, value in (entries or []))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def append(self, bucket: int, value: Any, steps: int) -> None:
+        entries = self.entries
+        if entries and entries[-1][0] >= bucket:
+            entries[-1] = (entries[-1][0], value)
+        else:
+            entries.append((bucket, value))
+        # Keep the newest entry at or before the oldest interval a lag can ask for.
+        while len(entries) > 1 and entries[1][0] <= entries[-1][0] - steps:
+            entries.popleft()
+
+    def lags(self, bucket: int, steps: int) -> List[Any]:
+        """The value held at the end of each of the `steps` intervals before `bucket`, nearest first."""
+        lagged = []
+        i = len(self.entries) - 1
+        for k in range(1, steps + 1):
+            while i >= 0 and self.entries[i][0] > bucket - k:
+                i -= 1
+            lagged.append(self.entries[i][1] if i >= 0 else None)
+        return lagged
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"entries": [list(entry) for entry in self.entries]}
+
+    @classmethod
+    def fromState(cls, state: Any) -> "IntervalHistory":
+        if isinstance(state, IntervalHistory):
+            return state
+        if isinstance(state, dict):
+            return cls(state.get("entries"))
+        return cls()
+
+
+class ResampledLag(BasePreprocessor):
+    """Adds each entity's value as it stood at fixed intervals in the past, whatever the message rate."""
+
+    name: ClassVar[str] = "Resampled Lag"
+    type: ClassVar[str] = "resampled_lag"
+    description = "Adds each entity's value as it stood at fixed intervals in the past, whatever the message rate."
+
+    def __init__(self, dbId: int, **kwargs):
+        super().__init__(dbId, **kwargs)
+        self.interval = float(self.config['interval'])
+        self.steps = int(self.config['steps'])
+        if self.interval <= 0:
+            raise ValueError("Interval must be greater than zero seconds")
+
+    def lagColumn(self, entity: str, step: int) -> str:
+        return f"{entity}_{step * self.interval:g}s"
+
+    def process(self, observation: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+        return self.processAt(observation, state, time.time())
+
+    def processAt(self, observation: Dict[str, Any], state: Dict[str, Any], observationTime: float) -> Dict[str, Any]:
+        result = observation.copy()
+
+        if "intervals" not in state:
+            state["intervals"] = {}
+        intervals = state["intervals"]
+
+        bucket = math.floor(observationTime / self.interval)
+        for entity in observation:
+            if not self.canConsume(entity):
+                continue
+
+            history = intervals.get(entity)
+            if not isinstance(history, IntervalHistory):
+                history = intervals[entity] = IntervalHistory.fromState(history)
+
+            # A clock that steps back counts as still being in the newest interval seen.
+            entityBucket = max(bucket, history.entries[-1][0]) if history.entries else bucket
+            for step, value in enumerate(history.lags(entityBucket, self.steps), start=1):
+                result[self.lagColumn(entity, step)] = value
+            history.append(entityBucket, observation[entity], self.steps)
+        return result
+
+    def process_frame(self, frame: ObservationFrame) -> ObservationFrame:
+        if frame.times is None:
+            return super().process_frame(frame)
+        result = frame.copy()
+        buckets = np.floor(frame.times / self.interval).astype(np.int64)
+        for entity in self.consumedColumns(frame):
+            present = frame.present[entity].to_numpy(dtype=bool)
+            values = frame.values[entity].to_numpy(dtype=object)[present]
+            # Intervals never move backwards, as in processAt(), so the last message at or
+            # before an interval is a binary search over the running maximum.
+            entityBuckets = np.maximum.accumulate(buckets[present]) if len(values) else buckets[present]
+            for step in range(1, self.steps + 1):
+                source = np.searchsorted(entityBuckets, entityBuckets - step, side="right") - 1
+                available = source >= 0
+                lagged = np.empty(len(values), dtype=object)
+                lagged[:] = None
+                lagged[available] = values[source[available]]
+                column = np.empty(len(present), dtype=object)
+                column[present] = lagged
+                result.setColumn(self.lagColumn(entity, step), column, present)
+        return result
+
+    def configToString(self) -> str:
+        return f"I will add the value each sensor held at the end of each of the last {self.steps} intervals of {self.interval:g} seconds as additional columns"
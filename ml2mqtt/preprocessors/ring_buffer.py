@@ -0,0 +1,121 @@
+import base64
+import math
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+
+class RingBuffer:
+    """
+    The last `size` values of one sensor in a fixed NumPy array, for preprocessor state.
+
+    Appending overwrites the oldest slot, so an update is O(1) whatever the window size.
+    Numeric buffers store None as NaN and keep a running sum and non-null count, so mean()
+    is O(1) as well; other buffers hold any value, e.g. string states.
+
+    Instances live in the preprocessor state dictionaries and are written to the ModelStore
+    through to_dict(); fromState() restores them.
+    """
+
+    __slots__ = ("size", "numeric", "_values", "_start", "_count", "_sum", "_known", "_sinceResum")
+
+    def __init__(self, size: int, numeric: bool = True):
+        self.size = max(0, int(size))
+        self.numeric = numeric
+        if numeric:
+            self._values = np.full(self.size, np.nan, dtype=np.float64)
+        else:
+            self._values = np.empty(self.size, dtype=object)
+        self._start = 0
+        self._count = 0
+        self._sum = 0.0
+        self._known = 0
+        # Subtracting evicted values lets rounding error creep into the sum, so it is
+        # recomputed from the buffer once per `size` evictions, which keeps appends O(1) amortised.
+        self._sinceResum = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> Any:
+        """The value `index` places after the oldest one held."""
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        value = self._values[(self._start + index) % self.size]
+        if self.numeric:
+            return None if math.isnan(value) else float(value)
+        return value
+
+    def append(self, value: Any) -> None:
+        if self.size == 0:
+            return
+        if self.numeric:
+            value = np.nan if value is None else float(value)
+        if self._count == self.size:
+            slot = self._start
+            self._start = (self._start + 1) % self.size
+            if self.numeric:
+                self._forget(self._values[slot])
+        else:
+            slot = (self._start + self._count) % self.size
+            self._count += 1
+        self._values[slot] = value
+        if self.numeric and not math.isnan(value):
+            self._sum += value
+            self._known += 1
+
+    def _forget(self, value: float) -> None:
+        if not math.isnan(value):
+            self._sum -= value
+            self._known -= 1
+        self._sinceResum += 1
+        if self._sinceResum >= self.size:
+            self._sinceResum = 0
+            # The slot being replaced still holds `value`; the caller adds the new one.
+            self._sum = float(np.nansum(self._values)) - (0.0 if math.isnan(value) else value)
+
+    def mean(self) -> Optional[float]:
+        """Mean of the non-null values held, or None if there are none."""
+        if not self.numeric:
+            raise TypeError("mean() needs a numeric RingBuffer")
+        return self._sum / self._known if self._known else None
+
+    def tolist(self) -> List[Any]:
+        """The values held, oldest first."""
+        return [self[i] for i in range(self._count)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.numeric:
+            ordered = np.roll(self._values, -self._start)[:self._count]
+            values: Any = base64.b64encode(ordered.astype("<f8").tobytes()).decode("ascii")
+        else:
+            values = self.tolist()
+        return {"size": self.size, "numeric": self.numeric, "values": values}
+
+    @classmethod
+    def fromValues(cls, size: int, values: List[Any], numeric: bool = True) -> "RingBuffer":
+        buffer = cls(size, numeric)
+        for value in values:
+            buffer.append(value)
+        return buffer
+
+    @classmethod
+    def fromState(cls, state: Any, size: int, numeric: bool = True) -> "RingBuffer":
+        """
+        Restore a buffer from what is held in preprocessor state: a live RingBuffer, its
+        to_dict() form, or the plain list of values older releases kept. A buffer of a
+        different size or kind is rebuilt with the most recent values that fit.
+        """
+        if isinstance(state, RingBuffer):
+            if state.size == size and state.numeric == numeric:
+                return state
+            values = state.tolist()
+        elif isinstance(state, dict):
+            values = state.get("values", [])
+            if isinstance(values, str):
+                decoded = np.frombuffer(base64.b64decode(values), dtype="<f8")
+                values = [None if math.isnan(value) else float(value) for value in decoded]
+        elif isinstance(state, list):
+            values = state
+        else:
+            values = []
+        return cls.fromValues(size, values[-size:] if size else [], numeric)
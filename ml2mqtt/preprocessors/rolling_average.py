@@ -1,6 +1,7 @@
 from typing import Dict, Any, ClassVar
-from .base import BasePreprocessor
-from collections import defaultdict
+import numpy as np
+from .base import BasePreprocessor, ObservationFrame
+from .ring_buffer import RingBuffer
 
 class RollingAverage(BasePreprocessor):
     """Calculates rolling averages over a specified window size for each entity in the observations."""
@@ -11,7 +12,10 @@ class RollingAverage(BasePreprocessor):
 
     def __init__(self, dbId: int, **kwargs):
         super().__init__(dbId, **kwargs)
-        self.windowSize = self.config['windowSize']
+        # The UI sends numbers parsed as floats; RingBuffer sizes are whole observations.
+        self.windowSize = int(float(self.config['windowSize']))
+        if self.windowSize < 1:
+            raise ValueError("Window size must be at least one observation")
 
     def process(self, observation: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
         result = observation.copy()
@@ -25,21 +29,41 @@ class RollingAverage(BasePreprocessor):
             if not self.canConsume(entity):
                 continue
 
-            value = result[entity]
-            if not entity in rollingData:
-                rollingData[entity] = [value]
-            else:
-                rollingData[entity].append(value)
+            # Restored state arrives in its stored form and becomes a live buffer on first use.
+            window = rollingData.get(entity)
+            if not isinstance(window, RingBuffer) or window.size != self.windowSize:
+                window = rollingData[entity] = RingBuffer.fromState(window, self.windowSize)
+            window.append(value)
 
-            if len(rollingData[entity]) > self.windowSize and len(rollingData[entity]) > 0:
-                rollingData[entity].pop(0)
+            average = window.mean()
+            result[entity] = None if average is None else round(average, 4)
 
-            filteredData = [x for x in rollingData[entity] if x is not None]
-            if len(filteredData) == 0:
-                result[entity] = None
-            else:
-                result[entity] = round(sum(filteredData) / len(rollingData), 4)
+        return result
+
+    def process_frame(self, frame: ObservationFrame) -> ObservationFrame:
+        result = frame.copy()
+        for entity in self.consumedColumns(frame):
+            present = frame.present[entity].to_numpy(dtype=bool)
+            # Windows only advance on messages that carried the sensor, as in process().
+            values = frame.values[entity].to_numpy(dtype=object)[present]
+            known = values != None  # noqa: E711
+            numbers = np.where(known, values, 0.0).astype(np.float64)
+
+            # Window sums and non-null counts as differences of running totals.
+            sums = np.concatenate(([0.0], np.cumsum(numbers)))
+            counts = np.concatenate(([0], np.cumsum(known)))
+            end = np.arange(1, len(values) + 1)
+            start = np.maximum(end - self.windowSize, 0)
+            windowSums = sums[end] - sums[start]
+            windowCounts = counts[end] - counts[start]
 
+            averages = np.empty(len(values), dtype=object)
+            averages[:] = None
+            nonEmpty = windowCounts > 0
+            averages[nonEmpty] = [round(float(v), 4) for v in windowSums[nonEmpty] / windowCounts[nonEmpty]]
+            column = np.empty(len(present), dtype=object)
+            column[present] = averages
+            result.setColumn(entity, column, present)
         return result
     
     def configToString(self) -> str:
@@ -1,6 +1,7 @@
 from typing import Dict, Any, ClassVar
-from .base import BasePreprocessor
-from collections import defaultdict
+import numpy as np
+from .base import BasePreprocessor, ObservationFrame
+from .ring_buffer import RingBuffer
 
 class TemporalExpander(BasePreprocessor):
     """Transforms a series of recent observations into distinct columns representing the current value and specified previous time steps."""
@@ -11,7 +12,9 @@ class TemporalExpander(BasePreprocessor):
 
     def __init__(self, dbId: int, **kwargs):
         super().__init__(dbId, **kwargs)
-        self.lookback = self.config['lookback']
+        self.lookback = int(float(self.config['lookback']))
+        if self.lookback < 1:
+            raise ValueError("Lookback must be at least one step")
     
     def process(self, observation: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
         result = observation.copy()
@@ -25,18 +28,35 @@ class TemporalExpander(BasePreprocessor):
             if not self.canConsume(entity):
                 continue
 
-            value = result[entity]
+            history = previousObservations.get(entity)
+            if not isinstance(history, RingBuffer) or history.size != self.lookback:
+                history = previousObservations[entity] = RingBuffer.fromState(history, self.lookback, numeric=False)
+
+            # Oldest first, as the columns have always been ordered.
             for i in range(0, self.lookback):
-                if not entity in previousObservations:
-                    previousObservations[entity] = []
-                if i < len(previousObservations[entity]):
-                    result[f"{entity}_{i}"] = previousObservations[entity][i]
-                else:
-                    result[f"{entity}_{i}"] = None
-
-            previousObservations[entity].append(value)
-            if len(previousObservations[entity]) > self.lookback:
-                previousObservations[entity].pop(0)
+                result[f"{entity}_{i}"] = history[i] if i < len(history) else None
+
+            history.append(result[entity])
+        return result
+
+    def process_frame(self, frame: ObservationFrame) -> ObservationFrame:
+        result = frame.copy()
+        for entity in self.consumedColumns(frame):
+            present = frame.present[entity].to_numpy(dtype=bool)
+            values = frame.values[entity].to_numpy(dtype=object)[present]
+            # n is how many earlier messages carried the sensor. process() keeps the last
+            # `lookback` of them oldest first, so column i is a shift by lookback - i once the
+            # history is full, and earlier on the i-th value ever seen.
+            n = np.arange(len(values))
+            for i in range(self.lookback):
+                source = np.where(n >= self.lookback, n - self.lookback + i, i)
+                available = source < n
+                lagged = np.empty(len(values), dtype=object)
+                lagged[:] = None
+                lagged[available] = values[source[available]]
+                column = np.empty(len(present), dtype=object)
+                column[present] = lagged
+                result.setColumn(f"{entity}_{i}", column, present)
         return result
     
     def configToString(self) -> str:
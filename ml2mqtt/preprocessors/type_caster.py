@@ -1,5 +1,7 @@
 from typing import Dict, Any, Optional, ClassVar
-from .base import BasePreprocessor
+import numpy as np
+import pandas as pd
+from .base import BasePreprocessor, ObservationFrame
 
 class TypeCaster(BasePreprocessor):
     """Converts string values to floats and handles unknown values."""
@@ -36,6 +38,24 @@ class TypeCaster(BasePreprocessor):
                         pass
         
         return result
+
+    def process_frame(self, frame: ObservationFrame) -> ObservationFrame:
+        result = frame.copy()
+        for entity in self.consumedColumns(frame):
+            values = result.values[entity].to_numpy(dtype=object)
+            isString = np.fromiter((isinstance(value, str) for value in values), dtype=bool, count=len(values))
+            if not isString.any():
+                continue
+            strings = pd.Series(values).where(isString)
+            lowered = strings.str.lower()
+            numbers = pd.to_numeric(strings.str.strip(), errors="coerce").to_numpy(dtype=float)
+            # to_numeric reads "nan" as a failed parse; float() accepts it.
+            parsed = isString & (~np.isnan(numbers) | (lowered.str.strip() == "nan").to_numpy())
+            cast = values.copy()
+            cast[parsed] = numbers[parsed]
+            cast[isString & lowered.isin(self.unknown_values).to_numpy()] = None
+            result.setValues(entity, cast)
+        return result
     
     def configToString(self) -> str:
         return ""
\ No newline at end of file
@@ -7,7 +7,11 @@ import logging
 from ModelStore import ModelObservation, EntityKey
 from classifiers.RandomForest import RandomForestParams
 from classifiers.KNNClassifier import KNNParams
+from classifiers.OnlineNaiveBayes import OnlineNaiveBayesParams, DEFAULT_ONLINE_NAIVE_BAYES_PARAMS
+from classifiers.ParameterSearch import SEARCH_STRATEGIES, SEARCH_TWO_STAGE
+from classifiers.EvaluationReport import EVALUATION_MODES, EVALUATION_HOLDOUT, DEFAULT_CV_FOLDS
 from utils.helpers import slugify
+from TrainingScheduler import DEFAULT_RETRAIN_DEBOUNCE, DEFAULT_RETRAIN_MIN_INTERVAL
 from postprocessors.PostprocessorFactory import PostprocessorFactory
 from preprocessors.PreprocessorFactory import PreprocessorFactory
 from ModelManager import ModelManager
@@ -100,12 +104,10 @@ def init_model_routes(model_manager: ModelManager):
         if section == "observations":
             page = int(request.args.get("page", 1))
             pageSize = 50
-            allObservations = model_manager.getModel(modelName).getObservations()
-            total = len(allObservations)
+            total = model_manager.getModel(modelName).getObservationCount()
 
             start = (page - 1) * pageSize
-            end = start + pageSize
-            paginated = allObservations[start:end]
+            paginated = model_manager.getModel(modelName).getObservations(pageSize, start)
 
             model.observations = paginated
             model.currentPage = page
@@ -113,14 +115,20 @@ def init_model_routes(model_manager: ModelManager):
             model.totalPages = math.ceil(total / pageSize)
 
         elif section == "settings":
+            runningJob = model_manager.getModel(modelName).getRunningTuningJob()
             logger.info(f"Model settings: {model_manager.getModel(modelName).getModelSettings()}")
             model.params = { 
                 "accuracy": model_manager.getModel(modelName).getAccuracy(),
-                "observationCount": len(model_manager.getModel(modelName).getObservations()),
+                "observationCount": model_manager.getModel(modelName).getObservationCount(),
                 "modelSize": model_manager.getModel(modelName).getModelSize(),
+                "queueStats": model_manager.getModel(modelName).getQueueStats(),
+                "lastCompaction": model_manager.getModel(modelName).getLastCompaction(),
+                "dedupeStats": model_manager.getModel(modelName).getDedupeStats(),
                 "modelParameters": model_manager.getModel(modelName).getModelSettings(),
                 "labelStats": model_manager.getModel(modelName).getLabelStats(),
+                "evaluation": model_manager.getModel(modelName).getEvaluationReport(),
                 "learningType": model_manager.getModel(modelName).getLearningType(),
+                "tuningJob": runningJob.to_dict() if runningJob else None,
             }
         elif section == "postprocessors":
             logger.info(f"{list(map(lambda processor: processor.to_dict(),model_manager.getModel(modelName).getPostprocessors()))}")
@@ -195,6 +203,12 @@ def init_model_routes(model_manager: ModelManager):
             val = request.form.get(name)
             return val if val not in ["None", "", None] else None
 
+        def get_float(name: str, default: float) -> float:
+            try:
+                return float(request.form.get(name, default))
+            except ValueError:
+                return default
+
         try:
             modelType = request.form.get("modelType", "RandomForest")
 
@@ -212,6 +226,7 @@ def init_model_routes(model_manager: ModelManager):
                     "oob_score": get_bool("oobScore"),
                 }
                 settings["model_parameters"]["RandomForest"] = rfParams
+                settings["compact_forest"] = get_bool("compactForest")
 
             elif modelType == "KNN":
                 knnParams: KNNParams = {
@@ -221,9 +236,31 @@ def init_model_routes(model_manager: ModelManager):
                 }
                 settings["model_parameters"]["KNN"] = knnParams
 
+            elif modelType == "OnlineNaiveBayes":
+                nbParams: OnlineNaiveBayesParams = {
+                    "var_smoothing": get_float("varSmoothing", DEFAULT_ONLINE_NAIVE_BAYES_PARAMS["var_smoothing"]),
+                    "alpha": get_float("alpha", DEFAULT_ONLINE_NAIVE_BAYES_PARAMS["alpha"]),
+                }
+                settings["model_parameters"]["OnlineNaiveBayes"] = nbParams
+
             else:
                 return jsonify(success=False, error=f"Unknown model type '{modelType}'"), 400
 
+            settings["retrain_debounce"] = get_float("retrainDebounce", DEFAULT_RETRAIN_DEBOUNCE)
+            settings["retrain_min_interval"] = get_float("retrainMinInterval", DEFAULT_RETRAIN_MIN_INTERVAL)
+            settings["coalesce_window_ms"] = max(0, get_int("coalesceWindowMs", 0))
+            settings["retention_max_rows"] = get_int("retentionMaxRows", 0)
+            settings["retention_max_age_days"] = max(0.0, get_float("retentionMaxAgeDays", 0))
+            settings["retention_max_per_label"] = get_int("retentionMaxPerLabel", 0)
+            settings["retention_dedupe_tolerance"] = max(0.0, get_float("retentionDedupeTolerance", 0))
+            settings["ingest_dedupe_capacity"] = get_int("ingestDedupeCapacity", 0)
+            settings["ingest_dedupe_tolerance"] = max(0.0, get_float("ingestDedupeTolerance", 0))
+            searchStrategy = request.form.get("searchStrategy", SEARCH_TWO_STAGE)
+            settings["search_strategy"] = searchStrategy if searchStrategy in SEARCH_STRATEGIES else SEARCH_TWO_STAGE
+            evaluationMode = request.form.get("evaluationMode", EVALUATION_HOLDOUT)
+            settings["evaluation_mode"] = evaluationMode if evaluationMode in EVALUATION_MODES else EVALUATION_HOLDOUT
+            settings["cv_folds"] = max(2, get_int("cvFolds", DEFAULT_CV_FOLDS))
+
             model_manager.getModel(modelName).setModelSettings(settings)
             return jsonify(success=True)
 
@@ -231,9 +268,26 @@ def init_model_routes(model_manager: ModelManager):
             return jsonify(success=False, error=str(e)), 400
 
     @model_bp.route("/edit-model/<string:modelName>/settings/autotune", methods=["POST"])
-    def autoTuneModel(modelName: str) -> str:
-        model_manager.getModel(modelName).optimizeParameters()
-        return json.dumps({"success": True})
+    def autoTuneModel(modelName: str) -> Response:
+        try:
+            job = model_manager.getModel(modelName).optimizeParameters()
+            return jsonify(success=True, job=job.to_dict())
+        except Exception as e:
+            logger.exception(f"Error starting auto-tune for model '{modelName}': {e}")
+            return jsonify(success=False, error=str(e)), 500
+
+    @model_bp.route("/edit-model/<string:modelName>/settings/autotune/<string:jobId>")
+    def autoTuneStatus(modelName: str, jobId: str) -> Response:
+        job = model_manager.getModel(modelName).getTuningJob(jobId)
+        if job is None:
+            return jsonify(success=False, error="Tuning job not found"), 404
+        return jsonify(success=True, job=job.to_dict())
+
+    @model_bp.route("/edit-model/<string:modelName>/settings/autotune/<string:jobId>/cancel", methods=["POST"])
+    def cancelAutoTune(modelName: str, jobId: str) -> Response:
+        if not model_manager.getModel(modelName).cancelTuningJob(jobId):
+            return jsonify(success=False, error="Tuning job is not running"), 404
+        return jsonify(success=True)
 
     @model_bp.route("/api/model/<string:modelName>/observation/<float:observationTime>/delete", methods=["POST"])
     def apiDeleteObservation(modelName: str, observationTime: float) -> str:
@@ -272,7 +326,7 @@ def init_model_routes(model_manager: ModelManager):
             return jsonify({"error": str(e)}), 500
     @model_bp.route("/edit-model/<string:modelName>/model-settings/<string:modelType>")
     def getModelSettingsTemplate(modelName: str, modelType: str) -> str:
-        if modelType not in ["RandomForest", "KNN"]:
+        if modelType not in ["RandomForest", "KNN", "OnlineNaiveBayes"]:
             abort(404)
         model = ViewModel(modelName)
         settings = model_manager.getModel(modelName).getModelSettings()
@@ -288,6 +342,9 @@ def init_model_routes(model_manager: ModelManager):
                     "weights": "uniform",
                     "metric": "minkowski"
                 }
+        elif modelType == "OnlineNaiveBayes":
+            if "OnlineNaiveBayes" not in settings["model_parameters"]:
+                settings["model_parameters"]["OnlineNaiveBayes"] = dict(DEFAULT_ONLINE_NAIVE_BAYES_PARAMS)
         
         model.params = {
             "modelParameters": {
@@ -1,3 +1,26 @@
+import json
+from typing import Any, Dict, List
+
+
 def slugify(name: str) -> str:
     """Convert a string to a URL-friendly slug."""
-    return ''.join(c if c.isalnum() else '-' for c in name.lower()).strip('-') 
\ No newline at end of file
+    return ''.join(c if c.isalnum() else '-' for c in name.lower()).strip('-') 
+
+
+DISABLED_LABEL = "Disabled"
+
+
+def isTrainingMessage(entities: List[Dict[str, Any]]) -> bool:
+    """True if a /set message carries a label to learn from."""
+    return any(isinstance(entity, dict) and entity.get("label", DISABLED_LABEL) != DISABLED_LABEL for entity in entities)
+
+
+def isTrainingPayload(payload: str) -> bool:
+    """isTrainingMessage() for a raw MQTT payload. Payloads that are not a JSON list are not."""
+    if '"label"' not in payload:
+        return False
+    try:
+        entities = json.loads(payload)
+    except ValueError:
+        return False
+    return isinstance(entities, list) and isTrainingMessage(entities)